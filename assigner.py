@@ -1,26 +1,46 @@
 import random
-from typing import Dict, List, Optional
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-import pickle
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple, TYPE_CHECKING
 from pathlib import Path
-from random import shuffle, seed, choice
 from datetime import datetime
-from general_tools.my_email import email as send_email
 import sys
+import time
 import yaml
 import argparse
-from utils.assignment_algorithms import best_algorithm, validate_assignments
-from tqdm import tqdm
-from load_from_gsheets import load_gift_preferences, load_family_addresses, create_service
+from utils.assignment_algorithms import Participants, get_algorithm, validate_assignments
+from utils.constraints import (ConstrainedSampler, build_exclusion_graph, check_feasibility, has_exclusion_graph,
+                               sample_constrained_derangement, validate_constrained_assignments)
+from utils.profiling import profiler
+from utils.repair import RepairImpossibleError, RepairResult, repair_assignments
+from utils.planner import SchedulePlan, plan_schedule
+
+if TYPE_CHECKING:
+    from utils.mailer import DeliveryResult, Mailer, OutgoingMessage
+    from utils.ledger import AssignmentLedger, LedgerEntry
+
+# The sheet loader, the mailer, the ledger, the Google client libraries and NumPy are
+# imported on first use, and SMTP connections are only opened when mail is actually sent,
+# so algorithm-only and test-mode runs start instantly.
+
+SUBJECT = "Christmas Gift Exchange Assignment"
+# Default --montecarlo-test trials. The constrained sampler is a per-call Python loop (about
+# 4 n log n chain steps per draw), so it gets fewer; pass --workers to shard more over processes.
+MONTECARLO_TRIALS = 10_000_000
+CONSTRAINED_MONTECARLO_TRIALS = 50_000
+REMINDER_PREFIX = "REMINDER: "
 
 class FamilyGiftExchange:
-    def __init__(self, config_path: str, test_mode: bool = False):        
+    def __init__(self, config_path: str, test_mode: bool = False, offline: bool = False,
+                 algorithm: Optional[str] = None, test_delivery: str = 'sink', spool_path: Optional[str] = None,
+                 gsheets_service=None, mailer: Optional["Mailer"] = None, quiet: bool = False):        
+        self.config_path = config_path
         self.family_addresses: Dict[str, str] = {}
         self.email_to_family: Dict[str, str] = {}
+        self.family_emails: Dict[str, List[str]] = {}
+        self.sheet_family_ids: Set[str] = set()
         self.test_mode = test_mode
+        # Where test-mode mail goes: a local SMTP sink, an mbox/.eml spool, or 'print' to stdout
+        self.test_delivery = test_delivery
+        self.spool_path = spool_path
         self.gift_preferences: Dict[str, List[str]] = {}
         
         # Load config from specified path
@@ -33,66 +53,47 @@ class FamilyGiftExchange:
         
         self.family_names = self.config['family_names']
         self.family_ids: List[str] = set(self.family_names.keys())
-        self.gsheets_service = create_service()
+        self.offline = offline
+        # Only the per-message delivery summary is silenced; batch runs print their own table
+        self.quiet = quiet
+        # --algorithm, else the config's `algorithm:`, else best_algorithm
+        self.algorithm = get_algorithm(algorithm or self.config.get('algorithm'))
+        # A service and mailer passed in are shared with other exchanges (see batch_assigner.py),
+        # so this one never closes the mailer
+        self._gsheets_service = gsheets_service
+        self._mailer = mailer
+        self._owns_mailer = mailer is None
+        self._ledger = None
+
+    @property
+    def gsheets_service(self):
+        """Sheets service, created on first use
+
+        Reads go through the snapshot cache, so the real Sheets client (and its OAuth token)
+        is only built on a cache miss.
+        """
+        if self._gsheets_service is None:
+            from load_from_gsheets import open_service
+            self._gsheets_service = open_service(self.config, offline=self.offline, test_mode=self.test_mode)
+        return self._gsheets_service
 
     def load_data(self) -> None:
-        result = load_family_addresses(self.gsheets_service, self.config)
-        headers = result['values'][0]
-        rows = result['values'][1:]
-        col_idx = {name: idx for idx, name in enumerate(headers)}
-        
-        #self.family_ids = self._get_family_ids(rows, col_idx)
-        self.family_addresses = self._get_family_addresses(rows, col_idx)
-        self.email_to_family = self._get_email_mapping(rows, col_idx)
-        
-        # Load gift preferences
-        self.gift_preferences = load_gift_preferences(self.gsheets_service, self.config)
-    
-    def _get_family_ids(self, rows: List[List[str]], col_idx: Dict[str, int]) -> List[str]:
-        """Extract list of valid family IDs"""
-        family_ids = set()
-        for row in rows:
-            if len(row) < len(col_idx):
-                continue
-            
-            family_id = row[col_idx['Family ID']]
-            exclude = row[col_idx.get('Exclude from Calendar', -1)].lower() == 'yes'
-            
-            if family_id and not exclude:
-                family_ids.add(family_id)
+        # Both sheets are fetched concurrently (one batchGet if they share a spreadsheet) and
+        # each is parsed as soon as it arrives
+        from load_from_gsheets import load_sheets
+        with profiler.stage('load_data'):
+            loaded = load_sheets(self.gsheets_service, self.config, offline=self.offline)
         
-        return list(family_ids)
-    
-    def _get_family_addresses(self, rows: List[List[str]], col_idx: Dict[str, int]) -> Dict[str, str]:
-        """Create mapping of family ID to address"""
-        addresses = {}
-        for row in rows:
-            if len(row) < len(col_idx):
-                continue
-            
-            family_id = row[col_idx['Family ID']]
-            if not family_id or family_id in addresses:
-                continue
-            
-            address = f"{row[col_idx['Address']]}\n{row[col_idx['City State Zip']]}"
-            addresses[family_id] = address
-        
-        return addresses
-    
-    def _get_email_mapping(self, rows: List[List[str]], col_idx: Dict[str, int]) -> Dict[str, str]:
-        """Create mapping of email to family ID"""
-        email_mapping = {}
-        for row in rows:
-            if len(row) < len(col_idx):
-                continue
-            
-            family_id = row[col_idx['Family ID']]
-            email = row[col_idx['Primary Email']]
-            
-            if family_id and email:
-                email_mapping[email] = family_id
+        # One pass over the sheet builds every index (family -> emails/address, email -> family)
+        roster = loaded['family']
+        profiler.count('load_data.rows', len(roster.records))
+        self.family_addresses = roster.family_addresses
+        self.email_to_family = roster.email_to_family
+        self.family_emails = roster.family_emails
+        # Families not marked "Exclude from Calendar"; assignments still use the config's family_names
+        self.sheet_family_ids = roster.family_ids
         
-        return email_mapping
+        self.gift_preferences = loaded.get('gift_preferences', {})
     
     def make_assignments(self, 
                          exclude: Optional[List[str]] = None, 
@@ -105,51 +106,216 @@ class FamilyGiftExchange:
             seed_value: Optional seed value for random assignments (defaults to current year)
         """
         
+        # Sorted once; the algorithms work on indices into it and IDs are mapped back only here
+        self.participants = self._participants(exclude)
+        family_ids = self.participants.ids
+        
+        with profiler.stage('assign'):
+            if has_exclusion_graph(self.config):
+                if self.algorithm.target != 'derangement':
+                    raise ValueError(f"Algorithm {self.algorithm.__name__} can't be combined with an exclusion "
+                                     f"graph; the constrained sampler only draws plain derangements")
+                # Raises InfeasibleConstraintsError before any sampling if the graph can't be satisfied
+                forbidden = build_exclusion_graph(self.config, family_ids)
+                check_feasibility(self.participants, forbidden)
+                self.assignments = sample_constrained_derangement(self.participants, forbidden, seed_value)
+                assert validate_constrained_assignments(family_ids, self.assignments, forbidden)
+                self.receivers = self.participants.to_receivers(self.assignments)
+            else:
+                # receivers[i] is the index of participant i's receiver
+                self.receivers = self.algorithm.indices(len(self.participants), seed_value)
+                self.assignments = self.participants.to_dict(self.receivers)
+        assert validate_assignments(family_ids, self.assignments)
+        self.print_assignments(verbose)
+    
+    def _participants(self, exclude: Optional[List[str]]) -> Participants:
         # Use config exclusions if none provided
         if exclude is None:
             exclude = self.config.get('exclusions', [])
-        
-        family_ids = sorted([fid for fid in self.family_ids if not exclude or fid not in exclude])
-        
-        self.assignments = best_algorithm(family_ids, seed_value)
+        return Participants(fid for fid in self.family_ids if not exclude or fid not in exclude)
+
+    def repair_assignments(self,
+                           previous: Dict[str, str],
+                           exclude: Optional[List[str]] = None,
+                           seed_value: Optional[int] = 0) -> RepairResult:
+        """Carry `previous` over to the current family list, changing only the pairs that must change
+
+        Falls back to a fresh make_assignments (every giver changed) when the joiners can't be
+        spliced in under the exclusion graph.
+        """
+        self.participants = self._participants(exclude)
+        family_ids = self.participants.ids
+        forbidden = build_exclusion_graph(self.config, family_ids) if has_exclusion_graph(self.config) else None
+        with profiler.stage('repair'):
+            try:
+                result = repair_assignments(previous, family_ids, forbidden, seed_value,
+                                            allow_two_cycles=self.algorithm.target != 'no_two_cycles')
+            except RepairImpossibleError as e:
+                print(f"Can't repair incrementally ({e}); making new assignments for everyone")
+                self.make_assignments(exclude, seed_value)
+                joined = sorted(set(family_ids) - set(previous))
+                left = sorted(set(previous) - set(family_ids))
+                return RepairResult(self.assignments, list(family_ids), joined, left)
+        self.assignments = result.assignments
+        self.receivers = self.participants.to_receivers(self.assignments)
         assert validate_assignments(family_ids, self.assignments)
+        if forbidden is not None:
+            assert validate_constrained_assignments(family_ids, self.assignments, forbidden)
+        return result
+
+    def plan_years(self,
+                   first_year: int,
+                   count: int,
+                   master_seed: Optional[int] = None,
+                   exclude: Optional[List[str]] = None) -> Tuple[int, SchedulePlan]:
+        """Plan `count` years from `first_year` in one pass and store the plan in the ledger
+
+        Pairs from years already recorded before `first_year` are steered away from too.
+        The master seed defaults to `first_year`. Returns (plan_id, plan).
+        """
+        self.participants = self._participants(exclude)
+        forbidden = None
+        if has_exclusion_graph(self.config):
+            forbidden = build_exclusion_graph(self.config, self.participants.ids)
+            check_feasibility(self.participants, forbidden)
+        history = {year: assignments for year, assignments
+                   in self.ledger.assignments_by_year(self.ledger_key, test=self.test_mode).items()
+                   if year < first_year}
+        master_seed = first_year if master_seed is None else master_seed
+        with profiler.stage('plan'):
+            plan = plan_schedule(self.participants, range(first_year, first_year + count), master_seed,
+                                 forbidden, history, self.algorithm)
+        plan_id = self.ledger.record_plan(self.ledger_key, plan.assignments, master_seed, test=self.test_mode)
+        return plan_id, plan
+
+    def assign_from_plan(self, year: int, exclude: Optional[List[str]] = None, verbose: bool = False) -> bool:
+        """Take this year's assignments from the latest stored plan; False if no plan covers the year
+
+        Families that joined or left since planning (or pairs the exclusion graph now forbids)
+        are handled like --repair, so the rest of the planned pairs are kept.
+        """
+        planned = self.ledger.planned(self.ledger_key, year, test=self.test_mode)
+        if planned is None:
+            return False
+        plan_id, assignments = planned
+        result = self.repair_assignments(assignments, exclude, seed_value=year)
+        if not self.quiet:
+            print(f"\nUsing the {year} assignments from plan {plan_id}"
+                  + (f" ({len(result.changed)} pairs adjusted for membership changes)" if result.changed else ""))
         self.print_assignments(verbose)
-    
+        return True
+
     def print_assignments(self, verbose: bool = False) -> None:
         if verbose and self.test_mode:
             print("\nAssignments:")
             sorted_assignments = sorted(self.assignments.items(), key=lambda x: self.family_names[x[0]])
             for giver, receiver in sorted_assignments:
                 print(f"{self.family_names[giver]} -> {self.family_names[receiver]}")
-        else:
+        elif not self.quiet:
             print(f"\nCreated assignments for {len(self.assignments)} families")
 
-    def send_assignment_emails(self, is_reminder: bool = False, year: int = None) -> None:
-        """Send emails to all families with their assignments"""
-        for giver_id, receiver_id in self.assignments.items():
-            subject = "Christmas Gift Exchange Assignment"
-            if is_reminder:
-                subject = "REMINDER: " + subject
-            if self.test_mode:
-                subject = "[TEST] " + subject
-            
-            message = self._compose_message(giver_id, receiver_id, is_reminder, year)
-            
-            giver_emails = [email for email, fid in self.email_to_family.items() 
-                           if fid == giver_id]
+    @property
+    def mailer(self) -> "Mailer":
+        """SMTP delivery pool, created on first use from the `email` config section"""
+        if self._mailer is None:
+            from utils.mailer import Mailer
+            self._mailer = Mailer.from_config(self.config)
+        return self._mailer
+
+    @property
+    def ledger(self) -> "AssignmentLedger":
+        """Local record of past runs, opened on first use from the `ledger` config section"""
+        if self._ledger is None:
+            from utils.ledger import AssignmentLedger
+            self._ledger = AssignmentLedger.from_config(self.config)
+        return self._ledger
+
+    @property
+    def ledger_key(self) -> str:
+        from utils.ledger import AssignmentLedger
+        return AssignmentLedger.config_key(self.config, self.config_path)
+
+    def ledger_entry(self, year: int) -> Optional["LedgerEntry"]:
+        """What was recorded for this config and year, if anything"""
+        with profiler.stage('ledger.lookup'):
+            return self.ledger.latest(self.ledger_key, year, test=self.test_mode)
+
+    def record_run(self, year: int, seed_value: Optional[int], messages: List[Tuple[str, "OutgoingMessage"]]) -> int:
+        with profiler.stage('ledger.record'):
+            return self.ledger.record(self.ledger_key, year, self.assignments, messages, seed=seed_value,
+                                      test=self.test_mode)
+
+    def compose_messages(self, year: int, givers: Optional[List[str]] = None) -> List[Tuple[str, "OutgoingMessage"]]:
+        """(giver, message) for every recipient, as first sent: no reminder or test prefixes
+
+        Only the given `givers` are composed if a list is passed.
+        """
+        from utils.mailer import OutgoingMessage
+        messages = []
+        for giver_id in (self.assignments if givers is None else givers):
+            receiver_id = self.assignments[giver_id]
+            message = self._compose_message(giver_id, receiver_id, False, year)
             
-            for email in tqdm(giver_emails):
-                if self.test_mode:
-                    print(f"Would send email to: {email}")
-                    print(f"Subject: {subject}")
-                    print(f"Message:\n{message}\n")
-                else:
-                    send_email(
-                        email,
-                        None,
-                        subj=subject,
-                        msg_text=message
-                    )
+            for email in self.family_emails.get(giver_id, []):
+                messages.append((giver_id, OutgoingMessage(email, SUBJECT, message)))
+        return messages
+
+    def send_assignment_emails(self, is_reminder: bool = False, year: int = None) -> List["DeliveryResult"]:
+        """Send emails to all families with their assignments"""
+        return self.send_messages([message for _, message in self.compose_messages(year)], is_reminder)
+
+    def send_messages(self, messages: List["OutgoingMessage"], is_reminder: bool = False) -> List["DeliveryResult"]:
+        """Send messages as composed by compose_messages (or read back from the ledger)"""
+        from utils.mailer import OutgoingMessage
+        if is_reminder:
+            # Same text _compose_message renders for a reminder
+            messages = [OutgoingMessage(m.to, REMINDER_PREFIX + m.subject, REMINDER_PREFIX + m.body) for m in messages]
+        if self.test_mode:
+            messages = [OutgoingMessage(m.to, "[TEST] " + m.subject, m.body) for m in messages]
+        
+        if self.test_mode:
+            if self.test_delivery == 'print':
+                for message in messages:
+                    print(f"Would send email to: {message.to}")
+                    print(f"Subject: {message.subject}")
+                    print(f"Message:\n{message.body}\n")
+                return []
+            if self._mailer is None:
+                return self._send_test_messages(messages)
+        
+        with profiler.stage('email.send_all'):
+            results = self.mailer.send_all(messages)
+        if self._owns_mailer:
+            self.mailer.close()
+        self._print_delivery(results)
+        return results
+
+    def _send_test_messages(self, messages: List["OutgoingMessage"]) -> List["DeliveryResult"]:
+        """Run test-mode mail through the real delivery code, into a local sink or spool"""
+        from utils.mailer import test_mailer
+        workers = (self.config.get('email') or {}).get('connections', 4)
+        with test_mailer(self.test_delivery, self.spool_path, workers=workers) as mailer:
+            start = time.perf_counter()
+            with profiler.stage('email.send_all'):
+                results = mailer.send_all(messages)
+            elapsed = time.perf_counter() - start
+            if mailer.sink is not None:
+                destination = f"local SMTP sink {mailer.sink.host}:{mailer.sink.port}"
+            else:
+                destination = f"{self.test_delivery} spool {mailer.pool.path}"
+        if not self.quiet:
+            print(f"\n[TEST] Delivered to {destination} in {elapsed:.3f}s "
+                  f"({len(results) / elapsed if elapsed else 0:.0f} messages/s)")
+        self._print_delivery(results)
+        return results
+
+    def _print_delivery(self, results: List["DeliveryResult"]) -> None:
+        if self.quiet:
+            return
+        failures = [result for result in results if not result.ok]
+        print(f"\nSent {len(results) - len(failures)}/{len(results)} emails")
+        for result in failures:
+            print(f"  FAILED {result.recipient} after {result.attempts} attempts: {result.error}")
 
     def _compose_message(self, giver_id: str, receiver_id: str, is_reminder: bool, year: int) -> str:
         """Create email message text"""
@@ -184,6 +350,8 @@ Their address is:
         return message.strip()
 
 def main():
+    # Only the delivery names; smtplib and mailbox stay unloaded until mail is sent
+    from utils.mailer import TEST_DELIVERIES
     parser = argparse.ArgumentParser(description='Family Gift Exchange Assignment System')
     parser.add_argument('--config', type=str, default='./config.yaml',
                       help='Path to config file (default: ./config.yaml)')
@@ -191,64 +359,239 @@ def main():
                       help='Run in test mode')
     parser.add_argument('--reminder', action='store_true',
                       help='Send reminder emails instead of initial assignments')
+    parser.add_argument('--resend', action='store_true',
+                      help="Re-send this year's assignment emails exactly as recorded in the ledger")
+    parser.add_argument('--repair', action='store_true',
+                      help="Update this year's recorded assignments for families that joined or left, "
+                           "emailing only the givers whose pair changed")
+    parser.add_argument('--algorithm', type=str,
+                      help="Assignment algorithm by name, overriding the config's `algorithm:` "
+                           "(e.g. single_cycle, no_reciprocal; default: early_refusal_derangement)")
+    parser.add_argument('--plan', type=int, metavar='YEARS',
+                      help='Plan this many years from --year (or this year) in one pass, minimising repeated '
+                           'pairs, and store the plan in the ledger; later runs use their year of it')
+    parser.add_argument('--plan-seed', type=int,
+                      help='Master seed for --plan (default: the first planned year)')
     parser.add_argument('--montecarlo-test', action='store_true',
                       help='Run tests on assignment distribution')
+    parser.add_argument('--trials', type=int,
+                      help='Number of assignments drawn by --montecarlo-test (default: 10,000,000, or '
+                           '50,000 with an exclusion graph)')
+    parser.add_argument('--workers', type=int, default=1,
+                      help='Processes used by --montecarlo-test (default: 1)')
+    parser.add_argument('--test-delivery', choices=TEST_DELIVERIES + ('print',), default='sink',
+                      help='Where --test mail goes: a local SMTP sink (default), an mbox file, '
+                           'a directory of .eml files, or printed to stdout')
+    parser.add_argument('--spool', type=str,
+                      help='Spool path for --test-delivery mbox/eml (default: ./spool/test.mbox or ./spool/eml)')
+    parser.add_argument('--offline', action='store_true',
+                      help='Read spreadsheet data only from the local snapshot cache')
+    parser.add_argument('--checkpoint', type=str,
+                      help='Checkpoint file for --montecarlo-test; an interrupted run resumes from it')
     parser.add_argument('--year', type=int,
                       help='Manually override the year used for random seed')
+    parser.add_argument('--profile', type=str, metavar='REPORT_JSON',
+                      help='Time each pipeline stage and count algorithm restarts, writing a JSON report here')
+    parser.add_argument('--cprofile', type=str, metavar='STATS_FILE',
+                      help='Also dump cProfile stats for the whole run (view with python -m pstats)')
     args = parser.parse_args()
 
-    exchange = FamilyGiftExchange(config_path=args.config, test_mode=args.test)
-    exchange.load_data()
+    if args.profile:
+        profiler.enable()
+    cprofile = None
+    if args.cprofile:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    try:
+        run(args)
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(args.cprofile)
+            print(f"\ncProfile stats written to {args.cprofile}")
+        if args.profile:
+            profiler.write_json(args.profile)
+            print(f"\n{profiler.summary()}\nProfile report written to {args.profile}")
 
+def run(args: argparse.Namespace) -> None:
     if args.montecarlo_test:
-        montecarlo_test()
+        # Only needs the family list from the config, so no sheet data is loaded
+        montecarlo_test(total_runs=args.trials, workers=args.workers, checkpoint_path=args.checkpoint,
+                        config_path=args.config, algorithm=args.algorithm)
         return
 
+    exchange = FamilyGiftExchange(config_path=args.config, test_mode=args.test, offline=args.offline,
+                                  algorithm=args.algorithm, test_delivery=args.test_delivery,
+                                  spool_path=args.spool)
+    run_exchange(exchange, seed_year_for(args), args)
+
+def seed_year_for(args: argparse.Namespace) -> int:
     # Use manually specified year if provided, otherwise use current year
     if args.year:
-        seed_year = args.year
-    else:
-        seed_year = datetime.now().year
-        if args.test:
-            seed_year -= random.randint(0, 58)
+        return args.year
+    seed_year = datetime.now().year
+    if args.test:
+        seed_year -= random.randint(0, 58)
+    return seed_year
 
-    print("\nFamily Addresses:")
-    for family_id, address in exchange.family_addresses.items():
-        print(f"{family_id}: {address}")
-        
-    print("\nEmail to Family ID Mapping:")
-    for email, family_id in exchange.email_to_family.items():
-        print(f"{email}: {family_id}")
-    
-    exchange.make_assignments(exclude='0JMA', seed_value=seed_year, verbose=True)
-    exchange.send_assignment_emails(is_reminder=args.reminder, year=seed_year)
-    exchange.print_assignments(verbose=True)
+class RunOutcome(NamedTuple):
+    action: str                     # 'plan', 'ledger', 'repair' or 'assign'
+    results: List["DeliveryResult"]
 
-def montecarlo_test():
-    exchange = FamilyGiftExchange(config_path='./configs/config.example.yaml', test_mode=True)
-    
-    # Initialize tracking dictionary for all possible pairings
-    pairing_counts = {}
-    for giver in exchange.family_ids:
-        pairing_counts[giver] = {receiver: 0 for receiver in exchange.family_ids if receiver != giver}
-    
-    total_runs = 10000
-    for seed_value in range(total_runs):
-        exchange.make_assignments(seed_value=seed_value)
-        # Count each pairing
-        for giver, receiver in exchange.assignments.items():
-            pairing_counts[giver][receiver] += 1
+def run_exchange(exchange: FamilyGiftExchange, seed_year: int, args: argparse.Namespace,
+                 verbose: bool = True) -> RunOutcome:
+    """Everything after parsing arguments for one exchange: plan, serve from the ledger, repair or assign and send"""
+    if args.plan:
+        plan_id, plan = exchange.plan_years(seed_year, args.plan, args.plan_seed, exclude='0JMA')
+        if verbose:
+            print_plan(exchange, plan_id, plan)
+        return RunOutcome('plan', [])
+
+    if args.reminder or args.resend:
+        # Served from the ledger: no OAuth, no sheet reads and the exact pairs and text first sent
+        entry = exchange.ledger_entry(seed_year)
+        if entry is not None:
+            if verbose:
+                print(f"Using assignments recorded for {seed_year} on {entry.created} (ledger run {entry.run_id})")
+            exchange.assignments = entry.assignments
+            results = exchange.send_messages([message for _, message in entry.messages], is_reminder=args.reminder)
+            if verbose:
+                exchange.print_assignments(verbose=True)
+            return RunOutcome('ledger', results)
+        if verbose:
+            print(f"No ledger entry for {seed_year}; recomputing assignments from the sheet")
+
+    if args.repair:
+        return RunOutcome('repair', repair(exchange, seed_year, verbose))
+
+    exchange.load_data()
+
+    if verbose:
+        print("\nFamily Addresses:")
+        for family_id, address in exchange.family_addresses.items():
+            print(f"{family_id}: {address}")
+            
+        print("\nEmail to Family ID Mapping:")
+        for email, family_id in exchange.email_to_family.items():
+            print(f"{email}: {family_id}")
     
+    if not exchange.assign_from_plan(seed_year, exclude='0JMA', verbose=verbose):
+        exchange.make_assignments(exclude='0JMA', seed_value=seed_year, verbose=verbose)
+    messages = exchange.compose_messages(seed_year)
+    # Recorded before sending, so an interrupted send can be finished with --resend
+    exchange.record_run(seed_year, seed_year, messages)
+    results = exchange.send_messages([message for _, message in messages], is_reminder=args.reminder)
+    if verbose:
+        exchange.print_assignments(verbose=True)
+    return RunOutcome('assign', results)
+
+def print_plan(exchange: FamilyGiftExchange, plan_id: int, plan: SchedulePlan) -> None:
+    years = sorted(plan.assignments)
+    print(f"\nPlanned {years[0]}-{years[-1]} for {len(exchange.participants)} families "
+          f"(plan {plan_id}, master seed {plan.master_seed})")
+    closest = f", closest {plan.min_gap} years apart" if plan.min_gap is not None else ""
+    print(f"Repeated pairs: {plan.repeats}{closest}; repeat cost {plan.cost:.2f} "
+          f"(independent draws: {plan.initial_cost:.2f})")
+    if exchange.test_mode:
+        for giver in sorted(exchange.participants.ids, key=lambda fid: exchange.family_names[fid]):
+            receivers = ", ".join(f"{year}: {exchange.family_names[plan.assignments[year][giver]]}" for year in years)
+            print(f"{exchange.family_names[giver]} -> {receivers}")
+
+def repair(exchange: FamilyGiftExchange, year: int, verbose: bool = True) -> List["DeliveryResult"]:
+    """Carry the ledger's assignments for `year` over to the current family list and email only the changes"""
+    entry = exchange.ledger_entry(year)
+    if entry is None:
+        print(f"No ledger entry for {year}; run without --repair to make assignments")
+        return []
+    exchange.load_data()
+    result = exchange.repair_assignments(entry.assignments, exclude='0JMA', seed_value=year)
+    if verbose:
+        print(f"Joined: {result.joined or 'none'}; left: {result.left or 'none'}; "
+              f"{len(result.changed)} of {len(result.assignments)} givers get a new assignment")
+
+    changed = set(result.changed)
+    kept = [(giver, message) for giver, message in entry.messages
+            if giver in exchange.assignments and giver not in changed]
+    messages = exchange.compose_messages(year, givers=result.changed)
+    # The new run keeps the exact text already sent to unchanged givers, so reminders stay consistent
+    exchange.record_run(year, year, kept + messages)
+    results = exchange.send_messages([message for _, message in messages])
+    if verbose:
+        exchange.print_assignments(verbose=True)
+    return results
+
+def montecarlo_test(total_runs: Optional[int] = None, seed_value: Optional[int] = 0, workers: int = 1,
+                    checkpoint_path: Optional[str] = None, config_path: str = './configs/config.example.yaml',
+                    algorithm: Optional[str] = None):
+    """Pairing statistics for the assignments this config actually produces
+
+    Samples the configured algorithm, or the constrained sampler when the config has an
+    exclusion graph, and checks that no forbidden pair is ever drawn. Either one runs on the
+    process-pool shards and checkpoints. `total_runs` defaults to MONTECARLO_TRIALS, or
+    CONSTRAINED_MONTECARLO_TRIALS for the constrained sampler, which runs per call in Python.
+    """
+    exchange = FamilyGiftExchange(config_path=config_path, test_mode=True, algorithm=algorithm)
+    participants = exchange._participants(None)
+    family_ids = participants.ids
+    n = len(family_ids)
+    algo = exchange.algorithm
+
+    from utils.batch_sampler import batch_pairing_counts, make_generator, max_deviation
+    from utils.parallel import parallel_pairing_counts
+    from utils.accumulator import run_study
+
+    forbidden = build_exclusion_graph(exchange.config, family_ids) if has_exclusion_graph(exchange.config) else None
+    if forbidden is not None:
+        if algo.target != 'derangement':
+            raise ValueError(f"Algorithm {algo.__name__} can't be combined with an exclusion graph")
+        check_feasibility(participants, forbidden)
+        # Shaped like a per-call algorithm, so it takes the same shard and checkpoint paths below
+        algo = ConstrainedSampler(participants, forbidden)
+    if total_runs is None:
+        total_runs = MONTECARLO_TRIALS if forbidden is None else CONSTRAINED_MONTECARLO_TRIALS
+
+    with profiler.stage('montecarlo.sample'):
+        if workers > 1:
+            # Shard counts are checkpointed as they finish, so a rerun resumes from the last one
+            pairing_counts = parallel_pairing_counts(algo, n, total_runs, master_seed=seed_value or 0, workers=workers,
+                                                     checkpoint_path=checkpoint_path)
+        elif checkpoint_path:
+            # Resumable: counts and RNG state are checkpointed, and a rerun picks up where it stopped
+            pairing_counts = run_study(algo, n, total_runs, checkpoint_path, checkpoint_every=1_000_000,
+                                       seed_value=seed_value or 0, chunk_size=100_000).to_dense()
+        elif hasattr(algo, 'batch'):
+            # Draw all assignments in vectorized blocks and count pairings in a giver x receiver matrix
+            pairing_counts = batch_pairing_counts(algo.batch, n, total_runs, make_generator(seed_value))
+        else:
+            pairing_counts = run_study(algo, n, total_runs, seed_value=seed_value or 0).to_dense()
+
+    forbidden_idx = {(participants.index[giver], participants.index[receiver])
+                     for giver, receivers in (forbidden or {}).items() for receiver in receivers if receiver != giver}
+
     # Print results
-    print(f"\nPairing Statistics (over {total_runs} runs):")
+    sampler = 'constrained sampler' if forbidden is not None else algo.__name__
+    print(f"\nPairing Statistics (over {total_runs} runs, {sampler}):")
     print("\nGiver -> Receiver: Count (Percentage)")
     print("-" * 40)
-    for giver in exchange.family_ids:
+    for i, giver in enumerate(family_ids):
         print(f"\n{exchange.family_names[giver]} gives to:")
-        for receiver, count in pairing_counts[giver].items():
+        for j, receiver in enumerate(family_ids):
+            if i == j:
+                continue
+            count = pairing_counts[i, j]
             percentage = (count / total_runs) * 100
-            print(f"  {exchange.family_names[receiver]}: {count} ({percentage:.1f}%)")
+            note = " (forbidden)" if (i, j) in forbidden_idx else ""
+            print(f"  {exchange.family_names[receiver]}: {count} ({percentage:.1f}%){note}")
 
+    if forbidden is not None:
+        drawn = sum(int(pairing_counts[i, j]) for i, j in forbidden_idx)
+        print(f"\nForbidden pairs drawn: {drawn} (of {len(forbidden_idx)} forbidden cells)")
+        if drawn:
+            raise AssertionError(f"The constrained sampler drew forbidden pairs {drawn} times")
+        # Allowed pairs aren't equally likely under an exclusion graph, so there is no 1/(n-1) to compare to
+    else:
+        print(f"\nMax deviation from uniform: {max_deviation(pairing_counts, total_runs):.3f}%")
 
 if __name__ == "__main__":
     main()
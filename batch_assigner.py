@@ -0,0 +1,128 @@
+"""Run several gift exchanges (one config each) in one process
+
+    python batch_assigner.py configs/branch-*.yaml configs/office.yaml --test
+
+Every group reads its sheets through one shared Sheets service: one OAuth flow, a small pool
+of clients, and each distinct (spreadsheet, range) fetched once however many configs use it.
+Mail goes through one Mailer per distinct `email` section (in --test mode, one local sink or
+spool), so connections and logins are shared as well. Groups run in parallel and a summary
+line is printed per group, so a dozen exchanges take about as long as the slowest one.
+"""
+import argparse
+import json
+import sys
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import yaml
+from assigner import FamilyGiftExchange, run_exchange, seed_year_for
+from load_from_gsheets import SharedReads, open_service
+from utils.mailer import TEST_DELIVERIES, Mailer, test_mailer
+from utils.profiling import profiler
+
+def load_config(config_path: str) -> dict:
+    with Path(config_path).open('r') as f:
+        return yaml.safe_load(f)
+
+def shared_mailers(configs: Dict[str, dict], args: argparse.Namespace, stack: ExitStack) -> Dict[str, Mailer]:
+    """Config path -> Mailer, one per distinct `email` section (one overall in test mode)"""
+    if args.test:
+        if args.test_delivery == 'print':
+            return {}
+        connections = max((config.get('email') or {}).get('connections', 4) for config in configs.values())
+        mailer = stack.enter_context(test_mailer(args.test_delivery, args.spool, workers=connections))
+        return {config_path: mailer for config_path in configs}
+
+    mailers: Dict[str, Mailer] = {}
+    by_section: Dict[str, Mailer] = {}
+    for config_path, config in configs.items():
+        key = json.dumps(config.get('email') or {}, sort_keys=True)
+        if key not in by_section:
+            by_section[key] = stack.enter_context(Mailer.from_config(config))
+        mailers[config_path] = by_section[key]
+    return mailers
+
+def run_group(config_path: str, config: dict, seed_year: int, args: argparse.Namespace,
+              service: SharedReads, mailer) -> dict:
+    summary = {'group': Path(config_path).stem, 'config': config_path, 'action': '-', 'families': 0,
+               'sent': 0, 'failed': 0, 'error': None}
+    start = time.perf_counter()
+    try:
+        exchange = FamilyGiftExchange(config_path, test_mode=args.test, offline=args.offline,
+                                      algorithm=args.algorithm, test_delivery=args.test_delivery,
+                                      spool_path=args.spool, gsheets_service=service, mailer=mailer, quiet=True)
+        outcome = run_exchange(exchange, seed_year, args, verbose=False)
+        summary['action'] = outcome.action
+        summary['families'] = len(getattr(exchange, 'assignments', None) or getattr(exchange, 'participants', ()))
+        summary['sent'] = sum(result.ok for result in outcome.results)
+        summary['failed'] = sum(not result.ok for result in outcome.results)
+    except Exception as e:
+        summary['error'] = f"{type(e).__name__}: {e}"
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+def run_batch(args: argparse.Namespace) -> List[dict]:
+    configs = {config_path: load_config(config_path) for config_path in args.configs}
+    seed_year = seed_year_for(args)
+    # Snapshots are shared too, so they live in the first config's cache directory
+    service = SharedReads(open_service(next(iter(configs.values())), offline=args.offline, test_mode=args.test))
+
+    with ExitStack() as stack:
+        mailers = shared_mailers(configs, args, stack)
+        parallel = args.parallel or len(configs)
+        with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(configs)))) as executor:
+            futures = [executor.submit(run_group, config_path, config, seed_year, args, service,
+                                       mailers.get(config_path))
+                       for config_path, config in configs.items()]
+            summaries = [future.result() for future in futures]
+        distinct_mailers = {id(mailer): mailer for mailer in mailers.values()}.values()
+        connections = sum(mailer.pool.connections_opened for mailer in distinct_mailers)
+
+    print(f"\n{'Group':<24} {'Action':<7} {'Families':>8} {'Sent':>6} {'Failed':>6} {'Time (s)':>9}  Status")
+    print("-" * 80)
+    for summary in summaries:
+        status = summary['error'] or ('ok' if not summary['failed'] else 'delivery failures')
+        print(f"{summary['group']:<24} {summary['action']:<7} {summary['families']:>8} {summary['sent']:>6} "
+              f"{summary['failed']:>6} {summary['seconds']:>9.3f}  {status}")
+    print(f"\n{len(summaries)} groups for {seed_year}; sheet ranges: {service.requested} requested, "
+          f"{service.fetched} fetched, {service.service.clients_created} Sheets client(s); "
+          f"{connections} mail connection(s)")
+    return summaries
+
+def main():
+    parser = argparse.ArgumentParser(description='Run several family gift exchanges, sharing sheet reads and mail')
+    parser.add_argument('configs', nargs='+', help='Config files, one per exchange')
+    parser.add_argument('--test', action='store_true', help='Run every group in test mode')
+    parser.add_argument('--test-delivery', choices=TEST_DELIVERIES + ('print',), default='sink',
+                        help='Where --test mail goes (default: one shared local SMTP sink)')
+    parser.add_argument('--spool', type=str, help='Spool path for --test-delivery mbox/eml')
+    parser.add_argument('--offline', action='store_true', help='Read sheet data only from the snapshot cache')
+    parser.add_argument('--reminder', action='store_true', help='Send reminders from the ledger')
+    parser.add_argument('--resend', action='store_true', help="Re-send this year's recorded emails")
+    parser.add_argument('--repair', action='store_true',
+                        help='Repair recorded assignments for families that joined or left')
+    parser.add_argument('--plan', type=int, metavar='YEARS',
+                        help='Plan this many years for every group and store the plans in the ledger')
+    parser.add_argument('--plan-seed', type=int, help='Master seed for --plan (default: the first planned year)')
+    parser.add_argument('--algorithm', type=str, help="Assignment algorithm, overriding each config's `algorithm:`")
+    parser.add_argument('--year', type=int, help='Year used for the random seed (shared by every group)')
+    parser.add_argument('--parallel', type=int, help='Groups run at once (default: all)')
+    parser.add_argument('--profile', type=str, metavar='REPORT_JSON',
+                        help='Time each pipeline stage across all groups, writing a JSON report here')
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler.enable()
+    try:
+        summaries = run_batch(args)
+    finally:
+        if args.profile:
+            profiler.write_json(args.profile)
+            print(f"\n{profiler.summary()}\nProfile report written to {args.profile}")
+    if any(summary['error'] or summary['failed'] for summary in summaries):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Email pipeline throughput benchmark against local stand-ins for the SMTP server
+
+Messages go through the real Mailer (worker pool, pooled logins, rate limit, retries) into
+an in-process SMTP sink over a real socket, or into an mbox/.eml spool. For each delivery
+target and worker count it reports messages per second and per-message latency percentiles
+(build, rate-limit waits, retries and send), plus retries, failures and logins. The sink can
+inject transient (451) and permanent (554) replies, dropped connections and server latency,
+to size large sends and tune `email.connections` / `max_retries` without touching Gmail.
+
+    python -m benchmarks.email_throughput --messages 2000 --workers 1 4 16
+    python -m benchmarks.email_throughput --transient-failure-rate 0.05 --drop-rate 0.01 --latency-ms 20
+"""
+import argparse
+import json
+import platform
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List
+from utils.mailer import TEST_DELIVERIES, DeliveryResult, OutgoingMessage, test_mailer
+
+# Roughly the size of an assignment email with a few gift preferences
+_BODY = ("Christmas Gift Exchange Assignment for {year}\n\n"
+         "You are giving to the family of: Family {receiver}\n\n"
+         "Their address is:\n{receiver} Evergreen Terrace\nSpringfield, ST 00000\n\n"
+         "Their gift preferences:\n- Board games\n- Books about birds\n- Homemade jam\n\n"
+         "Happy Holidays!")
+
+def make_messages(count: int) -> List[OutgoingMessage]:
+    return [OutgoingMessage(f"family{i}@example.com", "[TEST] Christmas Gift Exchange Assignment",
+                            _BODY.format(year=2024, receiver=(i + 1) % count)) for i in range(count)]
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(q / 100 * len(sorted_values) + 0.5))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize(results: List[DeliveryResult], elapsed: float) -> dict:
+    latencies = sorted(result.elapsed for result in results)
+    latency_ms = {f'p{q}': percentile(latencies, q) * 1000 for q in (50, 90, 99)}
+    latency_ms['max'] = latencies[-1] * 1000 if latencies else 0.0
+    delivered = sum(result.ok for result in results)
+    return {
+        'messages': len(results),
+        'delivered': delivered,
+        'failed': len(results) - delivered,
+        'retries': sum(result.attempts - 1 for result in results),
+        'seconds': elapsed,
+        'messages_per_second': delivered / elapsed if elapsed else 0.0,
+        'latency_ms': latency_ms,
+    }
+
+def run_cell(delivery: str, workers: int, messages: List[OutgoingMessage], args: argparse.Namespace,
+             spool_dir: Path) -> dict:
+    suffix = '.mbox' if delivery == 'mbox' else ''
+    spool_path = str(spool_dir / f"{delivery}-{workers}{suffix}")
+    sink_options = {}
+    if delivery == 'sink':
+        sink_options = dict(transient_failure_rate=args.transient_failure_rate,
+                            permanent_failure_rate=args.permanent_failure_rate,
+                            drop_rate=args.drop_rate, latency=args.latency_ms / 1000, seed=args.seed)
+    with test_mailer(delivery, spool_path, workers=workers, max_per_second=args.rate,
+                     max_retries=args.max_retries, backoff=args.backoff, **sink_options) as mailer:
+        start = time.perf_counter()
+        results = mailer.send_all(messages)
+        elapsed = time.perf_counter() - start
+        cell = {'delivery': delivery, 'workers': workers, **summarize(results, elapsed),
+                'connections_opened': mailer.pool.connections_opened}
+        if mailer.sink is not None:
+            cell['logins'] = mailer.sink.logins
+            cell['injected_faults'] = dict(mailer.sink.faults)
+            # Everything reported delivered must have arrived exactly once
+            cell['received'] = len(mailer.sink.messages)
+    return cell
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of the email pipeline against a local SMTP sink or spool')
+    parser.add_argument('--messages', type=int, default=1000, help='Messages per run (default: 1,000)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16],
+                        help='Sender worker / connection counts to compare (default: 1 4 16)')
+    parser.add_argument('--delivery', nargs='+', choices=TEST_DELIVERIES, default=['sink'],
+                        help='Targets to benchmark (default: sink)')
+    parser.add_argument('--rate', type=float, help='Messages-per-second cap, as email.max_per_second (default: none)')
+    parser.add_argument('--max-retries', type=int, default=3, help='Retries for transient failures (default: 3)')
+    parser.add_argument('--backoff', type=float, default=0.01,
+                        help='Base retry backoff in seconds (default: 0.01; production uses 1.0)')
+    parser.add_argument('--transient-failure-rate', type=float, default=0.0,
+                        help='Fraction of messages the sink answers with 451 (default: 0)')
+    parser.add_argument('--permanent-failure-rate', type=float, default=0.0,
+                        help='Fraction of messages the sink answers with 554 (default: 0)')
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='Fraction of messages where the sink hangs up (default: 0)')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Sink processing time per message (default: 0)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the injected faults (default: 0)')
+    parser.add_argument('--spool-dir', type=str, help='Keep mbox/eml spools here (default: a temporary directory)')
+    parser.add_argument('--json', type=str, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        spool_dir = Path(args.spool_dir or temp_dir)
+        for delivery in args.delivery:
+            for workers in args.workers:
+                results.append(run_cell(delivery, workers, messages, args, spool_dir))
+
+    print(f"{'Delivery':<8} {'Workers':>7} {'msg/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'Retries':>8} {'Failed':>7} {'Conns':>6}")
+    print("-" * 88)
+    for cell in results:
+        latency = cell['latency_ms']
+        print(f"{cell['delivery']:<8} {cell['workers']:>7} {cell['messages_per_second']:>9.1f} "
+              f"{latency['p50']:>8.2f} {latency['p90']:>8.2f} {latency['p99']:>8.2f} {latency['max']:>8.2f} "
+              f"{cell['retries']:>8} {cell['failed']:>7} {cell['connections_opened']:>6}")
+        if cell.get('received', cell['delivered']) != cell['delivered']:
+            print(f"  WARNING: sink received {cell['received']} messages but {cell['delivered']} were reported sent")
+
+    if args.json:
+        report = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'settings': vars(args),
+            'results': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
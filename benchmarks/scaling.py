@@ -0,0 +1,196 @@
+"""Scaling benchmark for every registered assignment algorithm
+
+Sweeps the number of participants and records, per algorithm and n:
+    - seconds per assignment (median over the trials run in the time budget)
+    - rejection-sampling restarts per assignment
+    - peak traced memory of one assignment
+    - bias: max deviation (percentage points) of the pair marginals from 1/(n-1), for small n
+Cells an algorithm can't finish in time are skipped, which is where the O(n^2) algorithms
+drop out. The time is extrapolated from the algorithm's last two measured n, using the growth
+exponent fitted between them (quadratic while only one point is measured). Results can be compared against a
+stored baseline; regressions are listed and make the exit status non-zero.
+
+    python -m benchmarks.scaling --update-baseline
+    python -m benchmarks.scaling --baseline
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List
+from utils import assignment_algorithms
+from utils.accumulator import PairingAccumulator
+
+DEFAULT_N_VALUES = [3, 4, 10, 30, 100, 1_000, 10_000, 100_000]
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'scaling_baseline.json'
+
+def _time_cell(algo: Callable, n: int, budget: float, max_trials: int, rng: random.Random) -> dict:
+    restarts = []
+    assignment_algorithms.restart_hooks.append(restarts.append)
+    timings = []
+    try:
+        deadline = time.perf_counter() + budget
+        while len(timings) < max_trials and (len(timings) < 3 or time.perf_counter() < deadline):
+            start = time.perf_counter()
+            algo.indices(n, rng=rng)
+            timings.append(time.perf_counter() - start)
+    finally:
+        assignment_algorithms.restart_hooks.remove(restarts.append)
+    return {
+        'trials': len(timings),
+        'seconds_per_assignment': statistics.median(timings),
+        'mean_seconds_per_assignment': statistics.fmean(timings),
+        'restarts_per_assignment': len(restarts) / len(timings),
+    }
+
+def _peak_memory(algo: Callable, n: int, rng: random.Random) -> int:
+    tracemalloc.start()
+    try:
+        algo.indices(n, rng=rng)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _bias(algo: Callable, n: int, trials: int, seed_value: int) -> float:
+    if hasattr(algo, 'batch'):
+        from utils.batch_sampler import batch_pairing_counts, make_generator, max_deviation
+        return max_deviation(batch_pairing_counts(algo.batch, n, trials, make_generator(seed_value)), trials)
+    rng = random.Random(seed_value)
+    accumulator = PairingAccumulator(n)
+    for _ in range(trials):
+        accumulator.update(algo.indices(n, rng=rng))
+    return accumulator.max_deviation()
+
+def _estimate_seconds(measured: List[dict], n: int) -> float:
+    """Seconds per assignment at n, extrapolated from the last two measured cells"""
+    last = measured[-1]
+    exponent = 2.0
+    if len(measured) >= 2:
+        before = measured[-2]
+        if before['seconds_per_assignment'] > 0 and last['n'] > before['n']:
+            # Small n is dominated by fixed overhead, so never assume better than linear
+            exponent = max(1.0, math.log(last['seconds_per_assignment'] / before['seconds_per_assignment'])
+                           / math.log(last['n'] / before['n']))
+    return last['seconds_per_assignment'] * (n / last['n']) ** exponent
+
+def run_benchmark(algorithms: List[Callable],
+                  n_values: List[int],
+                  budget: float = 1.0,
+                  max_trials: int = 10_000,
+                  max_seconds: float = 5.0,
+                  bias_trials: int = 20_000,
+                  bias_max_n: int = 10,
+                  seed_value: int = 0) -> List[dict]:
+    """One result dict per (algorithm, n); skipped cells carry a `skipped` reason"""
+    results = []
+    for algo in algorithms:
+        measured = []
+        for n in sorted(n_values):
+            cell = {'algorithm': algo.__name__, 'n': n}
+            if measured:
+                estimate = _estimate_seconds(measured, n)
+                if estimate > max_seconds:
+                    cell['skipped'] = f"estimated {estimate:.1f}s per assignment"
+                    results.append(cell)
+                    continue
+            rng = random.Random(seed_value)
+            cell.update(_time_cell(algo, n, budget, max_trials, rng))
+            cell['peak_memory_bytes'] = _peak_memory(algo, n, rng)
+            cell['max_deviation_pct'] = _bias(algo, n, bias_trials, seed_value) if n <= bias_max_n else None
+            results.append(cell)
+            measured.append(cell)
+    return results
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float, bias_tolerance: float) -> List[str]:
+    """Human-readable regressions of `results` against `baseline`"""
+    before = {(cell['algorithm'], cell['n']): cell for cell in baseline}
+    regressions = []
+    for cell in results:
+        old = before.get((cell['algorithm'], cell['n']))
+        if old is None or 'skipped' in old:
+            continue
+        name = f"{cell['algorithm']} n={cell['n']}"
+        if 'skipped' in cell:
+            regressions.append(f"{name}: now skipped ({cell['skipped']})")
+            continue
+        for key in ('seconds_per_assignment', 'peak_memory_bytes', 'restarts_per_assignment'):
+            if old[key] > 0 and cell[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {old[key]:.4g} -> {cell[key]:.4g} "
+                                   f"(+{(cell[key] / old[key] - 1) * 100:.0f}%)")
+        if (cell['max_deviation_pct'] is not None and old.get('max_deviation_pct') is not None
+                and cell['max_deviation_pct'] > old['max_deviation_pct'] + bias_tolerance):
+            regressions.append(f"{name}: max_deviation_pct {old['max_deviation_pct']:.2f} -> "
+                               f"{cell['max_deviation_pct']:.2f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Scaling benchmark for the assignment algorithms')
+    parser.add_argument('--n', type=int, nargs='+', default=DEFAULT_N_VALUES,
+                        help=f'Participant counts (default: {" ".join(map(str, DEFAULT_N_VALUES))})')
+    parser.add_argument('--algorithms', nargs='+', help='Only these algorithms, by name or alias (default: all registered)')
+    parser.add_argument('--budget', type=float, default=1.0, help='Timing budget per cell in seconds (default: 1)')
+    parser.add_argument('--max-trials', type=int, default=10_000, help='Timed assignments per cell (default: 10,000)')
+    parser.add_argument('--max-seconds', type=float, default=5.0,
+                        help='Skip cells estimated to take longer per assignment (default: 5)')
+    parser.add_argument('--bias-trials', type=int, default=20_000,
+                        help='Assignments used to measure bias (default: 20,000)')
+    parser.add_argument('--bias-max-n', type=int, default=10, help='Measure bias up to this n (default: 10)')
+    parser.add_argument('--json', type=str, help='Write the results to this JSON file')
+    parser.add_argument('--baseline', type=str, nargs='?', const=str(DEFAULT_BASELINE),
+                        help=f'Compare against a stored run (default file: {DEFAULT_BASELINE.name})')
+    parser.add_argument('--update-baseline', action='store_true', help='Store this run as the default baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Relative slowdown/memory growth flagged as a regression (default: 0.25)')
+    parser.add_argument('--bias-tolerance', type=float, default=1.0,
+                        help='Bias increase in percentage points flagged as a regression (default: 1.0)')
+    args = parser.parse_args()
+
+    algorithms = assignment_algorithms.ALGORITHMS
+    if args.algorithms:
+        algorithms = [assignment_algorithms.get_algorithm(name) for name in args.algorithms]
+
+    results = run_benchmark(algorithms, args.n, args.budget, args.max_trials, args.max_seconds,
+                            args.bias_trials, args.bias_max_n)
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'settings': {key: value for key, value in vars(args).items()
+                     if key not in ('json', 'baseline', 'update_baseline')},
+        'results': results,
+    }
+
+    print(f"{'Algorithm':<38} {'n':>7} {'us/assign':>12} {'restarts':>9} {'peak KiB':>10} {'bias %':>7}")
+    print("-" * 88)
+    for cell in results:
+        if 'skipped' in cell:
+            print(f"{cell['algorithm']:<38} {cell['n']:>7} skipped: {cell['skipped']}")
+            continue
+        bias = f"{cell['max_deviation_pct']:.2f}" if cell['max_deviation_pct'] is not None else '-'
+        print(f"{cell['algorithm']:<38} {cell['n']:>7} {cell['seconds_per_assignment'] * 1e6:>12.1f} "
+              f"{cell['restarts_per_assignment']:>9.2f} {cell['peak_memory_bytes'] / 1024:>10.1f} {bias:>7}")
+
+    for path in filter(None, [args.json, str(DEFAULT_BASELINE) if args.update_baseline else None]):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.tolerance, args.bias_tolerance)
+        print(f"\nCompared with {args.baseline} ({baseline['created']}): "
+              f"{len(regressions) or 'no'} regression{'s' if len(regressions) != 1 else ''}")
+        for line in regressions:
+            print(f"  {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Startup-time benchmark for the assigner entry points
+
+Each scenario runs in a fresh interpreter so import costs are measured the way a real
+invocation pays them. Also reports which heavy modules each scenario ended up loading.
+
+    python -m benchmarks.startup --repeats 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ['googleapiclient', 'google_auth_oauthlib', 'general_tools', 'numpy', 'asyncio', 'smtplib',
+                 'mailbox', 'sqlite3']
+
+SCENARIOS = {
+    'interpreter': "pass",
+    'import_assigner': "import assigner",
+    'import_algorithms': "import utils.assignment_algorithms",
+    'construct_exchange': (
+        "from assigner import FamilyGiftExchange\n"
+        "FamilyGiftExchange('./configs/config.example.yaml', test_mode=True)"
+    ),
+    'make_assignments': (
+        "from assigner import FamilyGiftExchange\n"
+        "exchange = FamilyGiftExchange('./configs/config.example.yaml', test_mode=True)\n"
+        "exchange.make_assignments(seed_value=2024)"
+    ),
+}
+
+REPORT = (
+    "\nimport sys, json\n"
+    "print(json.dumps([m for m in {heavy!r} if m in sys.modules]))\n"
+)
+
+def run_scenario(code: str, repeats: int) -> dict:
+    timings = []
+    loaded = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code + REPORT.format(heavy=HEAVY_MODULES)],
+                                cwd=REPO_ROOT, capture_output=True, text=True)
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return {'error': result.stderr.strip().splitlines()[-1]}
+        loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'min_ms': min(timings) * 1000,
+        'heavy_modules_loaded': loaded,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure assigner startup time')
+    parser.add_argument('--repeats', type=int, default=5, help='Runs per scenario (default: 5)')
+    parser.add_argument('--json', type=str, help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = {name: run_scenario(code, args.repeats) for name, code in SCENARIOS.items()}
+
+    print(f"{'Scenario':<22} {'Median (ms)':<13} {'Min (ms)':<10} Heavy modules loaded")
+    print("-" * 70)
+    for name, result in results.items():
+        if 'error' in result:
+            print(f"{name:<22} failed: {result['error']}")
+            continue
+        print(f"{name:<22} {result['median_ms']:<13.1f} {result['min_ms']:<10.1f} "
+              f"{', '.join(result['heavy_modules_loaded']) or '-'}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,106 +1,374 @@
 from pathlib import Path
-import sys
+import json
+import time
 import pickle
-from google.auth.transport.requests import Request
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from typing import List, Dict
-from google_auth_oauthlib.flow import InstalledAppFlow
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, List, Dict, Callable, Iterator, NamedTuple, Optional, Tuple
+from utils.profiling import profiler
+from utils.roster import parse_family_rows
+from utils.preferences import PreferenceSync
+
+# OAuth credentials are loaded, refreshed or obtained once per process and shared by every client
+_credentials = None
+_credentials_lock = threading.Lock()
+
+def _load_credentials():
+    # Imported here so runs served from the snapshot cache never load the Google libraries
+    from google.auth.transport.requests import Request
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    global _credentials
+
+    with _credentials_lock:
+        if _credentials is not None and _credentials.valid:
+            return _credentials
+        creds = _credentials
+        token_path = Path('./credentials/token.pickle')
+        # The file token.pickle stores the user's access and refresh tokens
+        if creds is None and token_path.exists():
+            with token_path.open('rb') as token:
+                creds = pickle.load(token)
+
+        # If there are no (valid) credentials available, let the user log in
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                credentials_path = Path('./credentials/credentials.json')
+                if not credentials_path.exists():
+                    # Raised rather than exiting so a batch run can report it against the one group
+                    raise FileNotFoundError(
+                        f"{credentials_path} not found! To create one: "
+                        "https://console.cloud.google.com/apis/credentials?project=fit-drive-237820")
+
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    str(credentials_path),
+                    ['https://www.googleapis.com/auth/spreadsheets.readonly']
+                    )
+                creds = flow.run_local_server(port=0)
+
+            # Save the credentials for the next run
+            with token_path.open('wb') as token:
+                pickle.dump(creds, token)
+        _credentials = creds
+        return creds
 
 def create_service():
-    creds = None
-    token_path = Path('./credentials/token.pickle')
-    # The file token.pickle stores the user's access and refresh tokens
-    if token_path.exists():
-        with token_path.open('rb') as token:
-            creds = pickle.load(token)
-                
-    # If there are no (valid) credentials available, let the user log in
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+    from googleapiclient.discovery import build
+    # Every client after the first reuses the credentials, and the discovery document ships
+    # with the library, so extra clients for concurrent fetches cost no OAuth or network
+    return build('sheets', 'v4', credentials=_load_credentials())
+
+DEFAULT_CACHE_DIR = './cache'
+# Snapshots are replayed for an hour in --test runs, but real sending runs always fetch
+# fresh rosters and addresses unless the config opts in with `cache.live_ttl_seconds`
+DEFAULT_CACHE_TTL = 3600
+DEFAULT_LIVE_CACHE_TTL = 0
+
+class SnapshotMissingError(FileNotFoundError):
+    pass
+
+class SnapshotCache:
+    """JSON snapshots of spreadsheet range reads, one file per (spreadsheet ID, range)"""
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttl_seconds: float = DEFAULT_CACHE_TTL):
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_seconds
+
+    def _path(self, spreadsheet_id: str, range_name: str) -> Path:
+        import hashlib
+        key = hashlib.sha1(f"{spreadsheet_id}|{range_name}".encode()).hexdigest()
+        return self.cache_dir / f"{key}.json"
+
+    def read(self, spreadsheet_id: str, range_name: str, max_age: Optional[float] = None) -> Optional[dict]:
+        """Return the stored result, or None if missing or older than max_age seconds"""
+        path = self._path(spreadsheet_id, range_name)
+        if not path.exists():
+            return None
+        with path.open('r') as f:
+            snapshot = json.load(f)
+        if max_age is not None and time.time() - snapshot['fetched_at'] > max_age:
+            return None
+        return snapshot['result']
+
+    def write(self, spreadsheet_id: str, range_name: str, result: dict) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(spreadsheet_id, range_name)
+        tmp_path = path.with_suffix('.tmp')
+        with tmp_path.open('w') as f:
+            json.dump({'spreadsheetId': spreadsheet_id, 'range': range_name,
+                       'fetched_at': time.time(), 'result': result}, f)
+        tmp_path.replace(path)
+
+class _Request:
+    def __init__(self, fetch: Callable[[], dict]):
+        self._fetch = fetch
+
+    def execute(self) -> dict:
+        return self._fetch()
+
+class SnapshotService:
+    """Stand-in for the Sheets service that serves `values().get()`/`batchGet()` reads from snapshots
+
+    Fresh snapshots (younger than the cache TTL) are replayed without touching the network.
+    Otherwise the real service is built on first use from `service_factory`, and its result
+    is stored. With offline=True (or no factory) only snapshots are used, whatever their age,
+    so the whole pipeline can run without credentials.
+
+    The Google client isn't thread-safe, so each fetch borrows a real service from a pool of
+    idle ones and returns it afterwards. Clients are only built when every existing one is
+    busy, so the count tracks concurrent fetches rather than threads. Building them is
+    serialised, and a miss checks the pool again once it holds the lock, so a client
+    returned meanwhile is reused instead of building another. create_service shares one
+    set of credentials, so at most one OAuth flow ever runs.
+    """
+    def __init__(self, cache: SnapshotCache, service_factory: Optional[Callable] = None, offline: bool = False):
+        self.cache = cache
+        self.service_factory = service_factory
+        self.offline = offline or service_factory is None
+        self.clients_created = 0
+        self._idle = queue.LifoQueue()
+        self._factory_lock = threading.Lock()
+
+    @contextmanager
+    def _service(self) -> Iterator[Any]:
+        try:
+            service = self._idle.get_nowait()
+        except queue.Empty:
+            with self._factory_lock:
+                try:
+                    # A fetch that finished while we waited for the lock has returned its client
+                    service = self._idle.get_nowait()
+                except queue.Empty:
+                    # OAuth token load/refresh and client discovery
+                    with profiler.stage('sheets.create_service'):
+                        service = self.service_factory()
+                    self.clients_created += 1
+        try:
+            yield service
+        finally:
+            self._idle.put(service)
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId: str, range: str, **kwargs) -> _Request:
+        return _Request(lambda: self._get(spreadsheetId, range, **kwargs))
+
+    def batchGet(self, spreadsheetId: str, ranges: List[str], **kwargs) -> _Request:
+        return _Request(lambda: self._batch_get(spreadsheetId, ranges, **kwargs))
+
+    def _cached(self, spreadsheet_id: str, range_name: str) -> Optional[dict]:
+        if self.offline:
+            result = self.cache.read(spreadsheet_id, range_name)
+            if result is None:
+                profiler.count('sheets.cache_misses')
+                raise SnapshotMissingError(f"No cached snapshot for {range_name} in {spreadsheet_id}; "
+                                           f"run once without --offline first")
         else:
-            credentials_path = Path('./credentials/credentials.json')
-            if not credentials_path.exists():
-                print("""
-Error: credentials.json not found!
-To create one: https://console.cloud.google.com/apis/credentials?project=fit-drive-237820
-                    """)
-                sys.exit(1)
-                    
-            flow = InstalledAppFlow.from_client_secrets_file(
-                str(credentials_path),
-                ['https://www.googleapis.com/auth/spreadsheets.readonly']
-                )
-            creds = flow.run_local_server(port=0)
-                
-        # Save the credentials for the next run
-        with token_path.open('wb') as token:
-            pickle.dump(creds, token)
-    
-    service = build('sheets', 'v4', credentials=creds)
-    return service
-
-def load_family_addresses(service, config):
-    """Load family data from Google Sheet"""
-    sheet = service.spreadsheets()
-    
-    result = sheet.values().get(
-        spreadsheetId=config['spreadsheet']['id'],
-        range=f"{config['spreadsheet']['sheet_name']}!A:T"
-    ).execute()
-    return result
-
-# https://docs.google.com/spreadsheets/d/17CqgSA17lEpMjJBRsrsyb2EKMTTA66FcohAdacjuTok/edit?resourcekey=&gid=628606659#gid=628606659
-# Timestamp	What are some things your family might want for Christmas?	Of which family are you a part?
-
-def load_gift_preferences(service, config):
-    """Load gift preferences from Google Form responses sheet if available
-    
-    Args:
-        service: Google Sheets service object
-        config: Configuration dictionary containing spreadsheet details
-        
-    Returns:
-        Dict[str, List[str]]: Mapping of family names to their gift preferences
+            result = self.cache.read(spreadsheet_id, range_name, max_age=self.cache.ttl_seconds)
+            if result is None:
+                profiler.count('sheets.cache_misses')
+                return None
+        profiler.count('sheets.cache_hits')
+        return result
+
+    def _get(self, spreadsheet_id: str, range_name: str, **kwargs) -> dict:
+        result = self._cached(spreadsheet_id, range_name)
+        if result is None:
+            with self._service() as service, profiler.stage('sheets.fetch'):
+                result = service.spreadsheets().values().get(
+                    spreadsheetId=spreadsheet_id, range=range_name, **kwargs).execute()
+            self.cache.write(spreadsheet_id, range_name, result)
+        return result
 
+    def _batch_get(self, spreadsheet_id: str, ranges: List[str], **kwargs) -> dict:
+        """Serve what the cache has and fetch every other range in a single batchGet round-trip"""
+        results = [self._cached(spreadsheet_id, range_name) for range_name in ranges]
+        missing = [range_name for range_name, result in zip(ranges, results) if result is None]
+        if missing:
+            with self._service() as service, profiler.stage('sheets.fetch'):
+                response = service.spreadsheets().values().batchGet(
+                    spreadsheetId=spreadsheet_id, ranges=missing, **kwargs).execute()
+            fetched = iter(response.get('valueRanges', []))
+            for i, result in enumerate(results):
+                if result is None:
+                    results[i] = next(fetched)
+                    self.cache.write(spreadsheet_id, ranges[i], results[i])
+        return {'spreadsheetId': spreadsheet_id, 'valueRanges': results}
+
+class SharedReads:
+    """Wraps a Sheets service so each distinct (spreadsheet, range) is read once, for runs over several configs
+
+    Repeated and concurrent reads of a range wait for the first one and share its result
+    (parsers only read results, so sharing the dicts is safe). The ranges of a batchGet that
+    someone else has already fetched, or is fetching, are taken from them and only the rest
+    go out, still in one batchGet. A failed read is forgotten so a later caller can retry it.
+    """
+    def __init__(self, service):
+        self.service = service
+        self.requested = 0
+        self.fetched = 0
+        self._results: Dict[Tuple[str, str, tuple], Future] = {}
+        self._lock = threading.Lock()
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId: str, range: str, **kwargs) -> _Request:
+        return _Request(lambda: self._read(spreadsheetId, [range], kwargs)[0])
+
+    def batchGet(self, spreadsheetId: str, ranges: List[str], **kwargs) -> _Request:
+        return _Request(lambda: {'spreadsheetId': spreadsheetId,
+                                 'valueRanges': self._read(spreadsheetId, ranges, kwargs)})
+
+    def _read(self, spreadsheet_id: str, ranges: List[str], kwargs: dict) -> List[dict]:
+        options = tuple(sorted(kwargs.items()))
+        futures = []
+        claimed: Dict[str, Future] = {}
+        with self._lock:
+            for range_name in ranges:
+                key = (spreadsheet_id, range_name, options)
+                future = self._results.get(key)
+                if future is None:
+                    future = self._results[key] = claimed[range_name] = Future()
+                futures.append(future)
+            self.requested += len(ranges)
+            self.fetched += len(claimed)
+        profiler.count('sheets.shared_reads', len(ranges) - len(claimed))
+
+        if claimed:
+            missing = list(claimed)
+            values = self.service.spreadsheets().values()
+            try:
+                if len(missing) == 1:
+                    results = [values.get(spreadsheetId=spreadsheet_id, range=missing[0], **kwargs).execute()]
+                else:
+                    results = values.batchGet(spreadsheetId=spreadsheet_id, ranges=missing,
+                                              **kwargs).execute().get('valueRanges', [])
+                if len(results) != len(missing):
+                    raise ValueError(f"batchGet returned {len(results)} ranges for {len(missing)} requested")
+            except Exception as e:
+                with self._lock:
+                    for range_name in missing:
+                        del self._results[(spreadsheet_id, range_name, options)]
+                for future in claimed.values():
+                    future.set_exception(e)
+                raise
+            for range_name, result in zip(missing, results):
+                claimed[range_name].set_result(result)
+        return [future.result() for future in futures]
+
+def open_service(config, offline: bool = False, test_mode: bool = False) -> SnapshotService:
+    """Sheets service backed by the snapshot cache configured under `cache`
+
+    `ttl_seconds` applies to test runs and `live_ttl_seconds` to real ones (default 0: every
+    read is fetched fresh, though snapshots are still stored for --offline).
+    """
+    cache_config = config.get('cache') or {}
+    if test_mode:
+        ttl_seconds = cache_config.get('ttl_seconds', DEFAULT_CACHE_TTL)
+    else:
+        ttl_seconds = cache_config.get('live_ttl_seconds', DEFAULT_LIVE_CACHE_TTL)
+    cache = SnapshotCache(cache_config.get('dir', DEFAULT_CACHE_DIR), ttl_seconds)
+    return SnapshotService(cache, service_factory=create_service, offline=offline)
+
+class SheetRange(NamedTuple):
+    """One range the exchange reads, and how to parse it
+
+    Optional ranges that fail to load are parsed as an empty result after a warning. A range
+    with its own `fetch(service)` is fetched on its own instead of being batched with the
+    other ranges of its spreadsheet. `resolve(service, result)` runs on a batched range's
+    result before it is parsed, and may read more (e.g. an incremental read falling back
+    to a full one).
     """
-    # Check if required config keys exist
-    if not config.get('spreadsheet'):
-        return {}
-    
+    name: str
+    spreadsheet_id: str
+    range: str
+    parse: Callable[[dict], Any]
+    required: bool = True
+    fetch: Optional[Callable[[Any], dict]] = None
+    resolve: Optional[Callable[[Any, dict], dict]] = None
+
+def sheet_ranges(config, offline: bool = False) -> List[SheetRange]:
+    """Every range load_data needs; more sources (history, constraints) are added here"""
     spreadsheet_config = config['spreadsheet']
-    if not (spreadsheet_config.get('form_responses_id') and 
-            spreadsheet_config.get('form_responses_sheet')):
-        return {}
-    
-    try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_config['form_responses_id'],
-            range=f"{spreadsheet_config['form_responses_sheet']}!A:C"
-        ).execute()
-    except Exception as e:
-        print(f"Warning: Could not load gift preferences: {e}")
-        return {}
-    
-    if 'values' not in result:
-        return {}
-        
-    headers = result['values'][0]
-    rows = result['values'][1:]
-    
-    preferences = {}
-    for row in rows:
-        if len(row) < 3:
-            continue
-            
-        timestamp = row[0]
-        preference = row[1]
-        family_name = row[2]
-        
-        if family_name not in preferences:
-            preferences[family_name] = []
-        preferences[family_name].append(preference)
-    
-    return preferences
+    ranges = [SheetRange('family', spreadsheet_config['id'], f"{spreadsheet_config['sheet_name']}!A:T",
+                         lambda result: parse_family_rows(result['values']))]
+    # Form responses sheet, e.g.
+    # https://docs.google.com/spreadsheets/d/17CqgSA17lEpMjJBRsrsyb2EKMTTA66FcohAdacjuTok/edit?resourcekey=&gid=628606659#gid=628606659
+    # Timestamp	What are some things your family might want for Christmas?	Of which family are you a part?
+    preference_sync = PreferenceSync.from_config(config)
+    if preference_sync is not None:
+        if offline:
+            # The cursor range moves with every sync, so it has no snapshot; the saved index is used as is
+            ranges.append(SheetRange('gift_preferences', preference_sync.spreadsheet_id, preference_sync.range,
+                                     preference_sync.merge, required=False, fetch=lambda service: {}))
+        else:
+            # Only rows added since the last run are read (in the same batchGet as the family
+            # sheet when they share a spreadsheet) and merged into the persisted index
+            ranges.append(SheetRange('gift_preferences', preference_sync.spreadsheet_id, preference_sync.range,
+                                     preference_sync.merge, required=False, resolve=preference_sync.resolve))
+    return ranges
+
+def _fetch_group(service, spreadsheet_id: str, group: List[SheetRange]) -> List[dict]:
+    values = service.spreadsheets().values()
+    if len(group) == 1:
+        results = [values.get(spreadsheetId=spreadsheet_id, range=group[0].range).execute()]
+    else:
+        response = values.batchGet(spreadsheetId=spreadsheet_id, ranges=[r.range for r in group]).execute()
+        results = response.get('valueRanges', [])
+    return [sheet_range.resolve(service, result) if sheet_range.resolve is not None else result
+            for sheet_range, result in zip(group, results)]
+
+async def load_ranges(service, ranges: List[SheetRange]) -> Dict[str, Any]:
+    """Fetch all ranges concurrently and parse each response as soon as it arrives
+
+    Ranges in the same spreadsheet share one batchGet; different spreadsheets are fetched
+    in parallel threads, so the load takes about as long as the slowest request.
+    """
+    import asyncio
+    groups: Dict[str, List[SheetRange]] = {}
+    custom = []
+    for sheet_range in ranges:
+        if sheet_range.fetch is not None:
+            custom.append(sheet_range)
+        else:
+            groups.setdefault(sheet_range.spreadsheet_id, []).append(sheet_range)
+
+    async def fetch(group: List[SheetRange], fetch_group: Callable[[], List[dict]]):
+        try:
+            return group, await asyncio.to_thread(fetch_group), None
+        except Exception as e:
+            return group, None, e
+
+    tasks = [fetch(group, lambda spreadsheet_id=spreadsheet_id, group=group: _fetch_group(service, spreadsheet_id, group))
+             for spreadsheet_id, group in groups.items()]
+    tasks += [fetch([sheet_range], lambda sheet_range=sheet_range: [sheet_range.fetch(service)])
+              for sheet_range in custom]
+
+    parsed = {}
+    for next_done in asyncio.as_completed(tasks):
+        group, results, error = await next_done
+        if error is not None:
+            if any(sheet_range.required for sheet_range in group):
+                raise error
+            print(f"Warning: Could not load {', '.join(r.name for r in group)}: {error}")
+            results = [{} for _ in group]
+        for sheet_range, result in zip(group, results):
+            with profiler.stage(f'load_data.parse.{sheet_range.name}'):
+                parsed[sheet_range.name] = sheet_range.parse(result)
+    return parsed
 
+def load_sheets(service, config, offline: bool = False) -> Dict[str, Any]:
+    """Blocking entry point: every range in sheet_ranges(config), loaded and parsed"""
+    # asyncio is only imported by runs that actually read sheets
+    import asyncio
+    return asyncio.run(load_ranges(service, sheet_ranges(config, offline)))
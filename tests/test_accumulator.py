@@ -0,0 +1,91 @@
+import pickle
+import numpy as np
+import pytest
+from utils import parallel
+from utils.accumulator import PairingAccumulator, run_study
+from utils.assignment_algorithms import Participants, get_algorithm
+from utils.constraints import ConstrainedSampler, build_exclusion_graph
+
+class Interrupted(Exception):
+    pass
+
+class StopAfter:
+    """Stands in for `algo` under its own name, and dies after `calls` draws or batches like a killed run"""
+    def __init__(self, algo, calls):
+        self.__name__ = algo.__name__
+        self.algo = algo
+        self.calls = calls
+        if hasattr(algo, 'batch'):
+            self.batch = self._batch
+
+    def _tick(self):
+        self.calls -= 1
+        if self.calls < 0:
+            raise Interrupted
+
+    def _batch(self, n, size, rng):
+        self._tick()
+        return self.algo.batch(n, size, rng)
+
+    def indices(self, n, seed_value=None, rng=None):
+        self._tick()
+        return self.algo.indices(n, rng=rng)
+
+@pytest.mark.parametrize('name, calls, sparse', [
+    ('numpy_batch_rejection', 5, False),
+    ('numpy_batch_rejection', 5, True),
+    ('early_refusal_derangement', 2600, False),
+    ('early_refusal_derangement', 2600, True),
+])
+def test_resumed_study_is_byte_identical(tmp_path, name, calls, sparse):
+    options = dict(checkpoint_every=2000, seed_value=11, chunk_size=500, sparse=sparse)
+    expected = run_study(name, 7, 5000, **options)
+
+    checkpoint = str(tmp_path / 'study.pickle')
+    with pytest.raises(Interrupted):
+        run_study(StopAfter(get_algorithm(name), calls), 7, 5000, checkpoint, **options)
+    with open(checkpoint, 'rb') as f:
+        assert pickle.load(f)['accumulator'].trials == 2000
+    resumed = run_study(name, 7, 5000, checkpoint, **options)
+    assert resumed.trials == expected.trials == 5000
+    assert resumed.to_dense().tobytes() == expected.to_dense().tobytes()
+
+def test_checkpoint_of_another_study_is_refused(tmp_path):
+    checkpoint = str(tmp_path / 'study.pickle')
+    run_study('early_refusal_derangement', 5, 100, checkpoint)
+    with pytest.raises(ValueError, match='different study'):
+        run_study('early_refusal_derangement', 5, 100, checkpoint, seed_value=1)
+
+def test_sparse_and_dense_counts_agree():
+    rng = np.random.default_rng(0)
+    dense, sparse = PairingAccumulator(9, sparse=False), PairingAccumulator(9, sparse=True)
+    batch = get_algorithm('numpy_batch_rejection').batch(9, 300, rng)
+    for accumulator in (dense, sparse):
+        accumulator.update_batch(batch[:200])
+        for receivers in batch[200:]:
+            accumulator.update(receivers)
+    assert np.array_equal(dense.to_dense(), sparse.to_dense())
+    assert dense.count(0, 1) == sparse.count(0, 1) and dense.max_deviation() == sparse.max_deviation()
+
+def test_sharded_constrained_study_resumes_from_its_checkpoint(tmp_path, monkeypatch):
+    families = [str(i) for i in range(6)]
+    sampler = ConstrainedSampler(Participants(families),
+                                 build_exclusion_graph({'exclusion_graph': {'groups': [['0', '1']]}}, families))
+    options = dict(master_seed=5, workers=2, shard_size=500)
+    expected = parallel.parallel_pairing_counts(sampler, 6, 3000, **options)
+    assert expected[0, 1] == expected[1, 0] == 0
+
+    checkpoint = tmp_path / 'shards.pickle'
+    save = parallel._save_checkpoint
+    def save_then_die(path, state):
+        save(path, state)
+        if state['shards_done'] == 2:
+            raise Interrupted
+    monkeypatch.setattr(parallel, '_save_checkpoint', save_then_die)
+    with pytest.raises(Interrupted):
+        parallel.parallel_pairing_counts(sampler, 6, 3000, checkpoint_path=str(checkpoint), **options)
+    with checkpoint.open('rb') as f:
+        assert pickle.load(f)['shards_done'] == 2
+    monkeypatch.setattr(parallel, '_save_checkpoint', save)
+    resumed = parallel.parallel_pairing_counts(sampler, 6, 3000, checkpoint_path=str(checkpoint), **options)
+    assert resumed.tobytes() == expected.tobytes()
@@ -0,0 +1,53 @@
+import threading
+from utils import assignment_algorithms
+from utils.assignment_algorithms import (early_refusal_derangement, generate_many, in_target,
+                                         no_two_cycle_derangement)
+
+def _reset_tables(monkeypatch):
+    monkeypatch.setattr(assignment_algorithms, '_scaled_derangements', [1.0, 0.0])
+    monkeypatch.setattr(assignment_algorithms, '_refusal_probabilities', [0.0, 0.0])
+    monkeypatch.setattr(assignment_algorithms, '_scaled_no_two_cycle_counts', [1.0, 0.0, 0.0])
+    monkeypatch.setattr(assignment_algorithms, '_three_cycle_probabilities', [0.0, 0.0, 0.0])
+
+def test_probability_tables_concurrent_first_use(monkeypatch):
+    sizes = [2000 + 9000 * i for i in range(8)]
+    expected = (list(assignment_algorithms._refusal_probability_table(max(sizes))),
+                list(assignment_algorithms._three_cycle_probability_table(max(sizes))))
+    _reset_tables(monkeypatch)
+
+    barrier = threading.Barrier(len(sizes))
+    errors = []
+    def first_use(n):
+        barrier.wait()
+        try:
+            for algo in (early_refusal_derangement, no_two_cycle_derangement):
+                assert in_target(algo, algo.indices(n, seed_value=n))
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=first_use, args=(n,)) for n in sizes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert assignment_algorithms._refusal_probabilities == expected[0]
+    assert assignment_algorithms._three_cycle_probabilities == expected[1]
+
+def test_generate_many_concurrent_first_use(monkeypatch):
+    _reset_tables(monkeypatch)
+    groups = [[str(i) for i in range(2000 + 9000 * k)] for k in range(8)]
+    seeds = list(range(len(groups)))
+    results = generate_many(groups, seeds, workers=8)
+    assert results == [early_refusal_derangement(group, seed) for group, seed in zip(groups, seeds)]
+
+def test_evaluate_algorithm_counts_the_algorithms_own_batches(monkeypatch):
+    import numpy as np
+    def rotate_batch(n, size, rng):
+        return np.broadcast_to((np.arange(n) + 1) % n, (size, n)).copy()
+    monkeypatch.setattr(assignment_algorithms, 'ALGORITHMS', list(assignment_algorithms.ALGORITHMS))
+    monkeypatch.setattr(assignment_algorithms, 'REGISTRY', dict(assignment_algorithms.REGISTRY))
+    algo = assignment_algorithms.register_algorithm(assignment_algorithms.batched_algorithm(rotate_batch))
+    # Every trial is the same rotation, so each giver always draws its successor
+    _, deviation = assignment_algorithms.evaluate_algorithm(algo, 4, total_runs=100)
+    assert deviation == 100 - 100 / 3
@@ -0,0 +1,46 @@
+import itertools
+import pickle
+import random
+from collections import Counter
+import pytest
+from utils.assignment_algorithms import Participants
+from utils.constraints import (ConstrainedSampler, InfeasibleConstraintsError, build_exclusion_graph,
+                               check_feasibility, sample_constrained_derangement,
+                               validate_constrained_assignments)
+
+FAMILIES = ['1', '2', '3', '4', '5']
+CONFIG = {'exclusion_graph': {'groups': [['1', '2']], 'forbidden': {'3': ['4']}}}
+
+def _valid_assignments(family_ids, forbidden):
+    return [dict(zip(family_ids, perm)) for perm in itertools.permutations(family_ids)
+            if all(receiver not in forbidden[giver] for giver, receiver in zip(family_ids, perm))]
+
+def test_infeasible_graph_names_the_blocked_givers():
+    forbidden = build_exclusion_graph({'exclusion_graph': {'groups': [['1', '2', '3']]}}, ['1', '2', '3', '4'])
+    with pytest.raises(InfeasibleConstraintsError) as error:
+        check_feasibility(['1', '2', '3', '4'], forbidden)
+    # A Hall violator: more givers than receivers they may draw, and only 4 is open to them
+    assert len(error.value.blocked) > len(error.value.reachable) and error.value.reachable == ['4']
+
+def test_sampler_is_uniform_over_the_valid_assignments():
+    forbidden = build_exclusion_graph(CONFIG, FAMILIES)
+    valid = _valid_assignments(FAMILIES, forbidden)
+    rng = random.Random(0)
+    trials = 10_000
+    counts = Counter(tuple(sorted(sample_constrained_derangement(FAMILIES, forbidden, rng=rng).items()))
+                     for _ in range(trials))
+    assert set(counts) == {tuple(sorted(assignment.items())) for assignment in valid}
+    expected = trials / len(valid)
+    # Each of the 14 outcomes sits within ~5 standard deviations of its expected count
+    assert all(abs(count - expected) < 5 * expected ** 0.5 for count in counts.values())
+    assert all(validate_constrained_assignments(FAMILIES, dict(outcome), forbidden) for outcome in counts)
+
+def test_constrained_sampler_matches_the_dict_sampler_and_pickles():
+    participants = Participants(FAMILIES)
+    forbidden = build_exclusion_graph(CONFIG, FAMILIES)
+    sampler = pickle.loads(pickle.dumps(ConstrainedSampler(participants, forbidden)))
+    for seed in range(20):
+        assignment = sample_constrained_derangement(participants, forbidden, seed)
+        assert sampler.indices(len(FAMILIES), seed_value=seed) == list(participants.to_receivers(assignment))
+    other = ConstrainedSampler(participants, build_exclusion_graph({}, FAMILIES))
+    assert other.__name__ != sampler.__name__
@@ -0,0 +1,15 @@
+import pytest
+from utils import assignment_algorithms
+from utils.exact_analysis import STATE_MODELS, analyze, exact_distribution
+
+@pytest.mark.parametrize('name', sorted(STATE_MODELS))
+@pytest.mark.parametrize('n', [2, 3, 4, 5])
+def test_state_walk_matches_branch_enumeration(name, n):
+    algo = assignment_algorithms.get_algorithm(name)
+    assert exact_distribution(algo, n) == exact_distribution(algo, n, enumerate_branches=True)
+
+@pytest.mark.parametrize('name', sorted(STATE_MODELS))
+def test_state_walk_reaches_n8(name):
+    report = analyze(assignment_algorithms.get_algorithm(name), 8)
+    assert report['method'] == 'state walk'
+    assert not report['uniform'] and report['invalid_outcomes'] == 0
@@ -0,0 +1,42 @@
+import sqlite3
+import pytest
+from utils.ledger import AssignmentLedger
+from utils.mailer import OutgoingMessage
+
+ASSIGNMENTS = {'1': '2', '2': '3', '3': '1'}
+MESSAGES = [(giver, OutgoingMessage(f"{giver}@example.com", 'Assignment', f"{giver} gives to {receiver}"))
+            for giver, receiver in ASSIGNMENTS.items()]
+
+def test_latest_run_replays_assignments_and_messages_exactly(tmp_path):
+    path = str(tmp_path / 'ledger.sqlite3')
+    with AssignmentLedger(path) as ledger:
+        ledger.record('key', 2024, {'1': '3', '2': '1', '3': '2'}, [], seed=1)
+        run_id = ledger.record('key', 2024, ASSIGNMENTS, MESSAGES, seed=2024)
+        ledger.record('key', 2024, {'1': '3', '2': '1', '3': '2'}, [], seed=3, test=True)
+
+    # Reopened from disk: the latest real run, with the text exactly as first rendered
+    with AssignmentLedger(path) as ledger:
+        entry = ledger.latest('key', 2024)
+        assert (entry.run_id, entry.seed, entry.test) == (run_id, 2024, False)
+        assert entry.assignments == ASSIGNMENTS and entry.messages == MESSAGES
+        assert ledger.messages_for_giver('key', 2024, '2') == [MESSAGES[1][1]]
+        assert ledger.latest('key', 2025) is None and ledger.latest('other', 2024) is None
+        assert ledger.latest('key', 2024, test=True).seed == 3
+
+def test_history_uses_the_latest_run_of_each_year(tmp_path):
+    with AssignmentLedger(str(tmp_path / 'ledger.sqlite3')) as ledger:
+        ledger.record('key', 2023, {'1': '3', '2': '1', '3': '2'}, [])
+        ledger.record('key', 2024, {'1': '3', '2': '1', '3': '2'}, [])
+        ledger.record('key', 2024, ASSIGNMENTS, [])
+        assert ledger.history('key', '1') == [(2023, '3'), (2024, '2')]
+        assert ledger.years('key') == [2023, 2024]
+        assert ledger.assignments_by_year('key')[2024] == ASSIGNMENTS
+
+def test_ledger_is_append_only(tmp_path):
+    with AssignmentLedger(str(tmp_path / 'ledger.sqlite3')) as ledger:
+        ledger.record('key', 2024, ASSIGNMENTS, MESSAGES)
+        with pytest.raises(sqlite3.DatabaseError, match='append-only'):
+            ledger._db.execute("UPDATE assignments SET receiver = '1' WHERE giver = '2'")
+        with pytest.raises(sqlite3.DatabaseError, match='append-only'):
+            ledger._db.execute("DELETE FROM runs")
+        assert ledger.latest('key', 2024).assignments == ASSIGNMENTS
@@ -0,0 +1,49 @@
+import mailbox
+import smtplib
+# Aliased so pytest doesn't collect the context manager as a test
+from utils.mailer import OutgoingMessage, is_transient, test_mailer as local_mailer
+
+MESSAGES = [OutgoingMessage(f"family{i}@example.com", 'Assignment', f"You give to family {i + 1}") for i in range(40)]
+
+def test_sink_delivery_retries_transient_faults_on_the_pooled_connection():
+    with local_mailer('sink', workers=1, backoff=0.001, transient_failure_rate=0.2,
+                     permanent_failure_rate=0.05, seed=1) as mailer:
+        results = mailer.send_all(MESSAGES)
+        sink = mailer.sink
+        connections = mailer.pool.connections_opened
+    failed = [result for result in results if not result.ok]
+    assert [result.recipient for result in results] == [message.to for message in MESSAGES]
+    # Only permanent 554 replies fail; every 451 was retried
+    assert len(failed) == sink.faults['permanent'] and all('554' in result.error for result in failed)
+    assert sink.faults['transient'] > 0
+    assert len(sink.messages) == len(MESSAGES) - len(failed)
+    # Refused messages are reset with RSET and the connection kept
+    assert connections == 1 and sink.logins == 1
+
+def test_dropped_connections_are_replaced():
+    with local_mailer('sink', workers=1, backoff=0.001, drop_rate=0.1, seed=2) as mailer:
+        results = mailer.send_all(MESSAGES)
+        sink = mailer.sink
+        connections = mailer.pool.connections_opened
+    assert all(result.ok for result in results)
+    assert connections == sink.faults['drop'] + 1
+
+def test_mbox_and_eml_spools_keep_every_message(tmp_path):
+    with local_mailer('mbox', str(tmp_path / 'test.mbox'), workers=4) as mailer:
+        assert all(result.ok for result in mailer.send_all(MESSAGES))
+    spooled = mailbox.mbox(str(tmp_path / 'test.mbox'))
+    assert sorted(message['To'] for message in spooled) == sorted(message.to for message in MESSAGES)
+
+    with local_mailer('eml', str(tmp_path / 'eml'), workers=4) as mailer:
+        mailer.send_all(MESSAGES[:3])
+    with local_mailer('eml', str(tmp_path / 'eml'), workers=4) as mailer:
+        mailer.send_all(MESSAGES[3:5])
+    # A reused spool directory is appended to
+    assert len(list((tmp_path / 'eml').glob('*.eml'))) == 5
+
+def test_only_reply_codes_and_connection_failures_are_transient():
+    assert is_transient(smtplib.SMTPDataError(451, b'try again'))
+    assert not is_transient(smtplib.SMTPDataError(554, b'rejected'))
+    assert is_transient(smtplib.SMTPServerDisconnected())
+    assert is_transient(ConnectionResetError())
+    assert not is_transient(FileNotFoundError())
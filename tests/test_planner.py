@@ -0,0 +1,37 @@
+from utils.assignment_algorithms import get_algorithm
+from utils.constraints import build_exclusion_graph
+from utils.planner import plan_schedule
+
+FAMILIES = [str(i) for i in range(8)]
+YEARS = range(2025, 2030)
+
+def _pairs(assignments):
+    return set(assignments.items())
+
+def test_plan_is_reproducible_and_avoids_repeats():
+    plan = plan_schedule(FAMILIES, YEARS, master_seed=7)
+    assert plan == plan_schedule(FAMILIES, YEARS, master_seed=7)
+    assert sorted(plan.assignments) == list(YEARS)
+    for assignments in plan.assignments.values():
+        assert sorted(assignments.values()) == FAMILIES
+        assert all(giver != receiver for giver, receiver in assignments.items())
+    # 8 families have 7 receivers each, so 5 years can avoid every repeat
+    assert plan.repeats == 0 and plan.cost == 0 and plan.min_gap is None
+    assert plan.cost <= plan.initial_cost
+
+def test_history_and_exclusion_graph_are_respected():
+    history = {2024: {giver: FAMILIES[(i + 1) % 8] for i, giver in enumerate(FAMILIES)}}
+    forbidden = build_exclusion_graph({'exclusion_graph': {'groups': [['0', '1']]}}, FAMILIES)
+    plan = plan_schedule(FAMILIES, YEARS, master_seed=3, forbidden=forbidden, history=history)
+    for assignments in plan.assignments.values():
+        assert all(receiver not in forbidden[giver] for giver, receiver in assignments.items())
+        assert not _pairs(assignments) & _pairs(history[2024])
+
+def test_plan_keeps_the_algorithms_shape():
+    plan = plan_schedule(FAMILIES, YEARS, master_seed=1, algorithm=get_algorithm('single_cycle'))
+    for assignments in plan.assignments.values():
+        giver, seen = '0', set()
+        while giver not in seen:
+            seen.add(giver)
+            giver = assignments[giver]
+        assert len(seen) == len(FAMILIES)
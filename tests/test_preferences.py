@@ -0,0 +1,73 @@
+import re
+from load_from_gsheets import SnapshotCache, SnapshotService, _Request, load_sheets
+
+FAMILY = [['Family ID', 'Primary Email', 'Address', 'City State Zip'],
+          ['1', 'a@example.com', '1 Main St', 'Town'],
+          ['2', 'b@example.com', '2 Main St', 'Town']]
+HEADER = ['Timestamp', 'What are some things your family might want for Christmas?', 'Of which family are you a part?']
+
+class FakeSheets:
+    """A spreadsheet of named sheets, read with values().get/batchGet the way the Sheets API does"""
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.calls = []
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _read(self, range_name):
+        sheet, cells = range_name.split('!')
+        first_row = int(re.match(r'[A-Z]+(\d*)', cells).group(1) or 1)
+        return {'range': range_name, 'values': [list(row) for row in self.sheets[sheet][first_row - 1:]]}
+
+    def get(self, spreadsheetId, range):
+        self.calls.append(('get', range))
+        return _Request(lambda: self._read(range))
+
+    def batchGet(self, spreadsheetId, ranges):
+        self.calls.append(('batchGet', tuple(ranges)))
+        return _Request(lambda: {'valueRanges': [self._read(r) for r in ranges]})
+
+def _config(tmp_path):
+    return {'spreadsheet': {'id': 'sheet-id', 'sheet_name': 'Family', 'form_responses_id': 'sheet-id',
+                            'form_responses_sheet': 'Responses'},
+            'cache': {'dir': str(tmp_path)}}
+
+def test_preferences_are_read_incrementally_in_the_family_batch(tmp_path):
+    responses = [HEADER, ['11/15/2024 10:00:00', 'Books', 'Smiths']]
+    sheets = FakeSheets({'Family': FAMILY, 'Responses': responses})
+    loaded = load_sheets(sheets, _config(tmp_path))
+    assert loaded['gift_preferences'] == {'Smiths': ['Books']}
+    assert sheets.calls == [('batchGet', ('Family!A:T', 'Responses!A1:C'))]
+
+    responses.append(['11/16/2024 10:00:00', 'Board games', 'Smiths'])
+    sheets.calls.clear()
+    loaded = load_sheets(sheets, _config(tmp_path))
+    assert loaded['gift_preferences'] == {'Smiths': ['Board games', 'Books']}
+    # Only the cursor row and what follows it are read, still in one round-trip
+    assert sheets.calls == [('batchGet', ('Family!A:T', 'Responses!A2:C'))]
+
+def test_edit_above_the_cursor_rebuilds_the_index(tmp_path):
+    responses = [HEADER, ['11/15/2024 10:00:00', 'Books', 'Smiths'], ['11/16/2024 10:00:00', 'Puzzles', 'Adams']]
+    sheets = FakeSheets({'Family': FAMILY, 'Responses': responses})
+    load_sheets(sheets, _config(tmp_path))
+
+    del responses[1]
+    sheets.calls.clear()
+    loaded = load_sheets(sheets, _config(tmp_path))
+    assert loaded['gift_preferences'] == {'Adams': ['Puzzles']}
+    assert sheets.calls[-1] == ('get', 'Responses!A1:C')
+
+def test_offline_uses_the_saved_index_without_a_warning(tmp_path, capsys):
+    sheets = FakeSheets({'Family': FAMILY, 'Responses': [HEADER, ['11/15/2024 10:00:00', 'Books', 'Smiths']]})
+    cache = SnapshotCache(str(tmp_path / 'snapshots'))
+    load_sheets(SnapshotService(cache, service_factory=lambda: sheets), _config(tmp_path))
+    capsys.readouterr()
+
+    loaded = load_sheets(SnapshotService(cache, offline=True), _config(tmp_path), offline=True)
+    assert loaded['gift_preferences'] == {'Smiths': ['Books']}
+    assert [record.family_id for record in loaded['family'].records] == ['1', '2']
+    assert 'Warning' not in capsys.readouterr().out
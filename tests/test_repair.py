@@ -0,0 +1,43 @@
+import pytest
+from utils.constraints import build_exclusion_graph
+from utils.repair import RepairImpossibleError, repair_assignments
+
+# One cycle 1 -> 2 -> 3 -> 4 -> 5 -> 6 -> 1
+PREVIOUS = {str(i): str(i % 6 + 1) for i in range(1, 7)}
+
+def _is_derangement(assignments, family_ids):
+    return (set(assignments) == set(family_ids) and set(assignments.values()) == set(family_ids)
+            and all(giver != receiver for giver, receiver in assignments.items()))
+
+def test_leaver_is_cut_out_and_joiner_spliced_in():
+    family_ids = [fid for fid in PREVIOUS if fid != '3'] + ['7']
+    result = repair_assignments(PREVIOUS, family_ids, seed_value=1)
+    assert result.left == ['3'] and result.joined == ['7']
+    assert _is_derangement(result.assignments, family_ids)
+    # 2 now gives to 3's receiver; 7 takes over one edge a -> b as a -> 7 -> b
+    assert result.assignments['2'] in ('4', '7')
+    assert len(result.changed) <= 3 and '7' in result.changed
+    unchanged = set(family_ids) - set(result.changed)
+    assert all(result.assignments[giver] == PREVIOUS[giver] for giver in unchanged)
+
+def test_repair_keeps_to_the_exclusion_graph():
+    family_ids = list(PREVIOUS) + ['7', '8']
+    config = {'exclusion_graph': {'groups': [['7', '8', '1']], 'forbidden': {'2': ['3']}}}
+    forbidden = build_exclusion_graph(config, family_ids)
+    for seed in range(20):
+        result = repair_assignments(PREVIOUS, family_ids, forbidden, seed_value=seed)
+        assert _is_derangement(result.assignments, family_ids)
+        assert all(receiver not in forbidden[giver] for giver, receiver in result.assignments.items())
+
+def test_no_reciprocal_pairs_when_two_cycles_are_not_allowed():
+    family_ids = ['1', '2', '3', '5', '6']
+    for seed in range(20):
+        result = repair_assignments(PREVIOUS, family_ids, seed_value=seed, allow_two_cycles=False)
+        assert _is_derangement(result.assignments, family_ids)
+        assert all(result.assignments[receiver] != giver for giver, receiver in result.assignments.items())
+
+def test_joiner_with_no_allowed_pair_cannot_be_repaired():
+    family_ids = list(PREVIOUS) + ['7']
+    forbidden = build_exclusion_graph({'exclusion_graph': {'forbidden': {'7': list(PREVIOUS)}}}, family_ids)
+    with pytest.raises(RepairImpossibleError):
+        repair_assignments(PREVIOUS, family_ids, forbidden, seed_value=0)
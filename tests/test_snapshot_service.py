@@ -0,0 +1,68 @@
+import threading
+import time
+import pytest
+from load_from_gsheets import SnapshotCache, SnapshotMissingError, SnapshotService, _Request
+
+class FakeSheets:
+    """Just enough of the Sheets client for SnapshotService: values().get/batchGet().execute()"""
+    def __init__(self, calls):
+        self.calls = calls
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range):
+        self.calls.append(('get', range))
+        return _Request(lambda: {'range': range, 'values': [[range]]})
+
+    def batchGet(self, spreadsheetId, ranges):
+        self.calls.append(('batchGet', tuple(ranges)))
+        return _Request(lambda: {'valueRanges': [{'range': r, 'values': [[r]]} for r in ranges]})
+
+def _service(tmp_path, calls, built, ttl_seconds=3600, offline=False):
+    def factory():
+        built.append(1)
+        return FakeSheets(calls)
+    return SnapshotService(SnapshotCache(str(tmp_path), ttl_seconds), service_factory=factory, offline=offline)
+
+def test_miss_reuses_a_client_returned_while_it_waited_for_the_factory(tmp_path):
+    calls, built = [], []
+    service = _service(tmp_path, calls, built)
+    results = []
+    with service._factory_lock:
+        reader = threading.Thread(target=lambda: results.append(
+            service.values().get(spreadsheetId='s', range='A').execute()))
+        reader.start()
+        time.sleep(0.2)
+        # Another fetch finishes and hands its client back while the reader waits on the lock
+        service._idle.put(FakeSheets(calls))
+    reader.join()
+    assert results == [{'range': 'A', 'values': [['A']]}]
+    assert built == [] and service.clients_created == 0
+
+def test_fresh_snapshots_are_replayed_without_building_a_client(tmp_path):
+    calls, built = [], []
+    _service(tmp_path, calls, built).values().get(spreadsheetId='s', range='A').execute()
+    replay = _service(tmp_path, calls, built)
+    assert replay.values().get(spreadsheetId='s', range='A').execute() == {'range': 'A', 'values': [['A']]}
+    assert calls == [('get', 'A')] and len(built) == 1 and replay.clients_created == 0
+
+def test_batch_get_fetches_only_the_ranges_missing_from_the_cache(tmp_path):
+    calls, built = [], []
+    service = _service(tmp_path, calls, built)
+    service.values().get(spreadsheetId='s', range='A').execute()
+    result = service.values().batchGet(spreadsheetId='s', ranges=['A', 'B', 'C']).execute()
+    assert [r['range'] for r in result['valueRanges']] == ['A', 'B', 'C']
+    assert calls == [('get', 'A'), ('batchGet', ('B', 'C'))] and len(built) == 1
+
+def test_offline_serves_stale_snapshots_and_reports_missing_ones(tmp_path):
+    calls, built = [], []
+    _service(tmp_path, calls, built).values().get(spreadsheetId='s', range='A').execute()
+    offline = _service(tmp_path, calls, built, ttl_seconds=0, offline=True)
+    assert offline.values().get(spreadsheetId='s', range='A').execute()['values'] == [['A']]
+    with pytest.raises(SnapshotMissingError):
+        offline.values().get(spreadsheetId='s', range='B').execute()
+    assert len(built) == 1
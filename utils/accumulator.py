@@ -0,0 +1,174 @@
+import os
+import pickle
+import random
+import numpy as np
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Union
+from utils import assignment_algorithms
+
+# A sparse count costs 12 bytes per distinct pair drawn (at most trials * n of them) against 4
+# bytes per cell of the dense n x n matrix, so sparse mode is only the default for large n when
+# the study is short enough to touch a small fraction of the cells
+SPARSE_MIN_N = 4096
+SPARSE_MAX_FILL = 1 / 8
+# Single assignments are buffered and merged into the sparse arrays this many pairs at a time
+_SPARSE_BUFFER = 1 << 18
+
+class PairingAccumulator:
+    """Giver -> receiver pairing counts for a stream of assignments
+
+    Dense mode is an n x n uint32 matrix (4 bytes per pair, versus ~100 bytes per entry for
+    a dict of dicts of string IDs). Sparse mode only stores pairs that were actually drawn,
+    as sorted key (giver * n + receiver) and count arrays merged with NumPy. Pass the expected
+    number of `trials` to pick the cheaper mode; without it the matrix is used.
+    """
+    def __init__(self, n: int, sparse: Optional[bool] = None, trials: Optional[int] = None):
+        self.n = n
+        if sparse is None:
+            sparse = n >= SPARSE_MIN_N and trials is not None and trials * n <= SPARSE_MAX_FILL * n * n
+        self.sparse = sparse
+        self.trials = 0
+        if self.sparse:
+            self.keys = np.zeros(0, dtype=np.int64)
+            self.values = np.zeros(0, dtype=np.uint32)
+            self._pending: List[np.ndarray] = []
+            self._pending_size = 0
+        else:
+            self.counts = np.zeros((n, n), dtype=np.uint32)
+
+    def update(self, receivers: Sequence[int]) -> None:
+        """Add one assignment, given as receivers[giver] indices"""
+        n = self.n
+        if self.sparse:
+            self._pending.append(np.arange(n, dtype=np.int64) * n + np.asarray(receivers, dtype=np.int64))
+            self._pending_size += n
+            if self._pending_size >= _SPARSE_BUFFER:
+                self._flush()
+        else:
+            self.counts[np.arange(n), np.asarray(receivers)] += 1
+        self.trials += 1
+
+    def update_batch(self, batch: np.ndarray) -> None:
+        """Add a (size, n) array of assignments"""
+        n = self.n
+        flat = (np.arange(n, dtype=np.int64) * n + batch).ravel()
+        if self.sparse:
+            self._merge(flat)
+        else:
+            self.counts += np.bincount(flat, minlength=n * n).reshape(n, n).astype(np.uint32)
+        self.trials += len(batch)
+
+    def _merge(self, flat: np.ndarray) -> None:
+        """Add the pairs in `flat` to the sorted arrays; only the new keys cost a copy"""
+        keys, counts = np.unique(flat, return_counts=True)
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+        self.values[positions[found]] += counts[found].astype(np.uint32)
+        new = ~found
+        self.keys = np.insert(self.keys, positions[new], keys[new])
+        self.values = np.insert(self.values, positions[new], counts[new].astype(np.uint32))
+
+    def _flush(self) -> None:
+        if self.sparse and self._pending:
+            self._merge(np.concatenate(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def __getstate__(self) -> dict:
+        # Checkpoints pickle the accumulator; fold buffered assignments in first
+        self._flush()
+        return self.__dict__
+
+    def count(self, giver: int, receiver: int) -> int:
+        if self.sparse:
+            self._flush()
+            key = giver * self.n + receiver
+            i = int(np.searchsorted(self.keys, key))
+            return int(self.values[i]) if i < len(self.keys) and self.keys[i] == key else 0
+        return int(self.counts[giver, receiver])
+
+    def to_dense(self) -> np.ndarray:
+        if not self.sparse:
+            return self.counts.astype(np.int64)
+        self._flush()
+        dense = np.zeros(self.n * self.n, dtype=np.int64)
+        dense[self.keys] = self.values
+        return dense.reshape(self.n, self.n)
+
+    def max_deviation(self) -> float:
+        """Largest gap (percentage points) between any pairing and the uniform 1/(n-1)"""
+        expected = 100.0 / (self.n - 1)
+        if not self.sparse:
+            from utils.batch_sampler import max_deviation
+            return max_deviation(self.counts.astype(np.int64), self.trials)
+        self._flush()
+        deviation = float(np.abs(self.values / self.trials * 100 - expected).max()) if len(self.values) else 0.0
+        # Pairs never drawn sit at 0%
+        if len(self.keys) < self.n * (self.n - 1):
+            deviation = max(deviation, expected)
+        return deviation
+
+def _save_checkpoint(path: Path, state: dict) -> None:
+    tmp_path = path.with_name(path.name + '.tmp')
+    with tmp_path.open('wb') as f:
+        pickle.dump(state, f)
+    os.replace(tmp_path, path)
+
+def run_study(algo: Union[Callable, str],
+              n: int,
+              total_runs: int,
+              checkpoint_path: Optional[str] = None,
+              checkpoint_every: int = 100_000,
+              seed_value: int = 0,
+              chunk_size: int = 10_000,
+              sparse: Optional[bool] = None) -> PairingAccumulator:
+    """Stream `total_runs` assignments from `algo` into a PairingAccumulator, checkpointing to disk
+
+    If `checkpoint_path` holds a checkpoint of the same study, the run resumes from it. The
+    RNG state is saved with the counts and chunks are always drawn in the same sizes, so a
+    resumed study ends with exactly the counts an uninterrupted one would have.
+    """
+    algo = assignment_algorithms.get_algorithm(algo) if isinstance(algo, str) else algo
+    algo_name = algo.__name__
+    batch = hasattr(algo, 'batch')
+    study = {'algorithm': algo_name, 'n': n, 'total_runs': total_runs, 'seed': seed_value}
+
+    accumulator = PairingAccumulator(n, sparse, trials=total_runs)
+    if batch:
+        generator = np.random.default_rng(seed_value)
+    else:
+        rng = random.Random(seed_value)
+
+    path = Path(checkpoint_path) if checkpoint_path else None
+    if path is not None and path.exists():
+        with path.open('rb') as f:
+            checkpoint = pickle.load(f)
+        if checkpoint['study'] != study:
+            raise ValueError(f"Checkpoint {path} belongs to a different study: {checkpoint['study']}")
+        chunk_size = checkpoint['chunk_size']
+        accumulator = checkpoint['accumulator']
+        if batch:
+            generator.bit_generator.state = checkpoint['rng_state']
+        else:
+            rng.setstate(checkpoint['rng_state'])
+
+    since_checkpoint = 0
+    while accumulator.trials < total_runs:
+        size = min(chunk_size, total_runs - accumulator.trials)
+        if batch:
+            accumulator.update_batch(algo.batch(n, size, generator))
+        else:
+            for _ in range(size):
+                accumulator.update(algo.indices(n, rng=rng))
+
+        since_checkpoint += size
+        if path is not None and (since_checkpoint >= checkpoint_every or accumulator.trials >= total_runs):
+            _save_checkpoint(path, {
+                'study': study,
+                'chunk_size': chunk_size,
+                'accumulator': accumulator,
+                'rng_state': generator.bit_generator.state if batch else rng.getstate(),
+            })
+            since_checkpoint = 0
+    return accumulator
@@ -1,45 +1,97 @@
 import random
-from typing import List, Dict, Callable
+import threading
+from array import array
+from typing import List, Dict, Callable, Iterable, Optional, Sequence, TYPE_CHECKING
+from functools import wraps
 from time import time
-from random import shuffle, seed, choice
+from concurrent.futures import Executor, ThreadPoolExecutor
 
-def set_seed(seed_value: int | None):
-    if seed_value is not None:
-        seed(seed_value)
-        print(f"Seeding with {seed_value}")
+if TYPE_CHECKING:
+    import numpy as np
+
+# NumPy and the batch engine are imported on first use so that importing the algorithms stays cheap
+
+# Callbacks run with the algorithm name whenever a rejection-sampling algorithm throws away
+# an attempt and starts over (used by the exact analyzer and for restart counts)
+restart_hooks: List[Callable[[str], None]] = []
+
+def note_restart(algorithm_name: str) -> None:
+    for hook in restart_hooks:
+        hook(algorithm_name)
+
+def make_rng(seed_value: int | None = None) -> random.Random:
+    """Generator owned by a single call; random.Random(seed) yields the same stream random.seed(seed) did"""
+    return random.Random(seed_value)
+
+class Participants:
+    """Sorted family IDs and their dense integer indices, built once and reused across calls
+
+    The algorithms only ever see indices 0..n-1 and return receivers as a compact array;
+    family IDs are mapped in and out here, at the boundary.
+    """
+    __slots__ = ('ids', 'index')
+
+    def __init__(self, family_ids: Iterable[str]):
+        self.ids = tuple(sorted(family_ids))
+        self.index = {fid: i for i, fid in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def to_dict(self, receivers: Sequence[int]) -> Dict[str, str]:
+        ids = self.ids
+        return {giver: ids[r] for giver, r in zip(ids, receivers)}
+
+    def to_receivers(self, assignments: Dict[str, str]) -> array:
+        index = self.index
+        return array('i', [index[assignments[giver]] for giver in self.ids])
 
 def algorithm_wrapper(func: Callable) -> Callable:
-    """Wrapper to ensure family_ids are sorted before running the algorithm"""
-    def wrapped(family_ids: List[str], seed_value: int | None = None) -> Dict[str, str]:
-        sorted_ids = sorted(family_ids)
-        return func(sorted_ids, seed_value)
+    """Wrapper to map family IDs to sorted indices and give the algorithm its own generator
+
+    `func(n, rng)` works on indices 0..n-1 and returns receivers[giver] as an array. The
+    wrapped function takes and returns family IDs; `.indices(n, seed_value, rng)` skips the
+    mapping for hot loops. Pass `rng` to continue an existing stream; otherwise a fresh
+    random.Random(seed_value) is used, so concurrent calls never share state.
+    """
+    def indices(n: int, seed_value: int | None = None, rng: random.Random | None = None) -> array:
+        return func(n, rng if rng is not None else make_rng(seed_value))
+
+    @wraps(func)
+    def wrapped(family_ids: Iterable[str] | Participants, seed_value: int | None = None,
+                rng: random.Random | None = None) -> Dict[str, str]:
+        participants = family_ids if isinstance(family_ids, Participants) else Participants(family_ids)
+        return participants.to_dict(indices(len(participants), seed_value, rng))
+    wrapped.indices = indices
+    # The set of assignments the algorithm draws from, see TARGETS
+    wrapped.target = 'derangement'
     return wrapped
 
 @algorithm_wrapper
-def random_choice_with_removal_shuffled(family_ids: List[str], seed_value: int = None) -> Dict[str, str]:
+def random_choice_with_removal_shuffled(n: int, rng: random.Random) -> array:
     """Current algorithm from assigner.py - Picks random receiver and removes from pool"""
-    set_seed(seed_value)
-    
+    givers = list(range(n))
     while True:
-        receiving_ids = family_ids.copy()
-        shuffle(family_ids)
+        receiving = givers.copy()
+        rng.shuffle(givers)
         valid = True
-        assignments = {}
+        receivers = array('i', bytes(4 * n))
 
-        for giver in family_ids:
-            possible_receivers = [r for r in receiving_ids if r != giver]
+        for giver in givers:
+            possible_receivers = [r for r in receiving if r != giver]
             if not possible_receivers:
                 valid = False
                 break
-            receiver = choice(possible_receivers)
-            assignments[giver] = receiver
-            receiving_ids.remove(receiver)
+            receiver = rng.choice(possible_receivers)
+            receivers[giver] = receiver
+            receiving.remove(receiver)
         
         if valid:
-            return assignments
+            return receivers
+        note_restart('random_choice_with_removal_shuffled')
 
 @algorithm_wrapper
-def random_choice_with_removal_no_shuffle(family_ids: List[str], seed_value: int) -> Dict[str, str]:
+def random_choice_with_removal_no_shuffle(n: int, rng: random.Random) -> array:
     """Alternative implementation of random choice with removal
     
     INVALID ALGORITHM:
@@ -52,27 +104,27 @@ def random_choice_with_removal_no_shuffle(family_ids: List[str], seed_value: int
     - C>B>A happens 33.3% of the time
 
     """
-    set_seed(seed_value)
-    
+    givers = list(range(n))
     while True:
-        receiving_ids = family_ids.copy()
+        receiving = givers.copy()
         valid = True
-        assignments = {}
+        receivers = array('i', bytes(4 * n))
         
-        for giver in family_ids:
-            possible_receivers = [r for r in receiving_ids if r != giver]
+        for giver in givers:
+            possible_receivers = [r for r in receiving if r != giver]
             if not possible_receivers:
                 valid = False
                 break
-            receiver = random.choice(possible_receivers)
-            assignments[giver] = receiver
-            receiving_ids.remove(receiver)
+            receiver = rng.choice(possible_receivers)
+            receivers[giver] = receiver
+            receiving.remove(receiver)
         
         if valid:
-            return assignments
+            return receivers
+        note_restart('random_choice_with_removal_no_shuffle')
 
 @algorithm_wrapper
-def smart_last_choice_with_shuffle(family_ids: List[str], seed_value: int) -> Dict[str, str]:
+def smart_last_choice_with_shuffle(n: int, rng: random.Random) -> array:
     """
     INVALID ALGORITHM WITHOUT SHUFFLE:
         WORKS FOR n = 3
@@ -82,28 +134,30 @@ def smart_last_choice_with_shuffle(family_ids: List[str], seed_value: int) -> Di
         Problem: C will disproportionately need to choose D to make a valid pairing
 
     """
-    set_seed(seed_value)
-    
-    receiving_ids = family_ids.copy()
-    shuffle(family_ids)
-    assignments = {}
+    givers = list(range(n))
+    receiving = givers.copy()
+    rng.shuffle(givers)
+    receivers = array('i', bytes(4 * n))
     
-    for giver in family_ids:
-        possible_receivers = [r for r in receiving_ids if r != giver]
-        if len(receiving_ids) == 2 and family_ids[-1] in possible_receivers:
-            receiver = family_ids[-1]
+    for giver in givers:
+        possible_receivers = [r for r in receiving if r != giver]
+        if len(receiving) == 2 and givers[-1] in possible_receivers:
+            receiver = givers[-1]
         else:
-            receiver = random.choice(possible_receivers)
-        assignments[giver] = receiver
-        receiving_ids.remove(receiver)
+            receiver = rng.choice(possible_receivers)
+        receivers[giver] = receiver
+        receiving.remove(receiver)
     
-    return assignments
+    return receivers
 
 def validate_assignments(family_ids, assignments: Dict[str, str]) -> bool:
     return all(assignments[giver] != giver for giver in assignments) and len(assignments) == len(family_ids)
 
+def validate_receivers(receivers: Sequence[int]) -> bool:
+    return len(set(receivers)) == len(receivers) and all(r != giver for giver, r in enumerate(receivers))
+
 @algorithm_wrapper
-def shuffle_first_valid(family_ids: List[str], seed_value: int) -> Dict[str, str]:
+def shuffle_first_valid(n: int, rng: random.Random) -> array:
     """Shuffle receivers and take first valid option
     
     INVALID ALGORITHM:
@@ -122,115 +176,400 @@ def shuffle_first_valid(family_ids: List[str], seed_value: int) -> Dict[str, str
     | [C, B, A] | A → C, B → A, C → B | CBA
 
     """
-    set_seed(seed_value)
-    
+    givers = list(range(n))
     while True:
-        receiving_ids = family_ids.copy()
-        shuffle(receiving_ids)
+        receiving = givers.copy()
+        rng.shuffle(receiving)
         valid = True
-        assignments = {}
+        receivers = array('i', bytes(4 * n))
         
-        for giver in family_ids:
-            possible_receivers = [r for r in receiving_ids if r != giver]
+        for giver in givers:
+            possible_receivers = [r for r in receiving if r != giver]
             if not possible_receivers:
                 valid = False
                 break
             receiver = possible_receivers[0]
-            assignments[giver] = receiver
-            receiving_ids.remove(receiver)
+            receivers[giver] = receiver
+            receiving.remove(receiver)
         
         if valid:
-            return assignments
+            return receivers
+        note_restart('shuffle_first_valid')
 
 @algorithm_wrapper
-def double_shuffle(family_ids: List[str], seed_value: int) -> Dict[str, str]:
+def double_shuffle(n: int, rng: random.Random) -> array:
     """Shuffle receivers and take first valid option"""
-    set_seed(seed_value)
-    
+    givers = list(range(n))
     while True:
-        receiving_ids = family_ids.copy()
-        shuffle(receiving_ids)
-        shuffle(family_ids)
+        receiving = givers.copy()
+        rng.shuffle(receiving)
+        rng.shuffle(givers)
         valid = True
-        assignments = {}
+        receivers = array('i', bytes(4 * n))
         
-        for giver in family_ids:
-            possible_receivers = [r for r in receiving_ids if r != giver]
+        for giver in givers:
+            possible_receivers = [r for r in receiving if r != giver]
             if not possible_receivers:
                 valid = False
                 break
             receiver = possible_receivers[0]
-            assignments[giver] = receiver
-            receiving_ids.remove(receiver)
+            receivers[giver] = receiver
+            receiving.remove(receiver)
         
         if valid:
-            return assignments
+            return receivers
+        note_restart('double_shuffle')
 
 @algorithm_wrapper
-def shuffle_and_zip(family_ids: List[str], seed_value: int) -> Dict[str, str]:
+def shuffle_and_zip(n: int, rng: random.Random) -> array:
     """Simple shuffle and zip approach - Shuffles once and zips with original"""
-    set_seed(seed_value)
-
+    givers = list(range(n))
     while True:
-        receiving_ids = family_ids.copy()
-        shuffle(receiving_ids)
+        receiving = givers.copy()
+        rng.shuffle(receiving)
+
+        if all(giver != receiver for giver, receiver in zip(givers, receiving)):
+            return array('i', receiving)
+        note_restart('shuffle_and_zip')
+
+# _refusal_probabilities[u] = (u-1) * D(u-2) / D(u), the chance that the element closed off
+# while u elements remain unsettled ends up in a 2-cycle (D = number of derangements).
+# With d(m) = D(m) / m! this is d(u-2) / (u * d(u)), and d(m) = ((m-1) * d(m-1) + d(m-2)) / m
+# stays between 1/3 and 1/2, so the table is exact up to float rounding for any n.
+_scaled_derangements = [1.0, 0.0]
+_refusal_probabilities = [0.0, 0.0]
+# Tables are grown on copies under this lock and published whole, so samplers running on
+# other threads (generate_many) only ever see complete tables
+_table_lock = threading.Lock()
+
+def _refusal_probability_table(n: int) -> List[float]:
+    global _scaled_derangements, _refusal_probabilities
+    table = _refusal_probabilities
+    if len(table) > n:
+        return table
+    with _table_lock:
+        scaled, table = list(_scaled_derangements), list(_refusal_probabilities)
+        while len(scaled) <= n:
+            m = len(scaled)
+            scaled.append(((m - 1) * scaled[m - 1] + scaled[m - 2]) / m)
+            table.append(scaled[m - 2] / (m * scaled[m]))
+        _scaled_derangements, _refusal_probabilities = scaled, table
+    return table
+
+@algorithm_wrapper
+def early_refusal_derangement(n: int, rng: random.Random) -> array:
+    """Martinez-Panholzer-Prodinger early-refusal sampler - exactly uniform, O(n), no restarts
+
+    Walks a Sattolo-style swap from the last position down. Each swap closes the current
+    position into a cycle; with probability (u-1)D(u-2)/D(u) the partner is closed off too,
+    which is exactly how often a uniform derangement of the u unsettled elements puts them
+    in a 2-cycle (Martinez, Panholzer & Prodinger, 2008). The paper refuses and redraws
+    partners that were already closed off; here partners are drawn straight from a
+    swap-remove pool of the open positions, which gives the same distribution with exactly
+    one draw per swap and a finite decision tree for the exact analyzer.
+    """
+    if n < 2:
+        raise ValueError("Need at least 2 participants to make a derangement")
+    refusal_probabilities = _refusal_probability_table(n)
+
+    receivers = array('i', range(n))
+    marked = [False] * n
+    # Open positions below i, with each position's index in the pool for O(1) removal
+    pool = list(range(n))
+    pool_index = list(range(n))
+
+    def close(k: int) -> None:
+        last = pool.pop()
+        if last != k:
+            pool[pool_index[k]] = last
+            pool_index[last] = pool_index[k]
+
+    i = n - 1
+    unsettled = n
+    while unsettled >= 2:
+        if not marked[i]:
+            close(i)
+            j = pool[rng.randrange(len(pool))]
+            receivers[i], receivers[j] = receivers[j], receivers[i]
+            if rng.random() < refusal_probabilities[unsettled]:
+                marked[j] = True
+                close(j)
+                unsettled -= 1
+            unsettled -= 1
+        i -= 1
+
+    return receivers
+
+def batched_algorithm(batch_func: Callable) -> Callable:
+    """Expose a batch sampler as a regular algorithm; evaluate_algorithm uses `.batch` directly"""
+    def indices(n: int, seed_value: int | None = None, rng: random.Random | None = None) -> "np.ndarray":
+        from utils.batch_sampler import make_generator
+        # A random.Random stream seeds a NumPy generator so `rng` works the same as for other algorithms
+        generator = make_generator(rng.getrandbits(64) if rng is not None else seed_value)
+        return batch_func(n, 1, generator)[0]
+
+    @wraps(batch_func)
+    def wrapped(family_ids: Iterable[str] | Participants, seed_value: int | None = None,
+                rng: random.Random | None = None) -> Dict[str, str]:
+        participants = family_ids if isinstance(family_ids, Participants) else Participants(family_ids)
+        return participants.to_dict(indices(len(participants), seed_value, rng).tolist())
+    wrapped.batch = batch_func
+    wrapped.indices = indices
+    wrapped.target = 'derangement'
+    return wrapped
+
+@batched_algorithm
+def numpy_batch_rejection(n: int, size: int, rng: "np.random.Generator") -> "np.ndarray":
+    """Draws whole blocks of permutations with NumPy and drops rows with a fixed point"""
+    from utils.batch_sampler import batch_derangements
+    return batch_derangements(n, size, rng)
+
+@algorithm_wrapper
+def sattolo_single_cycle(n: int, rng: random.Random) -> array:
+    """Sattolo's algorithm - a uniformly random single n-cycle in O(n), no restarts
+
+    Everyone is on one gift chain (A -> B -> C -> ... -> A), so no subgroup closes off.
+    """
+    if n < 2:
+        raise ValueError("Need at least 2 participants to make a derangement")
+    receivers = array('i', range(n))
+    for i in range(n - 1, 0, -1):
+        j = rng.randrange(i)
+        receivers[i], receivers[j] = receivers[j], receivers[i]
+    return receivers
+
+sattolo_single_cycle.target = 'single_cycle'
+
+# _three_cycle_probabilities[m] = (m-1)(m-2) A(m-3) / A(m), where A(m) counts permutations of
+# m elements whose cycles all have length >= 3: the chance that the last of m elements sits
+# in a 3-cycle. With b(m) = A(m) / m!, A(m) = (m-1) A(m-1) + (m-1)(m-2) A(m-3) becomes
+# b(m) = ((m-1) b(m-1) + b(m-3)) / m and the probability is b(m-3) / (m b(m)).
+_scaled_no_two_cycle_counts = [1.0, 0.0, 0.0]
+_three_cycle_probabilities = [0.0, 0.0, 0.0]
+
+def _three_cycle_probability_table(n: int) -> List[float]:
+    global _scaled_no_two_cycle_counts, _three_cycle_probabilities
+    table = _three_cycle_probabilities
+    if len(table) > n:
+        return table
+    with _table_lock:
+        counts, table = list(_scaled_no_two_cycle_counts), list(_three_cycle_probabilities)
+        while len(counts) <= n:
+            m = len(counts)
+            counts.append(((m - 1) * counts[m - 1] + counts[m - 3]) / m)
+            table.append(counts[m - 3] / (m * counts[m]))
+        _scaled_no_two_cycle_counts, _three_cycle_probabilities = counts, table
+    return table
+
+@algorithm_wrapper
+def no_two_cycle_derangement(n: int, rng: random.Random) -> array:
+    """Uniform derangement with no reciprocal pairs (never A -> B and B -> A), O(n), no restarts
+
+    Rejection sampling would throw away all but about e^(-3/2) = 22% of permutations. Instead
+    the last remaining element either closes a 3-cycle with two random others (with its exact
+    probability under the recurrence above) or is set aside to be inserted after a random
+    element of the structure built from the rest. Decisions are replayed in reverse, so each
+    insertion picks uniformly from exactly the elements that were left at its turn.
+    """
+    if n < 3:
+        raise ValueError("Need at least 3 participants to avoid reciprocal pairs")
+    three_cycle_probabilities = _three_cycle_probability_table(n)
+
+    pool = list(range(n))
+    decisions = []
+    while pool:
+        x = pool.pop()
+        if rng.random() < three_cycle_probabilities[len(pool) + 1]:
+            k = rng.randrange(len(pool))
+            pool[k], pool[-1] = pool[-1], pool[k]
+            y = pool.pop()
+            k = rng.randrange(len(pool))
+            pool[k], pool[-1] = pool[-1], pool[k]
+            z = pool.pop()
+            decisions.append((x, y, z))
+        else:
+            decisions.append((x,))
+
+    receivers = array('i', range(n))
+    placed = []
+    for decision in reversed(decisions):
+        if len(decision) == 3:
+            x, y, z = decision
+            receivers[x], receivers[y], receivers[z] = y, z, x
+            placed.extend(decision)
+        else:
+            x = decision[0]
+            u = placed[rng.randrange(len(placed))]
+            receivers[x] = receivers[u]
+            receivers[u] = x
+            placed.append(x)
+    return receivers
+
+no_two_cycle_derangement.target = 'no_two_cycles'
+
+def _cycle_lengths(receivers: Sequence[int]) -> List[int]:
+    seen = [False] * len(receivers)
+    lengths = []
+    for start in range(len(receivers)):
+        length = 0
+        i = start
+        while not seen[i]:
+            seen[i] = True
+            i = receivers[i]
+            length += 1
+        if length:
+            lengths.append(length)
+    return lengths
+
+def _count_single_cycles(n: int) -> int:
+    count = 1
+    for m in range(2, n):
+        count *= m
+    return count if n >= 2 else 0
+
+def _count_permutations_with_min_cycle(n: int, shortest: int) -> int:
+    """Permutations of n elements whose cycles are all at least `shortest` long"""
+    counts = [1]
+    for m in range(1, n + 1):
+        # Choose the cycle holding element m: its length k and the ordered others in it
+        total = 0
+        ways = 1
+        for k in range(1, m + 1):
+            if k > 1:
+                ways *= m - k + 1
+            if k >= shortest:
+                total += ways * counts[m - k]
+        counts.append(total)
+    return counts[n]
+
+# target -> (number of valid assignments of n participants, membership test on receivers)
+TARGETS: Dict[str, tuple] = {
+    'derangement': (lambda n: _count_permutations_with_min_cycle(n, 2),
+                    lambda receivers: min(_cycle_lengths(receivers), default=0) >= 2),
+    'single_cycle': (_count_single_cycles,
+                     lambda receivers: len(_cycle_lengths(receivers)) == 1 and len(receivers) >= 2),
+    'no_two_cycles': (lambda n: _count_permutations_with_min_cycle(n, 3),
+                      lambda receivers: min(_cycle_lengths(receivers), default=0) >= 3),
+}
 
-        if all(giver != receiver for giver, receiver in zip(family_ids, receiving_ids)):
-            return dict(zip(family_ids, receiving_ids))
+def target_count(algo: Callable, n: int) -> int:
+    return TARGETS[algo.target][0](n)
 
-best_algorithm = random_choice_with_removal_shuffled
+def in_target(algo: Callable, receivers: Sequence[int]) -> bool:
+    """Is `receivers` (a permutation of 0..n-1) one of the assignments `algo` is meant to produce"""
+    return len(set(receivers)) == len(receivers) and TARGETS[algo.target][1](list(receivers))
+
+best_algorithm = early_refusal_derangement
+
+ALGORITHMS = [
+    smart_last_choice_with_shuffle,
+    random_choice_with_removal_shuffled,
+    double_shuffle,
+    shuffle_and_zip,
+    random_choice_with_removal_no_shuffle,
+    shuffle_first_valid,
+    numpy_batch_rejection,
+    early_refusal_derangement,
+    sattolo_single_cycle,
+    no_two_cycle_derangement,
+]
+
+# Name -> algorithm, for selecting one from the config (`algorithm:`) or the command line
+REGISTRY: Dict[str, Callable] = {algo.__name__: algo for algo in ALGORITHMS}
+ALIASES = {
+    'default': best_algorithm.__name__,
+    'single_cycle': sattolo_single_cycle.__name__,
+    'no_reciprocal': no_two_cycle_derangement.__name__,
+}
+
+def register_algorithm(algo: Callable) -> Callable:
+    """Make an algorithm_wrapper/batched_algorithm function selectable by name"""
+    if algo not in ALGORITHMS:
+        ALGORITHMS.append(algo)
+    REGISTRY[algo.__name__] = algo
+    return algo
+
+def get_algorithm(name: Optional[str] = None) -> Callable:
+    """Registered algorithm by name or alias; None gives best_algorithm"""
+    if name is None:
+        return best_algorithm
+    algo = REGISTRY.get(ALIASES.get(name, name))
+    if algo is None:
+        raise ValueError(f"Unknown algorithm {name!r}; choose from {sorted(set(REGISTRY) | set(ALIASES))}")
+    return algo
+
+def generate_many(groups: List[List[str]],
+                  seeds: List[int | None],
+                  algo: Callable = None,
+                  workers: int | None = None,
+                  executor: Executor | None = None) -> List[Dict[str, str]]:
+    """Assignments for many independent groups, computed concurrently
+
+    Every call owns its generator, so result i is exactly algo(groups[i], seeds[i]) as the
+    serial path would compute it, in input order. Threads are used by default; pass a
+    ProcessPoolExecutor for CPU-bound batches of large groups.
+    """
+    if len(groups) != len(seeds):
+        raise ValueError(f"Got {len(groups)} groups but {len(seeds)} seeds")
+    algo = algo or best_algorithm
+    if executor is not None:
+        return list(executor.map(algo, groups, seeds))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(algo, groups, seeds))
 
 def evaluate_algorithm(algo: Callable, family_count: int, total_runs: int = 1000) -> tuple:
-    """Evaluate algorithm performance and distribution"""
-    family_ids = [str(i) for i in range(family_count)]
-    
+    """Evaluate algorithm performance and distribution
+
+    Pairings are counted into a family_count x family_count matrix; algorithms with a
+    `.batch` sampler fill it a block of assignments at a time instead of one call per run.
+    """
+    from utils.accumulator import PairingAccumulator
+    from utils.batch_sampler import batch_pairing_counts, make_generator, max_deviation
+
     # Track timing
     start_time = time()
     
-    # Initialize tracking dictionary for all possible pairings
-    pairing_counts = {}
-    for giver in family_ids:
-        pairing_counts[giver] = {receiver: 0 for receiver in family_ids if receiver != giver}
-    
-    # Run assignments
-    for seed_value in range(total_runs):
-        assignments = algo(family_ids, seed_value=seed_value)
-        assert validate_assignments(family_ids, assignments)
-
-        # Count each pairing
-        for giver, receiver in assignments.items():
-            pairing_counts[giver][receiver] += 1
+    if hasattr(algo, 'batch'):
+        pairing_counts = batch_pairing_counts(algo.batch, family_count, total_runs, make_generator(0))
+    else:
+        accumulator = PairingAccumulator(family_count)
+
+        # Run assignments on indices; no family IDs are needed to count pairings
+        for seed_value in range(total_runs):
+            receivers = algo.indices(family_count, seed_value=seed_value)
+            assert validate_receivers(receivers)
+            accumulator.update(receivers)
+        pairing_counts = accumulator.to_dense()
     
     elapsed_time = time() - start_time
     
     # Calculate distribution statistics
-    expected_percentage = 100.0 / (family_count - 1)
-    max_deviation = 0
-    
-    for giver in family_ids:
-        for receiver, count in pairing_counts[giver].items():
-            percentage = (count / total_runs) * 100
-            deviation = abs(percentage - expected_percentage)
-            max_deviation = max(max_deviation, deviation)
-    
-    return elapsed_time, max_deviation
+    return elapsed_time, max_deviation(pairing_counts, total_runs)
 
 if __name__ == "__main__":
-    algorithms = [
-        smart_last_choice_with_shuffle,
-        random_choice_with_removal_shuffled,
-        double_shuffle,
-        shuffle_and_zip,
-        random_choice_with_removal_no_shuffle,
-        shuffle_first_valid,
-    ]
-    TRIALS = 100000
-    N = 4
+    import argparse
+    parser = argparse.ArgumentParser(description='Compare assignment algorithms')
+    parser.add_argument('--n', type=int, default=4, help='Number of participants (default: 4)')
+    parser.add_argument('--trials', type=int, default=100000, help='Assignments per algorithm (default: 100000)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Shard trials across this many processes (default: 1, serial)')
+    parser.add_argument('--seed', type=int, default=0, help='Master seed for parallel runs (default: 0)')
+    args = parser.parse_args()
+
+    algorithms = ALGORITHMS
+    TRIALS = args.trials
+    N = args.n
+    if args.workers > 1:
+        from utils.parallel import parallel_evaluate_algorithm
     print(f"Evaluating algorithms with {N} participants over {TRIALS} trials:")
     print("-" * 60)
     print(f"{'Algorithm':<30} {'Time (s)':<15} {'Max Deviation %'}")
     print("-" * 60)
     
     for algo in algorithms:
-        time_taken, deviation = evaluate_algorithm(algo, family_count=N, total_runs=TRIALS)
+        if args.workers > 1:
+            time_taken, deviation = parallel_evaluate_algorithm(algo.__name__, family_count=N, total_runs=TRIALS,
+                                                                master_seed=args.seed, workers=args.workers)
+        else:
+            time_taken, deviation = evaluate_algorithm(algo, family_count=N, total_runs=TRIALS)
         print(f"{algo.__name__:<30} {time_taken:<15.3f} {deviation:.2f}")
\ No newline at end of file
@@ -0,0 +1,66 @@
+import numpy as np
+from typing import Callable, Optional
+
+# Rows generated per chunk are capped so a chunk holds roughly this many entries
+CHUNK_ENTRIES = 1 << 22
+
+def make_generator(seed_value: Optional[int] = None) -> np.random.Generator:
+    return np.random.default_rng(seed_value)
+
+def batch_derangements(n: int, size: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """Draw `size` uniform derangements of range(n) as a (size, n) integer array
+
+    Row r maps giver index i to receiver index out[r, i]. Whole blocks of uniform
+    permutations are drawn at once and rows with a fixed point are discarded, so every
+    surviving row is uniform over the derangements (about 1/e of the rows survive).
+    """
+    if n < 2:
+        raise ValueError("Need at least 2 participants to make a derangement")
+    rng = rng if rng is not None else make_generator()
+
+    identity = np.arange(n)
+    out = np.empty((size, n), dtype=np.int64)
+    filled = 0
+    while filled < size:
+        # Oversample by ~e so that most requests are filled in a single pass
+        rows = min(max(int((size - filled) * 2.8) + 16, 64), max(CHUNK_ENTRIES // n, 1))
+        perms = rng.permuted(np.broadcast_to(identity, (rows, n)), axis=1)
+        perms = perms[~(perms == identity).any(axis=1)]
+        take = min(len(perms), size - filled)
+        out[filled:filled + take] = perms[:take]
+        filled += take
+    return out
+
+def pairing_matrix(batch: np.ndarray, n: int) -> np.ndarray:
+    """Count giver->receiver pairings of a (size, n) batch into an n x n matrix"""
+    flat = (np.arange(n) * n + batch).ravel()
+    return np.bincount(flat, minlength=n * n).reshape(n, n)
+
+def batch_pairing_counts(batch_func: Callable[[int, int, np.random.Generator], np.ndarray],
+                         n: int,
+                         total_runs: int,
+                         rng: Optional[np.random.Generator] = None,
+                         chunk_size: Optional[int] = None) -> np.ndarray:
+    """Draw `total_runs` assignments from `batch_func` chunk by chunk and return the n x n pairing counts
+
+    `batch_func(n, size, rng)` is a batch sampler such as batch_derangements, or the `.batch`
+    of any algorithm built with batched_algorithm.
+    """
+    rng = rng if rng is not None else make_generator()
+    chunk_size = chunk_size or max(CHUNK_ENTRIES // n, 1)
+
+    counts = np.zeros((n, n), dtype=np.int64)
+    remaining = total_runs
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        counts += pairing_matrix(batch_func(n, size, rng), n)
+        remaining -= size
+    return counts
+
+def max_deviation(counts: np.ndarray, total_runs: int) -> float:
+    """Largest absolute gap (in percentage points) between any pairing and the uniform 1/(n-1)"""
+    n = counts.shape[0]
+    expected_percentage = 100.0 / (n - 1)
+    off_diagonal = ~np.eye(n, dtype=bool)
+    percentages = counts[off_diagonal] / total_runs * 100
+    return float(np.abs(percentages - expected_percentage).max())
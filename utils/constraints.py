@@ -0,0 +1,196 @@
+import math
+import random
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Union
+from utils.assignment_algorithms import Participants, make_rng
+
+class InfeasibleConstraintsError(ValueError):
+    """Raised when no assignment satisfies the exclusion graph
+
+    `blocked` is a set of givers that together can reach fewer receivers than there are
+    givers in the set (a Hall violator), which is the reason no assignment exists.
+    """
+    def __init__(self, blocked: List[str], reachable: List[str]):
+        self.blocked = blocked
+        self.reachable = reachable
+        super().__init__(
+            f"No valid assignment: {len(blocked)} givers {sorted(blocked)} can only give to "
+            f"{len(reachable)} receivers {sorted(reachable)}"
+        )
+
+def build_exclusion_graph(config: dict, family_ids: List[str]) -> Dict[str, Set[str]]:
+    """Map every giver to the receivers it may not draw (always including itself)
+
+    Reads the optional `exclusion_graph` section of the config:
+        groups: lists of family IDs that never give to each other (households, branches)
+        forbidden: giver -> list of receivers that giver never draws
+    Families that aren't taking part this year are ignored.
+    """
+    participants = set(family_ids)
+    forbidden = {fid: {fid} for fid in family_ids}
+    graph_config = config.get('exclusion_graph') or {}
+
+    for group in graph_config.get('groups') or []:
+        members = [str(fid) for fid in group if str(fid) in participants]
+        for giver in members:
+            forbidden[giver].update(members)
+
+    for giver, receivers in (graph_config.get('forbidden') or {}).items():
+        giver = str(giver)
+        if giver in participants:
+            forbidden[giver].update(str(r) for r in receivers if str(r) in participants)
+
+    return forbidden
+
+def has_exclusion_graph(config: dict) -> bool:
+    graph_config = config.get('exclusion_graph') or {}
+    return bool(graph_config.get('groups') or graph_config.get('forbidden'))
+
+def _augment(giver: int, receiver_of: List[int], giver_of: List[int], forbidden: List[Set[int]],
+             order: List[int]) -> Optional[Set[int]]:
+    """Extend the matching along a shortest alternating path starting at `giver`
+
+    Neighbours are "every receiver not forbidden", enumerated implicitly so dense graphs
+    never get materialised. Returns None on success, otherwise the givers reached by the
+    search, which form a Hall violator.
+    """
+    parent = {}
+    seen_givers = {giver}
+    queue = deque([giver])
+    while queue:
+        g = queue.popleft()
+        for r in order:
+            if r in parent or r in forbidden[g]:
+                continue
+            parent[r] = g
+            if giver_of[r] == -1:
+                # Flip the alternating path back to the start
+                while r != -1:
+                    g = parent[r]
+                    next_r = receiver_of[g]
+                    receiver_of[g] = r
+                    giver_of[r] = g
+                    r = next_r
+                return None
+            next_giver = giver_of[r]
+            if next_giver not in seen_givers:
+                seen_givers.add(next_giver)
+                queue.append(next_giver)
+    return seen_givers
+
+def _initial_matching(n: int, forbidden: List[Set[int]], family_ids: List[str], rng: random.Random) -> List[int]:
+    """Random perfect matching: a shuffled permutation with its conflicts repaired by augmenting paths"""
+    order = list(range(n))
+    rng.shuffle(order)
+    receiver_of = [-1] * n
+    giver_of = [-1] * n
+    for g, r in enumerate(order):
+        if r not in forbidden[g]:
+            receiver_of[g] = r
+            giver_of[r] = g
+
+    for g in range(n):
+        if receiver_of[g] != -1:
+            continue
+        rng.shuffle(order)
+        blocked = _augment(g, receiver_of, giver_of, forbidden, order)
+        if blocked is not None:
+            reachable = {r for r in range(n) if any(r not in forbidden[b] for b in blocked)}
+            raise InfeasibleConstraintsError([family_ids[b] for b in blocked],
+                                             [family_ids[r] for r in reachable])
+    return receiver_of
+
+def _forbidden_indices(participants: Participants, forbidden: Dict[str, Set[str]]) -> List[Set[int]]:
+    index = participants.index
+    return [{index[r] for r in forbidden.get(fid, ()) if r in index} | {i}
+            for i, fid in enumerate(participants.ids)]
+
+def check_feasibility(family_ids: Union[Iterable[str], Participants], forbidden: Dict[str, Set[str]]) -> None:
+    """Raise InfeasibleConstraintsError up front if no assignment satisfies the exclusion graph"""
+    participants = family_ids if isinstance(family_ids, Participants) else Participants(family_ids)
+    _initial_matching(len(participants), _forbidden_indices(participants, forbidden), participants.ids, make_rng(0))
+
+def sample_constrained_derangement(family_ids: Union[Iterable[str], Participants],
+                                   forbidden: Dict[str, Set[str]],
+                                   seed_value: Optional[int] = None,
+                                   mixing_steps: Optional[int] = None,
+                                   rng: Optional[random.Random] = None) -> Dict[str, str]:
+    """Near-uniform random assignment that respects the exclusion graph
+
+    A perfect matching is found first (augmenting paths over the allowed edges, which also
+    proves infeasibility), then mixed with a Metropolis chain whose moves swap the receivers
+    of two givers or rotate the receivers of three. The moves are symmetric and invalid
+    proposals are simply rejected, so the chain's stationary distribution is uniform over
+    valid assignments. No step ever restarts from scratch.
+
+    Args:
+        family_ids: Participating family IDs, or a prebuilt Participants index
+        forbidden: Giver -> receivers it may not draw, see build_exclusion_graph
+        seed_value: Optional seed value for reproducible assignments
+        mixing_steps: Number of chain proposals (defaults to about 4 n log n)
+        rng: Generator to draw from (defaults to random.Random(seed_value))
+    """
+    rng = rng if rng is not None else make_rng(seed_value)
+
+    participants = family_ids if isinstance(family_ids, Participants) else Participants(family_ids)
+    n = len(participants)
+    if n < 2:
+        raise ValueError("Need at least 2 participants to make a derangement")
+    receiver_of = _sample_receivers(n, _forbidden_indices(participants, forbidden), participants.ids, rng,
+                                    mixing_steps)
+    return participants.to_dict(receiver_of)
+
+def _sample_receivers(n: int, forbidden_idx: List[Set[int]], family_ids: Sequence[str], rng: random.Random,
+                      mixing_steps: Optional[int] = None) -> List[int]:
+    """sample_constrained_derangement on dense indices: receiver_of[giver]"""
+    receiver_of = _initial_matching(n, forbidden_idx, family_ids, rng)
+
+    if mixing_steps is None:
+        mixing_steps = 4 * n * max(int(math.log(n)), 1) + 100
+    randrange = rng.randrange
+    for _ in range(mixing_steps):
+        a = randrange(n)
+        b = randrange(n)
+        if a == b:
+            continue
+        if randrange(2):
+            ra, rb = receiver_of[a], receiver_of[b]
+            if rb not in forbidden_idx[a] and ra not in forbidden_idx[b]:
+                receiver_of[a], receiver_of[b] = rb, ra
+        else:
+            c = randrange(n)
+            if c == a or c == b:
+                continue
+            ra, rb, rc = receiver_of[a], receiver_of[b], receiver_of[c]
+            if rb not in forbidden_idx[a] and rc not in forbidden_idx[b] and ra not in forbidden_idx[c]:
+                receiver_of[a], receiver_of[b], receiver_of[c] = rb, rc, ra
+    return receiver_of
+
+class ConstrainedSampler:
+    """The constrained sampler for one exclusion graph, shaped like a registered per-call algorithm
+
+    `indices(n, rng=rng)` returns receiver indices into the sorted family IDs, so run_study and
+    the process-pool shards of utils.parallel can sample it. Instances pickle. The name carries
+    a digest of the graph, so a checkpoint is never resumed under a different graph.
+    """
+    target = 'derangement'
+
+    def __init__(self, family_ids: Union[Iterable[str], Participants], forbidden: Dict[str, Set[str]]):
+        import hashlib
+        participants = family_ids if isinstance(family_ids, Participants) else Participants(family_ids)
+        self.family_ids = participants.ids
+        self.forbidden_idx = _forbidden_indices(participants, forbidden)
+        graph = repr((self.family_ids, [sorted(receivers) for receivers in self.forbidden_idx]))
+        self.__name__ = f"constrained_sampler[{hashlib.sha1(graph.encode()).hexdigest()[:12]}]"
+
+    def indices(self, n: int, seed_value: Optional[int] = None, rng: Optional[random.Random] = None) -> List[int]:
+        if n != len(self.family_ids):
+            raise ValueError(f"{self.__name__} samples {len(self.family_ids)} participants, not {n}")
+        rng = rng if rng is not None else make_rng(seed_value)
+        return _sample_receivers(n, self.forbidden_idx, self.family_ids, rng)
+
+def validate_constrained_assignments(family_ids: List[str], assignments: Dict[str, str],
+                                     forbidden: Dict[str, Set[str]]) -> bool:
+    return (len(assignments) == len(family_ids)
+            and len(set(assignments.values())) == len(family_ids)
+            and all(receiver not in forbidden.get(giver, {giver}) for giver, receiver in assignments.items()))
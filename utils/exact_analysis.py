@@ -0,0 +1,345 @@
+"""Exact output distribution of the assignment algorithms for small n
+
+Instead of sampling, an algorithm is run with EnumeratingRandom as its `rng`, a stand-in for
+random.Random that walks every branch of every `shuffle`/`choice`/`randrange`/`random()`
+call and tracks each branch's exact probability. Attempts that an algorithm throws away
+(reported through `note_restart`) end their branch as rejected mass. Every attempt of the
+algorithms here starts from a fresh shuffle or copy, so attempts are independent and
+identically distributed, and the final distribution is the accepted mass renormalised.
+Probabilities are exact Fractions; thresholds an algorithm compares random() against are
+taken at their exact float value.
+
+Algorithms that shuffle the givers have n! orders times every choice, far too many branches
+past n = 6. Those are instead computed by a memoised walk over the (remaining givers,
+remaining receivers) state in STATE_MODELS, which mirrors the algorithm step by step: for a
+given outcome, the receivers left are exactly those of the givers left, so a bitmask of the
+remaining givers is the whole state. A shuffled giver order makes the distribution depend
+only on the outcome's cycle type, so one outcome per cycle type is walked.
+
+    python -m utils.exact_analysis --n 8
+"""
+from collections import Counter
+from fractions import Fraction
+from functools import partial
+from itertools import permutations
+from typing import Callable, Dict, List, Optional, Tuple
+from utils import assignment_algorithms
+
+Outcome = Tuple[int, ...]
+UNIFORM_TOLERANCE = 1e-12
+
+class _Restart(Exception):
+    pass
+
+class TooManyBranches(RuntimeError):
+    pass
+
+class _UniformDraw:
+    """What EnumeratingRandom.random() returns: comparing it with a threshold p branches on
+    both outcomes, with probabilities p and 1 - p"""
+    def __init__(self, rng: "EnumeratingRandom"):
+        self._rng = rng
+
+    def __lt__(self, p: float) -> bool:
+        if p <= 0:
+            return False
+        if p >= 1:
+            return True
+        return self._rng._bernoulli(p)
+
+    def __ge__(self, p: float) -> bool:
+        return not self.__lt__(p)
+
+    def __gt__(self, p: float) -> bool:
+        # Ties have probability zero for a continuous draw
+        return not self.__lt__(p)
+
+    def __le__(self, p: float) -> bool:
+        return self.__lt__(p)
+
+class EnumeratingRandom:
+    """Replays one branch of the decision tree per run, chosen by `prefix`
+
+    Each random call is a decision with weighted options. Decisions beyond the prefix take
+    their first option and are recorded, so the caller can step to the next branch. A branch
+    making more than `max_decisions` decisions (e.g. a redraw loop, whose tree is infinite)
+    raises TooManyBranches.
+    """
+    def __init__(self, prefix: List[int], max_decisions: int = 10_000):
+        self.prefix = prefix
+        self.max_decisions = max_decisions
+        self.trace: List[int] = []
+        self.sizes: List[int] = []
+        self.numerator = 1
+        self.denominator = 1
+
+    def _position(self) -> int:
+        position = len(self.trace)
+        if position >= self.max_decisions:
+            raise TooManyBranches(f"a branch made more than {self.max_decisions} random decisions")
+        return position
+
+    def _bernoulli(self, p: float) -> bool:
+        """True with probability p (0 < p < 1), taken at its exact float value"""
+        numerator, denominator = p.as_integer_ratio()
+        position = self._position()
+        index = self.prefix[position] if position < len(self.prefix) else 0
+        self.trace.append(index)
+        self.sizes.append(2)
+        self.numerator *= numerator if index == 0 else denominator - numerator
+        self.denominator *= denominator
+        return index == 0
+
+    def _below(self, n: int) -> int:
+        if n == 1:
+            return 0
+        position = self._position()
+        index = self.prefix[position] if position < len(self.prefix) else 0
+        self.trace.append(index)
+        self.sizes.append(n)
+        self.denominator *= n
+        return index
+
+    # The subset of the random.Random API the algorithms use
+
+    def seed(self, *args, **kwargs) -> None:
+        pass
+
+    def random(self) -> _UniformDraw:
+        return _UniformDraw(self)
+
+    def randrange(self, start: int, stop: Optional[int] = None) -> int:
+        if stop is None:
+            start, stop = 0, start
+        return start + self._below(stop - start)
+
+    def randint(self, a: int, b: int) -> int:
+        return a + self._below(b - a + 1)
+
+    def choice(self, seq):
+        return seq[self._below(len(seq))]
+
+    def shuffle(self, x: list) -> None:
+        # Same Fisher-Yates walk as random.shuffle
+        for i in reversed(range(1, len(x))):
+            j = self._below(i + 1)
+            x[i], x[j] = x[j], x[i]
+
+def _raise_restart(algorithm_name: str) -> None:
+    raise _Restart(algorithm_name)
+
+def exact_distribution(algo: Callable, n: int, max_branches: int = 500_000,
+                       enumerate_branches: bool = False) -> Dict[Outcome, Fraction]:
+    """Exact probability of every assignment `algo` can return for n participants
+
+    Outcomes are receiver-index tuples: outcome[i] is the receiver of participant i.
+    Algorithms in STATE_MODELS use their state walk unless `enumerate_branches` is set.
+
+    Raises:
+        TypeError: for batch (NumPy) samplers, whose RNG can't be enumerated
+        TooManyBranches: if the decision tree has more than `max_branches` leaves, or a
+            branch never ends (redraw loops)
+    """
+    if hasattr(algo, 'batch'):
+        raise TypeError(f"{algo.__name__} draws from a NumPy generator and can't be enumerated")
+    model = STATE_MODELS.get(algo.__name__)
+    if model is not None and not enumerate_branches:
+        return _model_distribution(model, n)
+
+    # Branch probabilities repeat a lot, so tally (numerator, denominator) pairs and only
+    # build Fractions once at the end
+    accepted: Dict[Outcome, Dict[Tuple[int, int], int]] = {}
+    rejected: Dict[Tuple[int, int], int] = {}
+    prefix: List[int] = []
+    branches = 0
+
+    assignment_algorithms.restart_hooks.append(_raise_restart)
+    try:
+        while True:
+            branches += 1
+            if branches > max_branches:
+                raise TooManyBranches(f"{algo.__name__} has more than {max_branches} branches at n={n}")
+
+            stand_in = EnumeratingRandom(prefix)
+            try:
+                receivers = algo.indices(n, rng=stand_in)
+            except _Restart:
+                receivers = None
+            except TooManyBranches as e:
+                raise TooManyBranches(f"{algo.__name__} at n={n}: {e}") from None
+            probability = (stand_in.numerator, stand_in.denominator)
+            if receivers is None:
+                tally = rejected
+            else:
+                tally = accepted.setdefault(tuple(receivers), {})
+            tally[probability] = tally.get(probability, 0) + 1
+
+            # Odometer step to the next unexplored branch
+            trace, sizes = stand_in.trace, stand_in.sizes
+            position = len(trace) - 1
+            while position >= 0 and trace[position] + 1 >= sizes[position]:
+                position -= 1
+            if position < 0:
+                break
+            prefix = trace[:position] + [trace[position] + 1]
+    finally:
+        assignment_algorithms.restart_hooks.remove(_raise_restart)
+
+    total = 1 - _sum_tally(rejected)
+    return {outcome: _sum_tally(tally) / total for outcome, tally in accepted.items()}
+
+def _sum_tally(tally: Dict[Tuple[int, int], int]) -> Fraction:
+    return sum((Fraction(numerator * count, denominator) for (numerator, denominator), count in tally.items()),
+               Fraction(0))
+
+def _giver_order_probability(receivers: Outcome, first_valid: bool, smart_last: bool = False) -> Fraction:
+    """Chance that one attempt returns `receivers`, for the algorithms that shuffle the givers
+    and let each giver in turn take a receiver from the pool the earlier ones left
+
+    first_valid: the receivers are shuffled too and each giver takes the first one that isn't
+        itself (double_shuffle); otherwise it draws uniformly from the others
+        (random_choice_with_removal_shuffled)
+    smart_last: the second-to-last giver takes the last giver whenever it may
+        (smart_last_choice_with_shuffle)
+    """
+    n = len(receivers)
+    memo: Dict[Tuple[int, int, int], Fraction] = {}
+
+    def walk(remaining: int, head: int, last: int) -> Fraction:
+        # head: a receiver known to be first in the shuffled pool (a giver skipped it), or -1
+        if not remaining:
+            return Fraction(1)
+        key = (remaining, head, last)
+        if key in memo:
+            return memo[key]
+        givers = [g for g in range(n) if remaining >> g & 1]
+        pool = 0
+        for g in givers:
+            pool |= 1 << receivers[g]
+        size = len(givers)
+        movers = [g for g in givers if g != last] or [last]
+        total = Fraction(0)
+        for g in movers:
+            r = receivers[g]
+            rest = remaining & ~(1 << g)
+            in_pool = pool >> g & 1
+            if first_valid:
+                if head < 0:
+                    # r is first, or g is first and r second (g then stays at the head)
+                    total += walk(rest, -1, last) / size
+                    if in_pool:
+                        total += walk(rest, g, last) / (size * (size - 1))
+                elif head == g:
+                    total += walk(rest, g, last) / (size - 1)
+                elif head == r:
+                    total += walk(rest, -1, last)
+            elif smart_last and size == 2 and g != last and pool >> last & 1:
+                if r == last:
+                    total += walk(rest, -1, last)
+            else:
+                total += walk(rest, -1, last) / (size - in_pool)
+        memo[key] = total = total / len(movers)
+        return total
+
+    everyone = (1 << n) - 1
+    if smart_last:
+        # The last giver of the shuffle is uniform; the others come in uniform order before it
+        return sum((walk(everyone, -1, last) for last in range(n)), Fraction(0)) / n
+    return walk(everyone, -1, -1)
+
+def _cycle_type(receivers: Outcome) -> Tuple[int, ...]:
+    return tuple(sorted(assignment_algorithms._cycle_lengths(receivers)))
+
+def _model_distribution(model: Callable[[Outcome], Fraction], n: int) -> Dict[Outcome, Fraction]:
+    """Distribution over derangements from a per-attempt model, renormalised over restarts"""
+    outcomes = [p for p in permutations(range(n)) if all(p[i] != i for i in range(n))]
+    by_type: Dict[Tuple[int, ...], Fraction] = {}
+    accepted = {}
+    for outcome in outcomes:
+        cycle_type = _cycle_type(outcome)
+        if cycle_type not in by_type:
+            by_type[cycle_type] = model(outcome)
+        accepted[outcome] = by_type[cycle_type]
+    total = sum(count * by_type[cycle_type]
+                for cycle_type, count in Counter(map(_cycle_type, outcomes)).items())
+    return {outcome: p / total for outcome, p in accepted.items() if p}
+
+# Algorithm name -> chance one attempt returns a given outcome. Only for algorithms that shuffle
+# the givers, whose distributions are invariant under relabelling (see _model_distribution)
+STATE_MODELS: Dict[str, Callable[[Outcome], Fraction]] = {
+    'random_choice_with_removal_shuffled': partial(_giver_order_probability, first_valid=False),
+    'double_shuffle': partial(_giver_order_probability, first_valid=True),
+    'smart_last_choice_with_shuffle': partial(_giver_order_probability, first_valid=False, smart_last=True),
+}
+
+def derangement_count(n: int) -> int:
+    previous, current = 1, 0
+    for m in range(2, n + 1):
+        previous, current = current, (m - 1) * (current + previous)
+    return current if n > 0 else 1
+
+def analyze(algo: Callable, n: int, max_branches: int = 500_000, enumerate_branches: bool = False) -> dict:
+    """Exact summary against the uniform distribution over the algorithm's target assignments
+    (derangements, or e.g. single cycles for sattolo_single_cycle)"""
+    distribution = exact_distribution(algo, n, max_branches, enumerate_branches)
+    targets = assignment_algorithms.target_count(algo, n)
+    uniform = Fraction(1, targets)
+    invalid = [outcome for outcome in distribution if not assignment_algorithms.in_target(algo, outcome)]
+    probability_counts = Counter(distribution.values())
+    total_variation = (sum(abs(p - uniform) * count for p, count in probability_counts.items())
+                       + uniform * (targets - len(distribution))) / 2
+
+    # Many outcomes share a probability, so sum counts per distinct value
+    distinct = {p: k for k, p in enumerate(set(distribution.values()))}
+    values = list(distinct)
+    marginal_counts = [[{} for _ in range(n)] for _ in range(n)]
+    for outcome, probability in distribution.items():
+        k = distinct[probability]
+        for giver, receiver in enumerate(outcome):
+            tally = marginal_counts[giver][receiver]
+            tally[k] = tally.get(k, 0) + 1
+    expected = Fraction(1, n - 1)
+    max_deviation = max(abs(sum((values[k] * count for k, count in marginal_counts[g][r].items()), Fraction(0))
+                            - expected)
+                        for g in range(n) for r in range(n) if g != r)
+
+    return {
+        'algorithm': algo.__name__,
+        'n': n,
+        'method': 'branches' if enumerate_branches or algo.__name__ not in STATE_MODELS else 'state walk',
+        'support': len(distribution),
+        'target': algo.target,
+        'target_assignments': targets,
+        'invalid_outcomes': len(invalid),
+        'total_variation': total_variation,
+        'max_pair_deviation': max_deviation,
+        'min_probability': min(distribution.values()),
+        'max_probability': max(distribution.values()),
+        # Thresholds passed to random() are floats, so allow for their rounding error
+        'uniform': total_variation < UNIFORM_TOLERANCE and not invalid,
+    }
+
+if __name__ == "__main__":
+    import argparse
+    from time import time
+    parser = argparse.ArgumentParser(description='Exact distribution of the assignment algorithms')
+    parser.add_argument('--n', type=int, default=4, help='Number of participants (default: 4)')
+    parser.add_argument('--max-branches', type=int, default=500_000,
+                        help='Give up on algorithms whose decision tree is larger (default: 500,000)')
+    parser.add_argument('--enumerate', action='store_true',
+                        help='Enumerate branches even for algorithms with a state walk in STATE_MODELS')
+    args = parser.parse_args()
+
+    print(f"Exact distributions with {args.n} participants:")
+    print("-" * 84)
+    print(f"{'Algorithm':<38} {'Time (s)':<10} {'TV distance':<13} {'Max Deviation %':<17} Uniform")
+    print("-" * 84)
+    for algo in assignment_algorithms.ALGORITHMS:
+        start = time()
+        try:
+            report = analyze(algo, args.n, args.max_branches, args.enumerate)
+        except (TypeError, TooManyBranches) as e:
+            print(f"{algo.__name__:<38} skipped: {e}")
+            continue
+        print(f"{algo.__name__:<38} {time() - start:<10.3f} {float(report['total_variation']):<13.2e} "
+              f"{float(report['max_pair_deviation']) * 100:<17.2f} {report['uniform']}")
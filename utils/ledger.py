@@ -0,0 +1,203 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from utils.mailer import OutgoingMessage
+
+DEFAULT_LEDGER_PATH = './ledger.sqlite3'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    config_key TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    seed INTEGER,
+    test INTEGER NOT NULL,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    giver TEXT NOT NULL,
+    receiver TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    giver TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plans (
+    plan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    config_key TEXT NOT NULL,
+    master_seed INTEGER NOT NULL,
+    first_year INTEGER NOT NULL,
+    last_year INTEGER NOT NULL,
+    test INTEGER NOT NULL,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plan_assignments (
+    plan_id INTEGER NOT NULL REFERENCES plans(plan_id),
+    year INTEGER NOT NULL,
+    giver TEXT NOT NULL,
+    receiver TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_year ON runs (config_key, test, year, run_id);
+CREATE INDEX IF NOT EXISTS assignments_by_giver ON assignments (giver, run_id);
+CREATE INDEX IF NOT EXISTS messages_by_run ON messages (run_id, giver);
+CREATE INDEX IF NOT EXISTS plans_by_years ON plans (config_key, test, first_year, last_year, plan_id);
+CREATE INDEX IF NOT EXISTS plan_assignments_by_year ON plan_assignments (plan_id, year);
+"""
+
+_APPEND_ONLY = """
+CREATE TRIGGER IF NOT EXISTS {table}_no_update BEFORE UPDATE ON {table}
+BEGIN SELECT RAISE(ABORT, 'the assignment ledger is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS {table}_no_delete BEFORE DELETE ON {table}
+BEGIN SELECT RAISE(ABORT, 'the assignment ledger is append-only'); END;
+"""
+
+class LedgerEntry(NamedTuple):
+    """One recorded run: the final assignments and the messages exactly as first rendered"""
+    run_id: int
+    config_key: str
+    year: int
+    seed: Optional[int]
+    test: bool
+    created: str
+    assignments: Dict[str, str]
+    messages: List[Tuple[str, OutgoingMessage]]   # (giver, message)
+
+class AssignmentLedger:
+    """Append-only SQLite record of every exchange, keyed by config and year
+
+    Rows are only ever inserted (triggers reject updates and deletes). Recording the same
+    config and year again adds a new run, and lookups return the latest one, so earlier
+    runs stay available for auditing. Test-mode runs are kept apart from real ones.
+    Multi-year plans (utils/planner.py) are stored the same way, and each year's run reads
+    its slice from the latest plan that covers it.
+    """
+    def __init__(self, path: str = DEFAULT_LEDGER_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Imported here so runs that never open the ledger don't load sqlite3
+        import sqlite3
+        self._db = sqlite3.connect(str(self.path))
+        self._db.executescript(_SCHEMA + "".join(_APPEND_ONLY.format(table=table)
+                                                 for table in ('runs', 'assignments', 'messages',
+                                                               'plans', 'plan_assignments')))
+
+    @classmethod
+    def from_config(cls, config: dict) -> "AssignmentLedger":
+        ledger_config = config.get('ledger') or {}
+        return cls(ledger_config.get('path', DEFAULT_LEDGER_PATH))
+
+    @staticmethod
+    def config_key(config: dict, config_path: str) -> str:
+        """`ledger.key` from the config, or else the config file's resolved path"""
+        ledger_config = config.get('ledger') or {}
+        return str(ledger_config.get('key') or Path(config_path).resolve())
+
+    def record(self, config_key: str, year: int, assignments: Dict[str, str],
+               messages: List[Tuple[str, OutgoingMessage]],
+               seed: Optional[int] = None, test: bool = False) -> int:
+        """Append a run in one transaction and return its run_id; `messages` are (giver, message) pairs"""
+        with self._db:
+            cursor = self._db.execute(
+                "INSERT INTO runs (config_key, year, seed, test, created) VALUES (?, ?, ?, ?, ?)",
+                (config_key, year, seed, int(test), datetime.now().isoformat(timespec='seconds')))
+            run_id = cursor.lastrowid
+            self._db.executemany("INSERT INTO assignments (run_id, giver, receiver) VALUES (?, ?, ?)",
+                                 [(run_id, giver, receiver) for giver, receiver in assignments.items()])
+            self._db.executemany(
+                "INSERT INTO messages (run_id, giver, recipient, subject, body) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, giver, message.to, message.subject, message.body) for giver, message in messages])
+        return run_id
+
+    def latest(self, config_key: str, year: int, test: bool = False) -> Optional[LedgerEntry]:
+        row = self._db.execute(
+            "SELECT run_id, seed, created FROM runs WHERE config_key = ? AND test = ? AND year = ? "
+            "ORDER BY run_id DESC LIMIT 1", (config_key, int(test), year)).fetchone()
+        if row is None:
+            return None
+        run_id, seed, created = row
+        assignments = dict(self._db.execute(
+            "SELECT giver, receiver FROM assignments WHERE run_id = ? ORDER BY giver", (run_id,)))
+        messages = [(giver, OutgoingMessage(recipient, subject, body))
+                    for giver, recipient, subject, body in self._db.execute(
+                        "SELECT giver, recipient, subject, body FROM messages WHERE run_id = ? ORDER BY rowid",
+                        (run_id,))]
+        return LedgerEntry(run_id, config_key, year, seed, test, created, assignments, messages)
+
+    def messages_for_giver(self, config_key: str, year: int, giver: str, test: bool = False) -> List[OutgoingMessage]:
+        run_id = self._latest_run_id(config_key, year, test)
+        if run_id is None:
+            return []
+        return [OutgoingMessage(*row) for row in self._db.execute(
+            "SELECT recipient, subject, body FROM messages WHERE run_id = ? AND giver = ? ORDER BY rowid",
+            (run_id, giver))]
+
+    def history(self, config_key: str, giver: str, test: bool = False) -> List[Tuple[int, str]]:
+        """(year, receiver) for every year `giver` was assigned, from the latest run of each year"""
+        return self._db.execute(
+            "SELECT r.year, a.receiver FROM assignments a JOIN runs r ON r.run_id = a.run_id "
+            "WHERE a.giver = ? AND r.config_key = ? AND r.test = ? AND r.run_id = ("
+            "  SELECT MAX(run_id) FROM runs WHERE config_key = r.config_key AND test = r.test AND year = r.year) "
+            "ORDER BY r.year", (giver, config_key, int(test))).fetchall()
+
+    def years(self, config_key: str, test: bool = False) -> List[int]:
+        return [year for (year,) in self._db.execute(
+            "SELECT DISTINCT year FROM runs WHERE config_key = ? AND test = ? ORDER BY year",
+            (config_key, int(test)))]
+
+    def assignments_by_year(self, config_key: str, test: bool = False) -> Dict[int, Dict[str, str]]:
+        """Year -> assignments from the latest run of every recorded year"""
+        by_year: Dict[int, Dict[str, str]] = {}
+        for year, giver, receiver in self._db.execute(
+                "SELECT r.year, a.giver, a.receiver FROM assignments a JOIN runs r ON r.run_id = a.run_id "
+                "WHERE r.config_key = ? AND r.test = ? AND r.run_id = ("
+                "  SELECT MAX(run_id) FROM runs WHERE config_key = r.config_key AND test = r.test AND year = r.year)",
+                (config_key, int(test))):
+            by_year.setdefault(year, {})[giver] = receiver
+        return by_year
+
+    def record_plan(self, config_key: str, plan: Dict[int, Dict[str, str]], master_seed: int,
+                    test: bool = False) -> int:
+        """Append a multi-year plan (year -> giver -> receiver) and return its plan_id"""
+        with self._db:
+            cursor = self._db.execute(
+                "INSERT INTO plans (config_key, master_seed, first_year, last_year, test, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (config_key, master_seed, min(plan), max(plan), int(test), datetime.now().isoformat(timespec='seconds')))
+            plan_id = cursor.lastrowid
+            self._db.executemany("INSERT INTO plan_assignments (plan_id, year, giver, receiver) VALUES (?, ?, ?, ?)",
+                                 [(plan_id, year, giver, receiver)
+                                  for year, assignments in plan.items() for giver, receiver in assignments.items()])
+        return plan_id
+
+    def planned(self, config_key: str, year: int, test: bool = False) -> Optional[Tuple[int, Dict[str, str]]]:
+        """(plan_id, assignments) for `year` from the latest plan that covers it"""
+        row = self._db.execute(
+            "SELECT MAX(p.plan_id) FROM plans p WHERE p.config_key = ? AND p.test = ? "
+            "AND p.first_year <= ? AND p.last_year >= ? "
+            "AND EXISTS (SELECT 1 FROM plan_assignments WHERE plan_id = p.plan_id AND year = ?)",
+            (config_key, int(test), year, year, year)).fetchone()
+        if row[0] is None:
+            return None
+        plan_id = row[0]
+        return plan_id, dict(self._db.execute(
+            "SELECT giver, receiver FROM plan_assignments WHERE plan_id = ? AND year = ? ORDER BY giver",
+            (plan_id, year)))
+
+    def _latest_run_id(self, config_key: str, year: int, test: bool) -> Optional[int]:
+        row = self._db.execute(
+            "SELECT MAX(run_id) FROM runs WHERE config_key = ? AND test = ? AND year = ?",
+            (config_key, int(test), year)).fetchone()
+        return row[0]
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> "AssignmentLedger":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
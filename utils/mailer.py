@@ -0,0 +1,322 @@
+import json
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Union, TYPE_CHECKING
+from utils.profiling import profiler
+
+if TYPE_CHECKING:
+    import smtplib
+    from email.message import EmailMessage
+
+# smtplib, mailbox and the email package are imported when a pool or message is first built,
+# so importing the mailer (for its message types) costs nothing on runs that send no mail
+
+DEFAULT_CREDENTIALS_PATH = './credentials/email_credentials.json'
+
+class OutgoingMessage(NamedTuple):
+    to: str
+    subject: str
+    body: str
+
+class DeliveryResult(NamedTuple):
+    recipient: str
+    ok: bool
+    attempts: int
+    elapsed: float
+    error: Optional[str] = None
+
+def load_email_credentials(path: str = DEFAULT_CREDENTIALS_PATH) -> dict:
+    """Read {"email": ..., "password": ...} (same file general_tools.my_email uses)"""
+    with Path(path).open('r') as f:
+        return json.load(f)
+
+def is_transient(error: Exception) -> bool:
+    """4xx replies, dropped or refused connections and timeouts are worth retrying; 5xx replies
+    and other OS errors (TLS certificate failures, unknown hosts, full disks) are not"""
+    import smtplib
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    return isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError))
+
+def is_reply_error(error: Exception) -> bool:
+    """The server refused the message but the session is intact (421 means it is closing)"""
+    import smtplib
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code != 421
+    return isinstance(error, smtplib.SMTPRecipientsRefused)
+
+class RateLimiter:
+    """Token bucket shared by all workers: at most `rate` sends per second on average"""
+    def __init__(self, rate: Optional[float], burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class SMTPConnectionPool:
+    """Authenticated SMTP connections, opened on demand and reused across messages"""
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 use_ssl: bool = True, starttls: bool = False, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.starttls = starttls
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self.connections_opened = 0
+
+    def _connect(self) -> "smtplib.SMTP":
+        import smtplib
+        with profiler.stage('smtp.connect'):
+            if self.use_ssl:
+                connection = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+            else:
+                connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+                if self.starttls:
+                    connection.starttls()
+            if self.username:
+                connection.login(self.username, self.password)
+        self.connections_opened += 1
+        return connection
+
+    def acquire(self) -> "smtplib.SMTP":
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, connection: "smtplib.SMTP") -> None:
+        self._idle.put(connection)
+
+    def discard(self, connection: "smtplib.SMTP") -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def reset(self, connection: "smtplib.SMTP") -> None:
+        """Return a connection whose message was refused, after RSET; discard it if that fails"""
+        try:
+            connection.rset()
+        except Exception:
+            self.discard(connection)
+        else:
+            self.release(connection)
+
+    def close(self) -> None:
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                connection.quit()
+            except Exception:
+                connection.close()
+
+class SpoolPool:
+    """Drop-in for SMTPConnectionPool that writes messages to disk instead of sending them
+
+    `mbox` appends every message to one mbox file; `eml` writes one numbered .eml file per
+    message into a directory. The pool hands out itself as the "connection", so Mailer's
+    worker pool, rate limit and retry logic run exactly as they do against a real server.
+    """
+    FORMATS = ('mbox', 'eml')
+
+    def __init__(self, path: str, format: str = 'mbox'):
+        if format not in self.FORMATS:
+            raise ValueError(f"Unknown spool format {format!r}; choose from {self.FORMATS}")
+        self.path = Path(path)
+        self.format = format
+        self.connections_opened = 0
+        self.written = 0
+        self._lock = threading.Lock()
+        if format == 'mbox':
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            import mailbox
+            self._mbox = mailbox.mbox(str(self.path))
+        else:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._mbox = None
+            # Number after any files already there, so a reused spool directory is appended to
+            self._eml_offset = len(list(self.path.glob('*.eml')))
+
+    def acquire(self) -> "SpoolPool":
+        return self
+
+    def release(self, connection: "SpoolPool") -> None:
+        pass
+
+    def discard(self, connection: "SpoolPool") -> None:
+        pass
+
+    def reset(self, connection: "SpoolPool") -> None:
+        pass
+
+    def send_message(self, email_message: "EmailMessage") -> None:
+        with profiler.stage('spool.write'):
+            data = email_message.as_bytes()
+            with self._lock:
+                self.written += 1
+                if self._mbox is not None:
+                    import mailbox
+                    self._mbox.add(mailbox.mboxMessage(data))
+                    self._mbox.flush()
+                    return
+                number = self._eml_offset + self.written
+            (self.path / f"{number:06d}.eml").write_bytes(data)
+
+    def close(self) -> None:
+        if self._mbox is not None:
+            self._mbox.close()
+
+class Mailer:
+    """Sends messages over a bounded worker pool that shares pooled SMTP connections
+
+    At most `workers` sends are in flight at once, even when several threads call send_all
+    on one shared Mailer, so `workers` also bounds the open connections and concurrent
+    logins. Transient failures are retried with exponential backoff and jitter;
+    every message gets a DeliveryResult.
+    """
+    def __init__(self, host: str = 'smtp.gmail.com', port: int = 465, username: Optional[str] = None,
+                 password: Optional[str] = None, sender: Optional[str] = None, use_ssl: bool = True,
+                 starttls: bool = False, workers: int = 4, max_per_second: Optional[float] = 2.0,
+                 max_retries: int = 3, backoff: float = 1.0,
+                 pool: Optional[Union[SMTPConnectionPool, SpoolPool]] = None):
+        self.pool = pool or SMTPConnectionPool(host, port, username, password, use_ssl, starttls)
+        self.sender = sender or username
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max(1, workers))
+        self.rate_limiter = RateLimiter(max_per_second, burst=workers)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    @classmethod
+    def from_config(cls, config: dict) -> "Mailer":
+        """Build from the optional `email` config section, reading the login from its credentials file"""
+        email_config = dict(config.get('email') or {})
+        credentials = load_email_credentials(email_config.pop('credentials', DEFAULT_CREDENTIALS_PATH))
+        return cls(host=email_config.get('host', 'smtp.gmail.com'),
+                   port=email_config.get('port', 465),
+                   username=credentials['email'],
+                   password=credentials['password'],
+                   use_ssl=email_config.get('ssl', True),
+                   starttls=email_config.get('starttls', False),
+                   workers=email_config.get('connections', 4),
+                   max_per_second=email_config.get('max_per_second', 2.0),
+                   max_retries=email_config.get('max_retries', 3),
+                   backoff=email_config.get('backoff_seconds', 1.0))
+
+    def build_message(self, message: OutgoingMessage) -> "EmailMessage":
+        from email.message import EmailMessage
+        email_message = EmailMessage()
+        email_message['From'] = self.sender or ''
+        email_message['To'] = message.to
+        email_message['Subject'] = message.subject
+        email_message.set_content(message.body)
+        email_message.add_alternative(message.body.replace('\n', '<br>\n'), subtype='html')
+        return email_message
+
+    def send_one(self, message: OutgoingMessage) -> DeliveryResult:
+        start = time.perf_counter()
+        email_message = self.build_message(message)
+        attempt = 0
+        while True:
+            attempt += 1
+            self.rate_limiter.acquire()
+            connection = None
+            try:
+                with self._slots:
+                    connection = self.pool.acquire()
+                    with profiler.stage('smtp.send'):
+                        connection.send_message(email_message)
+                    self.pool.release(connection)
+                return DeliveryResult(message.to, True, attempt, time.perf_counter() - start)
+            except Exception as error:
+                if connection is not None:
+                    # A refused message leaves a healthy session to reuse; anything else may not
+                    if is_reply_error(error):
+                        self.pool.reset(connection)
+                    else:
+                        self.pool.discard(connection)
+                if attempt > self.max_retries or not is_transient(error):
+                    profiler.count('smtp.failures')
+                    return DeliveryResult(message.to, False, attempt, time.perf_counter() - start, repr(error))
+                profiler.count('smtp.retries')
+                time.sleep(self.backoff * 2 ** (attempt - 1) * (0.5 + random.random()))
+
+    def send_all(self, messages: Iterable[OutgoingMessage]) -> List[DeliveryResult]:
+        """Send every message and return one result per message, in input order"""
+        messages = list(messages)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(messages)))) as executor:
+            return list(executor.map(self.send_one, messages))
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def __enter__(self) -> "Mailer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+TEST_DELIVERIES = ('sink', 'mbox', 'eml')
+
+@contextmanager
+def test_mailer(delivery: str = 'sink', spool_path: Optional[str] = None, workers: int = 4,
+                max_per_second: Optional[float] = None, max_retries: int = 3, backoff: float = 0.05,
+                **sink_options) -> Iterator[Mailer]:
+    """A Mailer wired to a local stand-in instead of a real SMTP server
+
+    `sink` starts an in-process SMTPSink (utils/smtp_sink.py) and sends to it over a real
+    socket with login, so connection pooling, retries and the rate limit are all exercised;
+    `sink_options` (e.g. transient_failure_rate, latency) inject faults there. `mbox` and
+    `eml` write to a spool at `spool_path` instead. The sink, if any, is `mailer.sink`.
+    """
+    if delivery == 'sink':
+        from utils.smtp_sink import SMTPSink
+        with SMTPSink(**sink_options) as sink:
+            mailer = Mailer(host=sink.host, port=sink.port, username='test', password='test',
+                            sender='gift-exchange@localhost', use_ssl=False, workers=workers,
+                            max_per_second=max_per_second, max_retries=max_retries, backoff=backoff)
+            mailer.sink = sink
+            try:
+                yield mailer
+            finally:
+                mailer.close()
+        return
+    if delivery not in SpoolPool.FORMATS:
+        raise ValueError(f"Unknown test delivery {delivery!r}; choose from {TEST_DELIVERIES}")
+    if spool_path is None:
+        spool_path = './spool/test.mbox' if delivery == 'mbox' else './spool/eml'
+    mailer = Mailer(sender='gift-exchange@localhost', workers=workers, max_per_second=max_per_second,
+                    max_retries=max_retries, backoff=backoff, pool=SpoolPool(spool_path, delivery))
+    mailer.sink = None
+    try:
+        yield mailer
+    finally:
+        mailer.close()
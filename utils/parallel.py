@@ -0,0 +1,102 @@
+import os
+import pickle
+import random
+import numpy as np
+from pathlib import Path
+from time import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Tuple, Union
+from utils import assignment_algorithms
+from utils.accumulator import _save_checkpoint
+from utils.batch_sampler import batch_pairing_counts, max_deviation
+
+# Trials per shard. Shards (not workers) own the RNG streams, so results for a master seed
+# don't depend on how many workers run them.
+DEFAULT_SHARD_SIZE = 1_000_000
+DEFAULT_CALL_SHARD_SIZE = 10_000
+
+def _shard_sizes(total_runs: int, shard_size: int) -> List[int]:
+    full, rest = divmod(total_runs, shard_size)
+    return [shard_size] * full + ([rest] if rest else [])
+
+def _run_shard(algo: Union[Callable, str], family_count: int, runs: int, seed_seq: np.random.SeedSequence) -> np.ndarray:
+    """Count pairings for one shard using only the shard's own RNG stream"""
+    algo = assignment_algorithms.get_algorithm(algo) if isinstance(algo, str) else algo
+    if hasattr(algo, 'batch'):
+        return batch_pairing_counts(algo.batch, family_count, runs, np.random.default_rng(seed_seq))
+
+    # Per-call algorithms get one generator per shard that runs on across trials
+    rng = random.Random(int.from_bytes(seed_seq.generate_state(4, np.uint64).tobytes(), 'little'))
+    givers = np.arange(family_count)
+    counts = np.zeros((family_count, family_count), dtype=np.int64)
+    for _ in range(runs):
+        receivers = algo.indices(family_count, rng=rng)
+        assert assignment_algorithms.validate_receivers(receivers)
+        counts[givers, receivers] += 1
+    return counts
+
+def parallel_pairing_counts(algo: Union[Callable, str],
+                            family_count: int,
+                            total_runs: int,
+                            master_seed: int = 0,
+                            workers: Optional[int] = None,
+                            shard_size: Optional[int] = None,
+                            checkpoint_path: Optional[str] = None) -> np.ndarray:
+    """Shard trials across a process pool and merge the per-shard pairing-count matrices
+
+    Every shard gets an independent child of SeedSequence(master_seed), so the merged counts
+    are identical for a given master seed whatever the number of workers. With a checkpoint,
+    the merged counts are saved as shards finish in order, and a rerun skips the shards
+    already merged, ending with the same counts.
+
+    Args:
+        algo: A registered algorithm from utils.assignment_algorithms, or its name or alias, or
+            any other picklable sampler with the same `indices` (e.g. a ConstrainedSampler)
+        family_count: Number of participants
+        total_runs: Total number of assignments to draw
+        master_seed: Seed all shard streams are spawned from
+        workers: Process count (defaults to os.cpu_count())
+        shard_size: Trials per shard
+        checkpoint_path: Optional file to save progress to and resume from
+    """
+    algo = assignment_algorithms.get_algorithm(algo) if isinstance(algo, str) else algo
+    # Shards look registered algorithms up again by name; anything else is pickled as is
+    registered = assignment_algorithms.REGISTRY.get(algo.__name__) is algo
+    shard_algo = algo.__name__ if registered else algo
+    if shard_size is None:
+        batch = hasattr(algo, 'batch')
+        shard_size = DEFAULT_SHARD_SIZE if batch else DEFAULT_CALL_SHARD_SIZE
+    sizes = _shard_sizes(total_runs, shard_size)
+    seeds = np.random.SeedSequence(master_seed).spawn(len(sizes))
+    study = {'algorithm': algo.__name__, 'n': family_count, 'total_runs': total_runs, 'seed': master_seed,
+             'shard_size': shard_size}
+
+    counts = np.zeros((family_count, family_count), dtype=np.int64)
+    done = 0
+    path = Path(checkpoint_path) if checkpoint_path else None
+    if path is not None and path.exists():
+        with path.open('rb') as f:
+            checkpoint = pickle.load(f)
+        if checkpoint['study'] != study:
+            raise ValueError(f"Checkpoint {path} belongs to a different study: {checkpoint['study']}")
+        counts, done = checkpoint['counts'], checkpoint['shards_done']
+
+    todo = len(sizes) - done
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for shard_counts in pool.map(_run_shard, [shard_algo] * todo, [family_count] * todo,
+                                     sizes[done:], seeds[done:]):
+            counts += shard_counts
+            done += 1
+            if path is not None:
+                _save_checkpoint(path, {'study': study, 'counts': counts, 'shards_done': done})
+    return counts
+
+def parallel_evaluate_algorithm(algo: Union[Callable, str],
+                                family_count: int,
+                                total_runs: int = 1000,
+                                master_seed: int = 0,
+                                workers: Optional[int] = None) -> Tuple[float, float]:
+    """Parallel counterpart of evaluate_algorithm: (elapsed seconds, max deviation %)"""
+    start_time = time()
+    counts = parallel_pairing_counts(algo, family_count, total_runs, master_seed, workers)
+    return time() - start_time, max_deviation(counts, total_runs)
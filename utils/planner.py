@@ -0,0 +1,217 @@
+"""Multi-year schedules: K years of assignments chosen together so pairs rarely repeat
+
+Drawing each year independently (seeded with the year) regularly hands a family the same
+recipient in back-to-back years. plan_schedule instead starts from one random draw per year
+and improves the whole schedule at once with simulated annealing. Every time a giver -> receiver
+pair recurs it costs 1 / gap (gap in years), so back-to-back repeats cost most and distant
+repeats little. Recorded past years count too, but are never changed.
+
+Moves stay inside the rules: swapping the receivers of two givers keeps a derangement and is
+rejected if it would draw a forbidden pair (or, for the no-reciprocal target, a 2-cycle); for
+single-cycle targets a giver is instead moved to another spot on the chain. All randomness
+comes from one generator seeded with `master_seed`, so a plan is reproducible.
+"""
+import math
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Union
+from utils.assignment_algorithms import Participants, best_algorithm, make_rng
+from utils.constraints import _forbidden_indices, sample_constrained_derangement
+
+# Annealing temperature, from the first sweep to the last
+_START_TEMPERATURE = 0.5
+_END_TEMPERATURE = 0.01
+# Default sweeps give about this many proposals (n * years per sweep), but never fewer than
+# 200 sweeps; small exchanges, where repeats can't be avoided, get the most sweeps
+_PROPOSAL_BUDGET = 200_000
+
+class SchedulePlan(NamedTuple):
+    assignments: Dict[int, Dict[str, str]]   # year -> giver -> receiver
+    master_seed: int
+    cost: float             # sum of 1 / gap over repeated pairs, past years included
+    initial_cost: float     # the same for the independent draws the search started from
+    repeats: int            # planned pairs already drawn in an earlier year (past or planned)
+    min_gap: Optional[int]  # shortest gap between two draws of one pair, None if nothing repeats
+
+class _Search:
+    """Planned receivers per year plus, for every pair (giver * n + receiver), the years it is drawn"""
+    def __init__(self, n: int, years: List[int], schedule: List[List[int]], history: Dict[int, List[int]],
+                 forbidden: List[Set[int]], target: str, rng):
+        self.n = n
+        self.years = years
+        self.schedule = schedule
+        self.forbidden = forbidden
+        self.target = target
+        self.rng = rng
+        self.pair_years: Dict[int, List[int]] = {pair: list(drawn) for pair, drawn in history.items()}
+        for year, receivers in zip(years, schedule):
+            for giver, receiver in enumerate(receivers):
+                self.pair_years.setdefault(giver * n + receiver, []).append(year)
+
+    def cost(self, pair: int, year: int) -> float:
+        """What drawing `pair` in `year` costs against its draws in every other year"""
+        return sum(1 / abs(year - other) for other in self.pair_years.get(pair, ()) if other != year)
+
+    def total_cost(self) -> float:
+        planned = set(self.years)
+        total = 0.0
+        for drawn in self.pair_years.values():
+            for i, earlier in enumerate(drawn):
+                for later in drawn[i + 1:]:
+                    if earlier in planned or later in planned:
+                        total += 1 / abs(later - earlier)
+        return total
+
+    def repeated(self, year: int, receivers: List[int]) -> List[int]:
+        n = self.n
+        return [giver for giver in range(n) if len(self.pair_years[giver * n + receivers[giver]]) > 1]
+
+    def _move(self, old: int, new: int, year: int) -> None:
+        drawn = self.pair_years[old]
+        drawn.remove(year)
+        if not drawn:
+            del self.pair_years[old]
+        self.pair_years.setdefault(new, []).append(year)
+
+    def _accept(self, delta: float, temperature: float) -> bool:
+        return delta <= 0 or self.rng.random() < math.exp(-delta / temperature)
+
+    def swap(self, a: int, year: int, receivers: List[int], temperature: float,
+             givers_of: Optional[List[int]] = None) -> float:
+        """Propose a -> rb, b -> ra for a random b; returns the change in cost (0 if rejected)"""
+        n = self.n
+        b = self.rng.randrange(n - 1)
+        b += b >= a
+        ra, rb = receivers[a], receivers[b]
+        if a == rb or b == ra or rb in self.forbidden[a] or ra in self.forbidden[b]:
+            return 0.0
+        if self.target == 'no_two_cycles' and (receivers[rb] == a or receivers[ra] == b):
+            return 0.0
+        delta = (self.cost(a * n + rb, year) + self.cost(b * n + ra, year)
+                 - self.cost(a * n + ra, year) - self.cost(b * n + rb, year))
+        if not self._accept(delta, temperature):
+            return 0.0
+        self._move(a * n + ra, a * n + rb, year)
+        self._move(b * n + rb, b * n + ra, year)
+        receivers[a], receivers[b] = rb, ra
+        if givers_of is not None:
+            givers_of[rb], givers_of[ra] = a, b
+        return delta
+
+    def relocate(self, x: int, year: int, receivers: List[int], givers_of: List[int], temperature: float) -> float:
+        """Propose cutting x out of its chain (p -> x -> s becomes p -> s) and splicing it in at u -> v"""
+        n = self.n
+        p, s = givers_of[x], receivers[x]
+        u = self.rng.randrange(n)
+        v = receivers[u]
+        if p == s or x in (u, v) or u == p:
+            return 0.0
+        if s in self.forbidden[p] or x in self.forbidden[u] or v in self.forbidden[x]:
+            return 0.0
+        if self.target == 'no_two_cycles':
+            # Any new 2-cycle would use one of the three new edges p -> s, u -> x, x -> v
+            moved = {p: s, u: x, x: v}
+            after = lambda giver: moved.get(giver, receivers[giver])
+            if any(after(after(giver)) == giver for giver in moved):
+                return 0.0
+        delta = (self.cost(p * n + s, year) + self.cost(u * n + x, year) + self.cost(x * n + v, year)
+                 - self.cost(p * n + x, year) - self.cost(x * n + s, year) - self.cost(u * n + v, year))
+        if not self._accept(delta, temperature):
+            return 0.0
+        self._move(p * n + x, p * n + s, year)
+        self._move(x * n + s, x * n + v, year)
+        self._move(u * n + v, u * n + x, year)
+        receivers[p], receivers[u], receivers[x] = s, x, v
+        givers_of[s], givers_of[x], givers_of[v] = p, u, x
+        return delta
+
+    def sweep(self, temperature: float) -> float:
+        """One pass over every planned pair that repeats; returns the change in cost"""
+        change = 0.0
+        for year, receivers in zip(self.years, self.schedule):
+            repeated = self.repeated(year, receivers)
+            if self.target != 'derangement' and repeated:
+                # Swaps split or merge cycles, so single chains only relocate; no-reciprocal
+                # schedules mix both, since swaps alone can't leave a lone n-cycle for small n
+                givers_of = [0] * self.n
+                for giver, receiver in enumerate(receivers):
+                    givers_of[receiver] = giver
+                for x in repeated:
+                    if self.target == 'no_two_cycles' and self.rng.random() < 0.5:
+                        change += self.swap(x, year, receivers, temperature, givers_of)
+                    else:
+                        change += self.relocate(x, year, receivers, givers_of, temperature)
+            else:
+                for a in repeated:
+                    change += self.swap(a, year, receivers, temperature)
+        return change
+
+def plan_schedule(family_ids: Union[Iterable[str], Participants],
+                  years: Sequence[int],
+                  master_seed: int,
+                  forbidden: Optional[Dict[str, Set[str]]] = None,
+                  history: Optional[Dict[int, Dict[str, str]]] = None,
+                  algorithm: Optional[Callable] = None,
+                  sweeps: Optional[int] = None) -> SchedulePlan:
+    """Assignments for every year in `years`, minimising repeated and recent pairs
+
+    Args:
+        family_ids: Participating family IDs, or a prebuilt Participants index
+        years: Years to plan, e.g. range(2025, 2030)
+        master_seed: Seed for the whole plan
+        forbidden: Optional exclusion graph, see utils.constraints.build_exclusion_graph
+        history: Year -> assignments already made; they add cost but aren't changed
+        algorithm: Registered algorithm whose `target` the plan keeps to (default: best_algorithm)
+        sweeps: Annealing passes over the repeated pairs (default: scaled to the problem size);
+            stops early once nothing repeats
+    """
+    rng = make_rng(master_seed)
+    participants = family_ids if isinstance(family_ids, Participants) else Participants(family_ids)
+    n = len(participants)
+    algorithm = algorithm or best_algorithm
+    years = sorted(set(years))
+    if forbidden and algorithm.target != 'derangement':
+        raise ValueError(f"Algorithm {algorithm.__name__} can't be combined with an exclusion graph")
+    if sweeps is None:
+        sweeps = max(200, _PROPOSAL_BUDGET // max(1, n * len(years)))
+
+    # Start from independent draws, one per year
+    schedule: List[List[int]] = []
+    for _ in years:
+        if forbidden:
+            schedule.append(list(participants.to_receivers(
+                sample_constrained_derangement(participants, forbidden, rng=rng))))
+        else:
+            schedule.append(list(algorithm.indices(n, rng=rng)))
+
+    past: Dict[int, List[int]] = {}
+    for year, assignments in sorted((history or {}).items()):
+        if year in years:
+            continue
+        for giver, receiver in assignments.items():
+            if giver in participants.index and receiver in participants.index:
+                past.setdefault(participants.index[giver] * n + participants.index[receiver], []).append(year)
+
+    forbidden_idx = _forbidden_indices(participants, forbidden) if forbidden else [set() for _ in range(n)]
+    search = _Search(n, years, schedule, past, forbidden_idx, algorithm.target, rng)
+    initial_cost = current = best = search.total_cost()
+    best_schedule = [list(receivers) for receivers in schedule]
+    for sweep in range(sweeps):
+        if best <= 0:
+            break
+        temperature = _START_TEMPERATURE * (_END_TEMPERATURE / _START_TEMPERATURE) ** (sweep / max(1, sweeps - 1))
+        current += search.sweep(temperature)
+        # Uphill moves are accepted along the way, so keep the best schedule seen
+        if current < best - 1e-9:
+            best = current
+            best_schedule = [list(receivers) for receivers in schedule]
+
+    final = _Search(n, years, best_schedule, past, forbidden_idx, algorithm.target, rng)
+    planned = set(years)
+    repeats = 0
+    gaps = []
+    for drawn in final.pair_years.values():
+        drawn.sort()
+        gaps.extend(later - earlier for earlier, later in zip(drawn, drawn[1:])
+                    if earlier in planned or later in planned)
+        repeats += sum(1 for year in drawn[1:] if year in planned)
+    plan = {year: participants.to_dict(receivers) for year, receivers in zip(years, best_schedule)}
+    return SchedulePlan(plan, master_seed, final.total_cost(), initial_cost, repeats, min(gaps, default=None))
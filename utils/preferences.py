@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from utils.profiling import profiler
+
+# Google Forms writes "11/15/2024 10:23:45"; the others cover hand-edited or exported sheets
+TIMESTAMP_FORMATS = ('%m/%d/%Y %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S')
+
+def _parse_timestamp(text: str) -> float:
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), fmt).timestamp()
+        except ValueError:
+            continue
+    return 0.0
+
+def _normalize(text: str) -> str:
+    return ' '.join(text.split())
+
+class PreferenceSync:
+    """Persisted family -> preferences index for the form responses sheet, synced incrementally
+
+    The sheet is append-only, so the index keeps a cursor (the last merged row and its
+    timestamp). Each run reads `range`, from the cursor row on, alongside the other ranges of
+    its spreadsheet; the first row returned must still be the cursor row, otherwise rows
+    above it were edited or deleted and the index is rebuilt from a full read. Preferences are whitespace-normalised and deduplicated per
+    family (case-insensitively, keeping the latest submission), newest first.
+    """
+    def __init__(self, spreadsheet_id: str, sheet_name: str, path: str):
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.path = Path(path)
+        self.state = self._fresh_state()
+        if self.path.exists():
+            with self.path.open('r') as f:
+                state = json.load(f)
+            if state.get('spreadsheet_id') == spreadsheet_id and state.get('sheet') == sheet_name:
+                self.state = state
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["PreferenceSync"]:
+        spreadsheet_config = config.get('spreadsheet') or {}
+        spreadsheet_id = spreadsheet_config.get('form_responses_id')
+        sheet_name = spreadsheet_config.get('form_responses_sheet')
+        if not (spreadsheet_id and sheet_name):
+            return None
+        cache_dir = (config.get('cache') or {}).get('dir', './cache')
+        key = hashlib.sha1(f"{spreadsheet_id}|{sheet_name}".encode()).hexdigest()
+        return cls(spreadsheet_id, sheet_name, str(Path(cache_dir) / f"preferences-{key}.json"))
+
+    def _fresh_state(self) -> dict:
+        # Row 1 is the header, so a fresh index starts with the cursor on it
+        return {'spreadsheet_id': self.spreadsheet_id, 'sheet': self.sheet_name,
+                'last_row': 1, 'last_timestamp': None, 'families': {}}
+
+    @property
+    def range(self) -> str:
+        return f"{self.sheet_name}!A{self.state['last_row']}:C"
+
+    def resolve(self, service, result: dict) -> dict:
+        """Rows from the cursor on, or the whole sheet if the cursor row no longer matches
+
+        `result` is the read of `range`; only the full re-read goes through `service`.
+        """
+        first_row = self.state['last_row']
+        rows = result.get('values', [])
+        if first_row > 1 and (not rows or (rows[0][0] if rows[0] else '') != self.state['last_timestamp']):
+            print("Form responses changed above the sync cursor; rebuilding the preferences index")
+            self.state = self._fresh_state()
+            first_row = 1
+            result = service.spreadsheets().values().get(spreadsheetId=self.spreadsheet_id, range=self.range).execute()
+            rows = result.get('values', [])
+        return {'first_row': first_row, 'values': rows}
+
+    def merge(self, result: dict) -> Dict[str, List[str]]:
+        """Fold fetched rows into the index, save it, and return family -> preferences (newest first)
+
+        A result without rows (the read failed, or the run is offline) leaves the index as it is.
+        """
+        rows = result.get('values')
+        if rows is None:
+            return self.preferences()
+        first_row = result.get('first_row', 1)
+        families = self.state['families']
+        cursor = self.state['last_row']
+        merged = 0
+        for offset, row in enumerate(rows):
+            row_number = first_row + offset
+            if row_number <= self.state['last_row']:
+                continue
+            self.state['last_row'] = row_number
+            self.state['last_timestamp'] = row[0] if row else ''
+            if len(row) < 3:
+                continue
+            timestamp, preference, family_name = row[0], _normalize(row[1]), _normalize(row[2])
+            if not preference or not family_name:
+                continue
+            entries = families.setdefault(family_name, [])
+            key = preference.casefold()
+            entries[:] = [entry for entry in entries if entry['text'].casefold() != key]
+            entries.append({'text': preference, 'timestamp': timestamp, 'row': row_number})
+            entries.sort(key=lambda entry: (_parse_timestamp(entry['timestamp']), entry['row']), reverse=True)
+            merged += 1
+
+        profiler.count('preferences.new_rows', merged)
+        if self.state['last_row'] != cursor:
+            self.save()
+        return self.preferences()
+
+    def preferences(self) -> Dict[str, List[str]]:
+        return {family: [entry['text'] for entry in entries] for family, entries in self.state['families'].items()}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Per-thread temporary file: batch runs may save the same index from several groups at once
+        tmp_path = self.path.with_suffix(f'.{os.getpid()}-{threading.get_ident()}.tmp')
+        with tmp_path.open('w') as f:
+            json.dump(self.state, f)
+        tmp_path.replace(self.path)
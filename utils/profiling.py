@@ -0,0 +1,103 @@
+"""Stage timings and counters for the assigner pipeline, written out by `assigner.py --profile`
+
+Instrumented code wraps each stage in `profiler.stage(name)` and bumps counters with
+`profiler.count(name)`. Both are no-ops until the profiler is enabled, so the hooks cost
+nothing in normal runs. Stage names are dotted ("sheets.fetch", "smtp.connect") and may
+nest; a stage's time includes everything inside it.
+"""
+import json
+import platform
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+from typing import Dict, Iterator
+from utils import assignment_algorithms
+
+class StageStats:
+    __slots__ = ('calls', 'total_seconds', 'max_seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def to_dict(self) -> dict:
+        return {'calls': self.calls, 'total_seconds': self.total_seconds, 'max_seconds': self.max_seconds}
+
+class Profiler:
+    """Thread-safe stage timer and counter registry (mail is sent from a worker pool)"""
+    def __init__(self):
+        self.enabled = False
+        self.stages: Dict[str, StageStats] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._started = None
+
+    def enable(self) -> None:
+        """Start recording; rejection-sampling restarts are counted per algorithm as "restarts.<name>" """
+        if not self.enabled:
+            self.enabled = True
+            self._started = perf_counter()
+            assignment_algorithms.restart_hooks.append(self._count_restart)
+
+    def disable(self) -> None:
+        if self.enabled:
+            self.enabled = False
+            assignment_algorithms.restart_hooks.remove(self._count_restart)
+
+    def _count_restart(self, algorithm_name: str) -> None:
+        self.count(f'restarts.{algorithm_name}')
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            with self._lock:
+                stats = self.stages.get(name)
+                if stats is None:
+                    stats = self.stages[name] = StageStats()
+                stats.calls += 1
+                stats.total_seconds += elapsed
+                stats.max_seconds = max(stats.max_seconds, elapsed)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'argv': sys.argv,
+                'python': platform.python_version(),
+                'wall_seconds': perf_counter() - self._started if self._started is not None else 0.0,
+                'stages': {name: stats.to_dict() for name, stats in self.stages.items()},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def write_json(self, path: str) -> dict:
+        report = self.report()
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
+
+    def summary(self) -> str:
+        lines = [f"{'Stage':<32} {'Calls':>7} {'Total (s)':>10} {'Max (s)':>9}"]
+        for name, stats in self.stages.items():
+            lines.append(f"{name:<32} {stats.calls:>7} {stats.total_seconds:>10.4f} {stats.max_seconds:>9.4f}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<32} {value:>7}")
+        return "\n".join(lines)
+
+# Shared by the whole process, like assignment_algorithms.restart_hooks
+profiler = Profiler()
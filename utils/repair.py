@@ -0,0 +1,117 @@
+import random
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+from utils.assignment_algorithms import make_rng
+
+# Random edges tried for each joiner before scanning every edge
+_RANDOM_TRIES = 32
+
+class RepairImpossibleError(ValueError):
+    """Raised when joiners can't be spliced in without breaking the exclusion rules; regenerate instead"""
+
+class RepairResult(NamedTuple):
+    assignments: Dict[str, str]
+    changed: List[str]      # givers whose receiver differs from before, joiners included
+    joined: List[str]
+    left: List[str]
+
+def repair_assignments(previous: Dict[str, str],
+                       family_ids: Iterable[str],
+                       forbidden: Optional[Dict[str, Set[str]]] = None,
+                       seed_value: Optional[int] = None,
+                       rng: Optional[random.Random] = None,
+                       allow_two_cycles: bool = True) -> RepairResult:
+    """Update an existing assignment for families that joined or left, changing as few pairs as possible
+
+    A leaver is cut out of its cycle: whoever gave to it now gives to whoever it gave to.
+    If that closes a 2-cycle (or the shortcut is forbidden), that giver is pulled out as
+    well and re-inserted like a joiner, as is any giver whose old pair is now forbidden. A joiner j is spliced into a random allowed edge
+    a -> b, which becomes a -> j -> b. Every step keeps the result a derangement and
+    touches one or two edges, so a delta of k families changes O(k) pairs; everyone else
+    keeps the receiver they were already told about. Splicing only lengthens cycles, so a
+    single-cycle assignment stays one cycle; with allow_two_cycles=False a cut that would
+    leave two families giving to each other re-inserts them as well.
+
+    Args:
+        previous: Giver -> receiver from the last run
+        family_ids: Everyone taking part now
+        forbidden: Optional exclusion graph, see utils.constraints.build_exclusion_graph
+        seed_value: Seed for the choice of insertion edges
+        rng: Generator to draw from (defaults to random.Random(seed_value))
+        allow_two_cycles: False to keep reciprocal pairs (A -> B and B -> A) out of the result
+
+    Raises:
+        RepairImpossibleError: if a joiner has no allowed edge to splice into
+    """
+    rng = rng if rng is not None else make_rng(seed_value)
+    forbidden = forbidden or {}
+    participants = set(family_ids)
+
+    def allowed(giver: str, receiver: str) -> bool:
+        return giver != receiver and receiver not in forbidden.get(giver, ())
+
+    receiver_of = dict(previous)
+    giver_of = {receiver: giver for giver, receiver in receiver_of.items()}
+    left = sorted(giver for giver in previous if giver not in participants)
+    joined = sorted(fid for fid in participants if fid not in previous)
+    # Givers whose pair the exclusion graph now forbids are re-inserted like joiners
+    now_forbidden = sorted(giver for giver, receiver in previous.items()
+                           if giver in participants and receiver in participants and not allowed(giver, receiver))
+    pending = joined + now_forbidden
+    queued = set(pending)
+
+    def requeue(giver: str) -> None:
+        if giver in participants and giver not in queued:
+            queued.add(giver)
+            pending.append(giver)
+
+    # Cut leavers (and anyone a cut strands or leaves on a forbidden edge) out of their cycles
+    detach = left + now_forbidden
+    while detach:
+        member = detach.pop()
+        if member not in receiver_of:
+            continue
+        giver = giver_of.pop(member)
+        receiver = receiver_of.pop(member)
+        if giver == receiver:
+            # member was in a 2-cycle; its partner has nobody left to give to
+            del receiver_of[giver], giver_of[giver]
+            requeue(giver)
+            continue
+        receiver_of[giver] = receiver
+        giver_of[receiver] = giver
+        if not allowed(giver, receiver) or (not allow_two_cycles and receiver_of[receiver] == giver):
+            detach.append(giver)
+            requeue(giver)
+
+    if not receiver_of and pending:
+        # Nothing left to splice into: start a cycle from the first two (or three) pending families
+        seed = pending[:2 if allow_two_cycles else 3]
+        cycle = list(zip(seed, seed[1:] + seed[:1]))
+        if len(seed) < (2 if allow_two_cycles else 3) or not all(allowed(g, r) for g, r in cycle):
+            raise RepairImpossibleError(f"Can't rebuild an assignment for {sorted(participants)} incrementally")
+        receiver_of.update(cycle)
+        giver_of.update((r, g) for g, r in cycle)
+        pending = pending[len(seed):]
+
+    givers = list(receiver_of)
+    for member in pending:
+        edge_giver = None
+        for _ in range(_RANDOM_TRIES):
+            candidate = rng.choice(givers)
+            if allowed(candidate, member) and allowed(member, receiver_of[candidate]):
+                edge_giver = candidate
+                break
+        if edge_giver is None:
+            candidates = [g for g in givers if allowed(g, member) and allowed(member, receiver_of[g])]
+            if not candidates:
+                raise RepairImpossibleError(f"No allowed pair to splice family {member} into")
+            edge_giver = rng.choice(candidates)
+        receiver = receiver_of[edge_giver]
+        receiver_of[edge_giver] = member
+        giver_of[member] = edge_giver
+        receiver_of[member] = receiver
+        giver_of[receiver] = member
+        givers.append(member)
+
+    changed = sorted(giver for giver, receiver in receiver_of.items() if previous.get(giver) != receiver)
+    return RepairResult(receiver_of, changed, joined, left)
@@ -0,0 +1,64 @@
+from typing import Dict, List, NamedTuple, Set
+
+class FamilyRecord(NamedTuple):
+    """One usable row of the family sheet"""
+    family_id: str
+    email: str
+    address: str
+    exclude: bool
+
+class Roster(NamedTuple):
+    """Every index the exchange needs, built in one pass over the family sheet"""
+    records: List[FamilyRecord]
+    family_emails: Dict[str, List[str]]
+    family_addresses: Dict[str, str]
+    email_to_family: Dict[str, str]
+    family_ids: Set[str]
+
+def parse_family_rows(values: List[List[str]]) -> Roster:
+    """Parse the raw `values` of the family sheet (header row first) into a Roster
+
+    Column positions are resolved once from the header. Rows shorter than the header (the
+    Sheets API drops trailing empty cells) are skipped. The first address seen for a family
+    wins. `family_ids` holds the families that aren't marked "Exclude from Calendar".
+    """
+    headers = values[0]
+    width = len(headers)
+    col_idx = {name: idx for idx, name in enumerate(headers)}
+    id_col = col_idx['Family ID']
+    email_col = col_idx['Primary Email']
+    address_col = col_idx['Address']
+    city_col = col_idx['City State Zip']
+    exclude_col = col_idx.get('Exclude from Calendar')
+
+    records = []
+    family_emails: Dict[str, List[str]] = {}
+    family_addresses: Dict[str, str] = {}
+    email_to_family: Dict[str, str] = {}
+    family_ids: Set[str] = set()
+
+    for row in values[1:]:
+        if len(row) < width:
+            continue
+
+        family_id = row[id_col]
+        if not family_id:
+            continue
+        email = row[email_col]
+        exclude = exclude_col is not None and row[exclude_col].lower() == 'yes'
+        address = f"{row[address_col]}\n{row[city_col]}"
+        records.append(FamilyRecord(family_id, email, address, exclude))
+
+        if family_id not in family_addresses:
+            family_addresses[family_id] = address
+        if email:
+            previous = email_to_family.get(email)
+            if previous != family_id:
+                if previous is not None:
+                    family_emails[previous].remove(email)
+                email_to_family[email] = family_id
+                family_emails.setdefault(family_id, []).append(email)
+        if not exclude:
+            family_ids.add(family_id)
+
+    return Roster(records, family_emails, family_addresses, email_to_family, family_ids)
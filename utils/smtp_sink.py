@@ -0,0 +1,142 @@
+import random
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+from email.message import Message
+from typing import List, NamedTuple, Optional
+
+class ReceivedMessage(NamedTuple):
+    sender: str
+    recipients: List[str]
+    data: bytes
+
+    def parsed(self) -> Message:
+        return message_from_bytes(self.data)
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of RFC 5321 for smtplib: EHLO/HELO, AUTH, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self) -> None:
+        sink = self.server.sink
+        sender, recipients = None, []
+        self.reply("220 localhost SMTP sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.reply("250-localhost")
+                self.reply("250-AUTH PLAIN LOGIN")
+                self.reply("250 8BITMIME")
+            elif verb == 'HELO':
+                self.reply("250 localhost")
+            elif verb == 'AUTH':
+                sink.logins += 1
+                self.reply("235 Authentication successful")
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip().strip('<>'), []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                fault = sink.draw_fault()
+                if sink.latency:
+                    time.sleep(sink.latency)
+                if fault == 'drop':
+                    # Hang up mid-transaction, like a server timing out a connection
+                    return
+                data = b"".join(lines)
+                if fault == 'transient':
+                    self.reply("451 4.3.0 Injected temporary failure, try again later")
+                elif fault == 'permanent':
+                    self.reply("554 5.0.0 Injected permanent failure")
+                else:
+                    with sink.lock:
+                        sink.messages.append(ReceivedMessage(sender, recipients, data))
+                    self.reply("250 OK queued")
+                sender, recipients = None, []
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == 'NOOP':
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+class _ThreadedServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class SMTPSink:
+    """In-process SMTP server on localhost that keeps every message it receives
+
+        with SMTPSink() as sink:
+            mailer = Mailer(host=sink.host, port=sink.port, ...)
+            ...
+            sink.messages
+
+    Faults can be injected per message, at the end of DATA: a 451 reply (transient, retried by
+    Mailer), a 554 reply (permanent) or a dropped connection, each with its own probability,
+    drawn from a generator seeded with `seed`. `latency` seconds are added before each reply
+    to DATA, to stand in for a remote server's processing time.
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 transient_failure_rate: float = 0.0,
+                 permanent_failure_rate: float = 0.0,
+                 drop_rate: float = 0.0,
+                 latency: float = 0.0,
+                 seed: Optional[int] = None):
+        self.messages: List[ReceivedMessage] = []
+        self.logins = 0
+        self.lock = threading.Lock()
+        self.fault_rates = (('drop', drop_rate), ('transient', transient_failure_rate),
+                            ('permanent', permanent_failure_rate))
+        self.faults = {name: 0 for name, _ in self.fault_rates}
+        self.latency = latency
+        self._rng = random.Random(seed)
+        self._server = _ThreadedServer((host, port), _SMTPHandler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def draw_fault(self) -> Optional[str]:
+        """Name of the fault to inject for the next message, or None to accept it"""
+        with self.lock:
+            draw = self._rng.random()
+            for name, rate in self.fault_rates:
+                if draw < rate:
+                    self.faults[name] += 1
+                    return name
+                draw -= rate
+        return None
+
+    def start(self) -> "SMTPSink":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "SMTPSink":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,249 @@
+"""Sequential uniformity tests for the assignment algorithms
+
+Small n (up to FULL_DISTRIBUTION_MAX_N) is tested on the full distribution over derangements,
+because pair marginals can look uniform while whole assignments are skewed. Larger n is tested
+on the giver -> receiver marginals. Trials are drawn in doubling batches. After each batch
+("look") the algorithm is
+    - rejected if a chi-square test against uniform is significant at alpha / looks, or if it
+      ever returns an invalid assignment
+    - accepted as "within tolerance" if an upper confidence bound on its total-variation
+      distance from uniform is below `tolerance`
+so clearly biased algorithms are rejected after a few thousand trials. Acceptance only bounds
+the bias: an algorithm whose total variation is below the tolerance passes. The default of
+0.01 is tight enough to reject the shuffle-based algorithms at n = 4 (exact total variation
+around 1e-2), at the cost of "inconclusive" for uniform ones once n = 6 has 265 outcomes. Bonferroni splitting
+of alpha and delta across the planned looks keeps the overall error rates valid.
+
+    python -m utils.uniformity --n 3 4 5 50
+"""
+import math
+import random
+from typing import Callable, Dict, List, Tuple
+from utils import assignment_algorithms
+
+FULL_DISTRIBUTION_MAX_N = 6
+DEFAULT_TOLERANCE = 0.01
+
+def chi2_sf(statistic: float, dof: int) -> float:
+    """Upper tail P(X >= statistic) of a chi-square distribution with `dof` degrees of freedom"""
+    if statistic <= 0:
+        return 1.0
+    if dof > 1000:
+        # Wilson-Hilferty: (X/k)^(1/3) is close to normal for large k
+        z = ((statistic / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+        return 0.5 * math.erfc(z / math.sqrt(2))
+    return _gamma_q(dof / 2, statistic / 2)
+
+def _gamma_q(a: float, x: float) -> float:
+    """Regularized upper incomplete gamma function Q(a, x)"""
+    log_prefix = -x + a * math.log(x) - math.lgamma(a)
+    if x < a + 1:
+        # Series for P(a, x)
+        term = total = 1 / a
+        denominator = a
+        for _ in range(10_000):
+            denominator += 1
+            term *= x / denominator
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(0.0, 1 - total * math.exp(log_prefix))
+    # Continued fraction for Q(a, x) (modified Lentz)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 10_000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1.0, math.exp(log_prefix) * h)
+
+def _l1_radius(categories: int, trials: int, delta: float) -> float:
+    """With probability 1 - delta, the empirical distribution over `categories` cells is within
+    this L1 distance of the true one (Bretagnolle-Huber-Carol inequality)"""
+    return math.sqrt(2 * (categories * math.log(2) + math.log(1 / delta)) / trials)
+
+class _Sampler:
+    """Draws assignments from an algorithm as receiver-index rows"""
+    def __init__(self, algo: Callable, n: int, seed_value: int):
+        self.algo = algo
+        self.n = n
+        if hasattr(algo, 'batch'):
+            from utils.batch_sampler import make_generator
+            self.generator = make_generator(seed_value)
+        else:
+            # One generator for the whole test, instead of reseeding per trial
+            self.rng = random.Random(seed_value)
+
+    def draw(self, size: int) -> List[Tuple[int, ...]]:
+        if hasattr(self.algo, 'batch'):
+            return [tuple(row) for row in self.algo.batch(self.n, size, self.generator).tolist()]
+        indices = self.algo.indices
+        return [tuple(indices(self.n, rng=self.rng)) for _ in range(size)]
+
+class _FullDistribution:
+    """Counts of whole assignments, compared with the uniform distribution over the algorithm's
+    target assignments (derangements unless it samples a narrower set)"""
+    def __init__(self, algo: Callable, n: int):
+        self.categories = assignment_algorithms.target_count(algo, n)
+        self.counts: Dict[Tuple[int, ...], int] = {}
+
+    def add(self, rows: List[Tuple[int, ...]]) -> None:
+        for row in rows:
+            self.counts[row] = self.counts.get(row, 0) + 1
+
+    def statistics(self, trials: int) -> Tuple[float, int, float]:
+        expected = trials / self.categories
+        statistic = sum((count - expected) ** 2 for count in self.counts.values()) / expected
+        statistic += (self.categories - len(self.counts)) * expected
+        uniform = 1 / self.categories
+        total_variation = (sum(abs(count / trials - uniform) for count in self.counts.values())
+                           + (self.categories - len(self.counts)) * uniform) / 2
+        return statistic, self.categories - 1, total_variation
+
+    def tv_radius(self, trials: int, delta: float) -> float:
+        return _l1_radius(self.categories, trials, delta) / 2
+
+class _Marginals:
+    """Giver -> receiver counts, compared row by row with uniform over the other n - 1 receivers"""
+    def __init__(self, n: int):
+        import numpy as np
+        self.n = n
+        self.counts = np.zeros((n, n), dtype=np.int64)
+
+    def add(self, rows: List[Tuple[int, ...]]) -> None:
+        import numpy as np
+        from utils.batch_sampler import pairing_matrix
+        self.counts += pairing_matrix(np.asarray(rows, dtype=np.int64), self.n)
+
+    def statistics(self, trials: int) -> Tuple[float, int, float]:
+        import numpy as np
+        n = self.n
+        off_diagonal = ~np.eye(n, dtype=bool)
+        expected = trials / (n - 1)
+        observed = self.counts[off_diagonal]
+        statistic = float(((observed - expected) ** 2).sum() / expected)
+        # Worst giver's row, as a total-variation distance
+        row_tv = np.abs(np.where(off_diagonal, self.counts / trials - 1 / (n - 1), 0)).sum(axis=1) / 2
+        return statistic, n * (n - 2), float(row_tv.max())
+
+    def tv_radius(self, trials: int, delta: float) -> float:
+        # Union bound over the n rows
+        return _l1_radius(self.n - 1, trials, delta / self.n) / 2
+
+def sequential_uniformity_test(algo: Callable,
+                               n: int,
+                               alpha: float = 0.001,
+                               delta: float = 0.01,
+                               tolerance: float = DEFAULT_TOLERANCE,
+                               initial_trials: int = 1000,
+                               max_trials: int = 1_000_000,
+                               seed_value: int = 0) -> dict:
+    """Draw trials in doubling batches until the algorithm is confidently accepted or rejected
+
+    Args:
+        algo: Algorithm from utils.assignment_algorithms
+        n: Number of participants
+        alpha: Overall false-rejection rate of the chi-square tests
+        delta: Overall failure probability of the total-variation confidence bound
+        tolerance: Accept once total-variation distance from uniform is provably below this
+        initial_trials: Size of the first batch; each look doubles the total
+        max_trials: Stop with verdict "inconclusive" after this many trials
+        seed_value: Seed for the trial stream
+
+    Returns:
+        Report dict with the verdict ("within tolerance", "biased", "invalid" or
+        "inconclusive"), the tolerance, the trials used and the statistics at the final look
+    """
+    looks = max(1, math.ceil(math.log2(max_trials / initial_trials)) + 1)
+    alpha_per_look = alpha / looks
+    delta_per_look = delta / looks
+    full = n <= FULL_DISTRIBUTION_MAX_N
+    tally = _FullDistribution(algo, n) if full else _Marginals(n)
+    sampler = _Sampler(algo, n, seed_value)
+
+    trials = 0
+    look = 0
+    batch = initial_trials
+    verdict = 'inconclusive'
+    while trials < max_trials:
+        look += 1
+        batch = min(batch, max_trials - trials)
+        rows = sampler.draw(batch)
+        trials += batch
+        if not all(assignment_algorithms.in_target(algo, row) for row in rows):
+            verdict = 'invalid'
+            break
+        tally.add(rows)
+
+        statistic, dof, total_variation = tally.statistics(trials)
+        p_value = chi2_sf(statistic, dof)
+        tv_upper = total_variation + tally.tv_radius(trials, delta_per_look)
+        if p_value < alpha_per_look:
+            verdict = 'biased'
+            break
+        if tv_upper < tolerance:
+            verdict = 'within tolerance'
+            break
+        batch = trials
+
+    report = {
+        'algorithm': algo.__name__,
+        'n': n,
+        'test': 'full distribution' if full else 'pair marginals',
+        'verdict': verdict,
+        'tolerance': tolerance,
+        'trials': trials,
+        'looks': look,
+    }
+    if verdict != 'invalid':
+        report.update({
+            'chi2': statistic,
+            'dof': dof,
+            'p_value': p_value,
+            'total_variation': total_variation,
+            'tv_upper_bound': tv_upper,
+        })
+    return report
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from time import time
+    parser = argparse.ArgumentParser(description='Sequential uniformity tests for the assignment algorithms')
+    parser.add_argument('--n', type=int, nargs='+', default=[3, 4, 5], help='Participant counts (default: 3 4 5)')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Accept when total variation is provably below this (default: {DEFAULT_TOLERANCE})')
+    parser.add_argument('--max-trials', type=int, default=1_000_000, help='Trial budget per test (default: 1,000,000)')
+    parser.add_argument('--json', type=str, help='Also write the reports to this JSON file')
+    args = parser.parse_args()
+
+    reports = []
+    print(f"{'Algorithm':<38} {'n':<5} {'Verdict':<17} {'Trials':<9} {'p-value':<10} {'TV':<8} {'TV bound':<9} Time (s)")
+    print("-" * 108)
+    for n in args.n:
+        for algo in assignment_algorithms.ALGORITHMS:
+            start = time()
+            report = sequential_uniformity_test(algo, n, tolerance=args.tolerance, max_trials=args.max_trials)
+            report['seconds'] = time() - start
+            reports.append(report)
+            if report['verdict'] == 'invalid':
+                print(f"{algo.__name__:<38} {n:<5} {'invalid':<17} {report['trials']:<9}")
+                continue
+            print(f"{algo.__name__:<38} {n:<5} {report['verdict']:<17} {report['trials']:<9} "
+                  f"{report['p_value']:<10.2e} {report['total_variation']:<8.4f} {report['tv_upper_bound']:<9.4f} "
+                  f"{report['seconds']:.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)